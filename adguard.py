@@ -0,0 +1,240 @@
+# adguard.py
+"""
+AdGuard / ABP 过滤列表的流式解析：逐行分类进规范化规则模型 (RuleSet)，
+不再把所有列表的全部行读入一个集合、排序后写临时文件交给 sing-box 转换。
+同一份解析结果生成 sing-box、Clash、Surge 与 Shadowrocket 规则，各目标格式的内容一致。
+
+支持 DNS 层面可以表达的写法:
+- ||example.com^                 domain_suffix (域名及其子域名)
+- ||*.example.com^               domain_suffix .example.com (只匹配子域名)
+- |example.com^、example.com^、example.com    domain
+- 含 * 通配符的域名               domain_regex
+- /regex/                        domain_regex
+- 0.0.0.0 example.com            hosts 写法，domain
+- 1.2.3.4、1.2.3.0/24、||1.2.3.4^  ip_cidr
+- @@ 开头的例外规则               全部列表解析完后按索引剔除被例外覆盖的条目
+- $important                     不受普通例外影响，只有 @@...$important 的例外可以剔除
+元素隐藏规则、带路径的 URL 规则以及带有其他修饰符 ($third-party、$dnstype、$client 等) 的规则只作用于部分请求，
+无法在规则集中表达，跳过并按原因计数。
+"""
+
+import io
+import logging
+import re
+from collections import Counter
+
+from config import Config
+from fetcher import fetcher
+from profiler import profiler
+from ruleset import RuleSet, SuffixIndex
+from utils import parse_cidr, subtract_cidrs
+
+config = Config()
+
+DOMAIN_PATTERN = re.compile(r'[a-z0-9_-]+(?:\.[a-z0-9_-]+)*')
+COSMETIC_PATTERN = re.compile(r'#@?[$%?]?#')
+IP_CHARS = frozenset('0123456789./')
+# 对规则集没有影响的修饰符
+ACCEPTED_MODIFIERS = {'important', 'all'}
+# hosts 文件中指向本机的条目
+HOSTS_IGNORED = {'localhost', 'localhost.localdomain', 'local', 'broadcasthost', 'ip6-localhost', 'ip6-loopback',
+                 'ip6-localnet', 'ip6-mcastprefix', 'ip6-allnodes', 'ip6-allrouters', 'ip6-allhosts', '0.0.0.0'}
+
+
+def wildcard_regex(body, suffix):
+    """ 含 * 的域名转换为 domain_regex，|| 开头的规则同时匹配子域名 """
+    pattern = '.*'.join(re.escape(part) for part in body.split('*'))
+    return ('(^|\\.)' if suffix else '^') + pattern + '$'
+
+
+def is_ip(body):
+    return ':' in body or (body[:1].isdigit() and IP_CHARS.issuperset(body))
+
+
+class AdGuardRules:
+    """
+    过滤列表的解析结果：拦截规则、$important 拦截规则与两种例外规则各存放在一个 RuleSet 中，
+    skipped 为跳过的行数 (按原因)。多个列表的结果用 update 合并，resolve 应用例外后得到最终规则集。
+    """
+    __slots__ = ('blocked', 'important', 'allowed', 'important_allowed', 'lines', 'skipped')
+
+    def __init__(self):
+        self.blocked = RuleSet()
+        self.important = RuleSet()
+        self.allowed = RuleSet()
+        self.important_allowed = RuleSet()
+        self.lines = 0
+        self.skipped = Counter()
+
+    def parse(self, lines):
+        """ 逐行解析，lines 可以是任意行迭代器 (例如文件对象)，不需要整体读入 """
+        for line in lines:
+            line = line.strip()
+            if line:
+                self.lines += 1
+                self.add_line(line)
+        return self
+
+    def add_line(self, line):
+        if line[0] in '!#[':  # 注释、元素隐藏规则与 [Adblock Plus 2.0] 头部
+            return
+        exception = line.startswith('@@')
+        if exception:
+            line = line[2:]
+
+        # /regex/ 与 /regex/$修饰符
+        if line.startswith('/') and len(line) > 2:
+            if line.endswith('/'):
+                body, modifiers = line[1:-1], ''
+            else:
+                pos = line.rfind('/$')
+                if pos <= 0:
+                    self.skipped['path'] += 1
+                    return
+                body, modifiers = line[1:pos], line[pos + 2:]
+            important = self.modifiers(modifiers)
+            if important is not None:
+                self.target(exception, important).domain_regex.add(body)
+            return
+
+        if COSMETIC_PATTERN.search(line):
+            self.skipped['cosmetic'] += 1
+            return
+        body, dollar, modifiers = line.rpartition('$')
+        if not dollar:
+            body = modifiers
+            modifiers = ''
+        important = self.modifiers(modifiers)
+        if important is None:
+            return
+
+        # hosts 写法: IP 域名 [域名 ...] [# 注释]
+        if ' ' in body or '\t' in body:
+            parts = body.split('#', 1)[0].split()
+            if exception or len(parts) < 2 or not is_ip(parts[0]) or parse_cidr(parts[0]) is None:
+                self.skipped['invalid'] += 1
+                return
+            for host in parts[1:]:
+                host = host.lower()
+                if host not in HOSTS_IGNORED and DOMAIN_PATTERN.fullmatch(host):
+                    self.target(exception, important).domain.add(host)
+            return
+
+        if body.startswith('||'):
+            suffix, body = True, body[2:]
+        else:
+            suffix, body = False, body[1:] if body.startswith('|') else body
+        body = body.rstrip('^|').lower()
+        if not body:
+            self.skipped['invalid'] += 1
+            return
+        if is_ip(body):
+            if parse_cidr(body) is None:  # 192.168. 这类地址前缀无法表达
+                self.skipped['invalid'] += 1
+            else:
+                self.target(exception, important).ip_cidr.add(body)
+            return
+        if '/' in body or ':' in body:
+            self.skipped['path'] += 1
+            return
+
+        rule_set = self.target(exception, important)
+        if body.startswith('*.') and DOMAIN_PATTERN.fullmatch(body[2:]):
+            rule_set.domain_suffix.add('.' + body[2:])
+        elif '*' in body:
+            # 只有通配符的规则会匹配全部域名，不接受
+            if body.strip('*.') and DOMAIN_PATTERN.fullmatch(body.replace('*', 'x')):
+                rule_set.domain_regex.add(wildcard_regex(body, suffix))
+            else:
+                self.skipped['invalid'] += 1
+        elif DOMAIN_PATTERN.fullmatch(body):
+            (rule_set.domain_suffix if suffix else rule_set.domain).add(body)
+        else:
+            self.skipped['invalid'] += 1
+
+    def modifiers(self, modifiers):
+        """ 返回是否带有 $important；带有无法表达的修饰符时计数并返回 None """
+        important = False
+        for modifier in modifiers.split(',') if modifiers else ():
+            modifier = modifier.strip().lower()
+            if modifier not in ACCEPTED_MODIFIERS:
+                self.skipped['modifier'] += 1
+                return None
+            important = important or modifier == 'important'
+        return important
+
+    def target(self, exception, important):
+        if exception:
+            return self.important_allowed if important else self.allowed
+        return self.important if important else self.blocked
+
+    def update(self, other):
+        """ 合并另一份解析结果；other 可能是共享的上游解析结果，只读取不修改 """
+        for name in ('blocked', 'important', 'allowed', 'important_allowed'):
+            getattr(self, name).update(getattr(other, name))
+        self.lines += other.lines
+        self.skipped.update(other.skipped)
+        return self
+
+    def resolve(self):
+        """
+        应用例外规则，返回 (最终规则集, 统计)，拦截规则原地修改，不再额外复制。
+        普通例外只作用于普通拦截规则，$important 例外作用于全部拦截规则。
+        例外只能整条剔除被它完全覆盖的条目；比拦截规则更窄的例外 (||a.com^ 与 @@||b.a.com^) 无法在规则集中表达，只计数。
+        """
+        rule_set = self.blocked
+        allowed = self.allowed | self.important_allowed
+        removed = apply_exceptions(rule_set, allowed)
+        removed.update(apply_exceptions(self.important, self.important_allowed))
+        rule_set.update(self.important)
+
+        blocked_index = SuffixIndex(rule_set.domain_suffix)
+        narrower = sum(1 for category in ('domain', 'domain_suffix') for value in getattr(allowed, category)
+                       if blocked_index.covers(value.lstrip('.')))
+        stats = {
+            "lines": self.lines,
+            "exceptions": len(allowed),
+            "removed_by_exceptions": dict(removed),
+            "unexpressed_exceptions": narrower,
+            "skipped": dict(self.skipped),
+        }
+        return rule_set, stats
+
+
+def apply_exceptions(rule_set, allowed):
+    """
+    原地剔除 rule_set 中被 allowed 完全覆盖的条目，返回各类别剔除数量。
+    域名逐条按标签边界查询例外后缀索引，不做两两比较；ip_cidr 按地址区间剔除。
+    """
+    index = SuffixIndex(allowed.domain_suffix)
+
+    def exempt_domain(domain):
+        return domain in allowed.domain or index.implies(domain)
+
+    def exempt_suffix(suffix):
+        return index.implies(suffix.lstrip('.'), subdomains_only=suffix.startswith('.'))
+
+    removed = Counter()
+    for category, exempt in (("domain", exempt_domain), ("domain_suffix", exempt_suffix)):
+        values = getattr(rule_set, category)
+        covered = [value for value in values if exempt(value)] if len(index) or allowed.domain else []
+        values.difference_update(covered)
+        removed[category] = len(covered)
+    removed["domain_regex"] = len(rule_set.domain_regex & allowed.domain_regex)
+    rule_set.domain_regex -= allowed.domain_regex
+    if rule_set.ip_cidr and allowed.ip_cidr:
+        size = len(rule_set.ip_cidr)
+        rule_set.ip_cidr = set(subtract_cidrs(rule_set.ip_cidr, allowed.ip_cidr))
+        removed["ip_cidr"] = max(size - len(rule_set.ip_cidr), 0)
+    return removed
+
+
+def parse_adguard_link(link):
+    """ 流式解码并解析单个过滤列表，返回 AdGuardRules """
+    content = fetcher.get(link)
+    lines = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', errors='replace')
+    rules = AdGuardRules().parse(lines)
+    profiler.count('adguard_lines', rules.lines)
+    profiler.count('adguard_skipped', sum(rules.skipped.values()))
+    logging.debug(f"{link}: 解析 {rules.lines} 行, 跳过 {dict(rules.skipped)}")
+    return rules
@@ -0,0 +1,714 @@
+# benchmark.py
+"""
+构建核心的性能基准测试，全部离线运行。
+
+用法: python benchmark.py [基准名 ...]，不带参数时运行全部基准。
+core、formats、query 与 publish 基准使用 synthetic 生成的确定性数据，结果与 benchmark_baseline.json 对照，
+耗时或峰值内存超出容差时列为回归并以非零状态退出；--save-baseline 用本次结果更新基准线。
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+import mrs
+import publish
+import srs
+import synthetic
+import utils
+from adguard import parse_adguard_link
+from config import Config
+from fetcher import fetcher
+from keywords import KeywordAutomaton
+from ruleset import RuleSet
+from utils import (RegexFilter, SuffixIndex, aggregate_cidrs, clash_payload, deduplicate_json, dumps_rule_set,
+                   filter_domains_with_trie, load_json, mrs_behavior, parse_rule_text, render_clash_rules,
+                   render_surge_rules, subtract_rules)
+
+config = Config()
+# 基准只读取 fetcher.store 中注入的内容，不访问网络
+fetcher.offline = True
+
+BENCHMARKS = {}
+# 参与基准线对照的结果: {键: {"time": 秒, "memory": 字节}}
+RESULTS = {}
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# 对照基准线时忽略的绝对波动：耗时 5ms，内存 64KB
+TIME_NOISE = 0.005
+MEMORY_NOISE = 64 * 1024
+# core / formats / query 基准的规模，由命令行参数 --scales 设置
+scales = ['1k', '100k']
+
+
+def benchmark(name):
+    """注册基准函数"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def measure(func, *args, **kwargs):
+    """
+    执行 func 两次：第一次计时，第二次在 tracemalloc 下统计峰值内存。
+    返回 (结果, 耗时秒, 峰值内存字节)。
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def record(key, func, *args, repeat=1):
+    """
+    测量 func 并把结果记入 RESULTS：耗时取 repeat 次中的最小值，峰值内存由 tracemalloc 统计。
+    返回 (结果, 耗时秒, 峰值内存字节)。
+    """
+    result, elapsed, peak = measure(func, *args)
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    RESULTS[key] = {"time": elapsed, "memory": peak}
+    return result, elapsed, peak
+
+
+def print_table(title, header, rows):
+    print(f"\n== {title} ==")
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
+
+
+def load_rule_sets(category, limit=3):
+    """
+    读取 rule/singbox 下已生成的 JSON 规则集，按 category 条目数从大到小返回前 limit 个。
+    返回 [(规则集名, {category: set})]。
+    """
+    rule_sets = []
+    for path in glob.glob(os.path.join(config.singbox_output_directory, '*.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        merged = {}
+        for rule in data.get("rules", []):
+            for key, values in rule.items():
+                if isinstance(values, list):
+                    merged.setdefault(key, set()).update(values)
+        if merged.get(category):
+            rule_sets.append((os.path.basename(path)[:-len('.json')], merged))
+    rule_sets.sort(key=lambda item: len(item[1][category]), reverse=True)
+    return rule_sets[:limit]
+
+
+def synthetic_domains(count, seed=0):
+    """ 生成 count 个确定性的随机域名 """
+    rng = random.Random(seed)
+    tlds = ['com', 'net', 'org', 'cn', 'io', 'jp']
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    domains = set()
+    while len(domains) < count:
+        label = ''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 12)))
+        domains.add(f"{label}.{rng.choice(tlds)}")
+    return sorted(domains)
+
+
+class LegacyTrieNode:
+    def __init__(self):
+        self.children = {}
+        self.is_end = False
+
+
+class LegacyTrie:
+    """ 旧版逐字符 Trie，仅作为基准对照 """
+
+    def __init__(self):
+        self.root = LegacyTrieNode()
+
+    def insert(self, suffix):
+        suffix = suffix.lstrip('.')
+        node = self.root
+        for char in reversed(suffix):
+            if char not in node.children:
+                node.children[char] = LegacyTrieNode()
+            node = node.children[char]
+        node.is_end = True
+
+    def has_suffix(self, domain):
+        node = self.root
+        domain = '.' + domain
+        for i in range(len(domain)):
+            char = domain[-(i + 1)]
+            if node.is_end and i != 0:
+                if i == len(domain) - 1:
+                    return True
+                elif domain[-(i + 1)] == '.':
+                    return True
+                else:
+                    return False
+            if char not in node.children:
+                return False
+            node = node.children[char]
+        return node.is_end
+
+
+def build_legacy_trie(suffixes):
+    trie = LegacyTrie()
+    for suffix in suffixes:
+        trie.insert(suffix)
+    return trie
+
+
+def query_legacy_trie(trie, domains, clean_suffixes):
+    return {domain for domain in domains if domain in clean_suffixes or not trie.has_suffix(domain)}
+
+
+def query_suffix_index(index, domains):
+    return {domain for domain in domains if domain in index or not index.has_parent(domain)}
+
+
+@benchmark('suffix-index')
+def bench_suffix_index():
+    """ 对比旧版 Trie 与 SuffixIndex 在最大的几个规则集上的构建/查询耗时与内存 """
+    rows = []
+    for name, rule_set in load_rule_sets('domain_suffix'):
+        suffixes = rule_set['domain_suffix']
+        # 查询集合：已有 domain + 每个后缀的子域名 (应被剔除) + 非标签边界的相似域名 (应保留)
+        domains = set(rule_set.get('domain', ()))
+        for suffix in suffixes:
+            domains.add('www.' + suffix.lstrip('.'))
+            domains.add('x' + suffix.lstrip('.'))
+        clean_suffixes = {suffix.lstrip('.') for suffix in suffixes}
+
+        trie, trie_build, trie_memory = measure(build_legacy_trie, suffixes)
+        trie_result, trie_query, _ = measure(query_legacy_trie, trie, domains, clean_suffixes)
+        index, index_build, index_memory = measure(SuffixIndex, suffixes)
+        index_result, index_query, _ = measure(query_suffix_index, index, domains)
+
+        rows.append([
+            name, len(suffixes), len(domains),
+            f"{trie_build * 1000:.0f}", f"{index_build * 1000:.0f}",
+            f"{trie_query * 1000:.0f}", f"{index_query * 1000:.0f}",
+            f"{trie_memory / 1024 / 1024:.1f}", f"{index_memory / 1024 / 1024:.1f}",
+            len(trie_result ^ index_result)
+        ])
+
+    print_table(
+        "domain_suffix 索引: 旧版 Trie vs SuffixIndex",
+        ["规则集", "后缀数", "查询数", "Trie构建ms", "索引构建ms", "Trie查询ms", "索引查询ms",
+         "Trie内存MB", "索引内存MB", "结果差异"],
+        rows
+    )
+
+
+def legacy_subtract(items, saved_data):
+    """ 旧版 subtract_rules 的列表成员判断，仅作为基准对照 """
+    for key in saved_data.keys():
+        if saved_data[key]:
+            for item in items:
+                if key in item:
+                    item[key] = [val for val in item[key] if val not in saved_data[key]]
+    return items
+
+
+@benchmark('subtract')
+def bench_subtract():
+    """ subtract_rules 在 10k / 100k / 1M 条目规模下的耗时 (旧版列表实现只在 10k 规模对照) """
+    rows = []
+    for size in (10_000, 100_000, 1_000_000):
+        suffixes = synthetic_domains(size // 2, seed=size)
+        general = [
+            {"domain": [f"www.{suffix}" for suffix in suffixes[::2]] + synthetic_domains(size // 2, seed=size + 1)},
+            {"domain_suffix": suffixes}
+        ]
+        cn = [{"domain_suffix": suffixes[::4]}, {"domain": general[0]["domain"][::3]}]
+
+        result, elapsed, _ = measure(subtract_rules, general, cn)
+        remaining = sum(len(values) for item in result for values in item.values())
+
+        legacy_elapsed = "-"
+        if size <= 10_000:
+            saved = {"domain": list(cn[1]["domain"]), "domain_suffix": list(cn[0]["domain_suffix"])}
+            items = [{key: list(values) for key, values in item.items()} for item in general]
+            _, legacy_time, _ = measure(legacy_subtract, items, saved)
+            legacy_elapsed = f"{legacy_time * 1000:.0f}"
+
+        rows.append([size, len(cn[0]["domain_suffix"]) + len(cn[1]["domain"]), remaining,
+                     legacy_elapsed, f"{elapsed * 1000:.0f}"])
+
+    print_table(
+        "subtract_rules 规模测试",
+        ["全体条目", "剔除条目", "剩余条目", "旧版剔除ms", "subtract_rules ms"],
+        rows
+    )
+
+
+def synthetic_rule_texts(count, seed=0):
+    """ 生成 count 行的 Surge 经典规则列表与 Clash payload YAML，返回 {链接: 内容} """
+    rng = random.Random(seed)
+    domains = synthetic_domains(count, seed)
+    list_lines, payload_lines = [], ['payload:']
+    for domain in domains:
+        kind = rng.random()
+        if kind < 0.1:
+            ip = f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.0/24"
+            list_lines.append(f"IP-CIDR,{ip},no-resolve")
+            payload_lines.append(f"  - '{ip}'")
+        elif kind < 0.5:
+            list_lines.append(f"DOMAIN-SUFFIX,{domain}")
+            payload_lines.append(f"  - '+.{domain}'")
+        else:
+            list_lines.append(f"DOMAIN,{domain}")
+            payload_lines.append(f"  - '{domain}'")
+    return {
+        f"benchmark://rules-{count}.list": '\n'.join(list_lines).encode('utf-8'),
+        f"benchmark://rules-{count}.yaml": '\n'.join(payload_lines).encode('utf-8')
+    }
+
+
+@benchmark('parse')
+def bench_parse():
+    """ 经典规则列表与 payload YAML 的逐行解析吞吐量 """
+    rows = []
+    for size in (100_000, 1_000_000):
+        for link, content in synthetic_rule_texts(size, seed=size).items():
+            fetcher.store[link] = content
+            (buckets, _), elapsed, peak = measure(parse_rule_text, link)
+            del fetcher.store[link]
+            rows.append([link.rsplit('.', 1)[1], size, sum(len(values) for values in buckets.values()),
+                         f"{elapsed * 1000:.0f}", f"{size / elapsed:.0f}", f"{peak / 1024 / 1024:.1f}"])
+
+    print_table(
+        "规则文本解析吞吐量",
+        ["格式", "行数", "规则数", "耗时ms", "行/秒", "峰值内存MB"],
+        rows
+    )
+
+
+@benchmark('merge')
+def bench_merge():
+    """ merge_json 与外部归并 merge_json_external 的耗时与峰值内存 (外部归并的内存上限为 16 MB) """
+    import main
+
+    # 每个模块各自持有 Config 实例，内存上限需要设置在 main 的实例上
+    main.config.merge_memory_limit = 16 * 1024 * 1024
+    parser = main.RuleParser()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in (200_000, 1_000_000):
+            domains = synthetic_domains(size, seed=size)
+            # 4 个上游，每个包含一半的条目，彼此大量重叠
+            upstreams = [
+                {"version": 1, "rules": [
+                    {"domain": domains[i::2][:size // 4] + domains[i::3]},
+                    {"domain_suffix": domains[i::50]}
+                ]}
+                for i in range(4)
+            ]
+            output_file = os.path.join(tmp_dir, f"merge-{size}.json")
+            for label, merge in (("内存", parser.merge_json), ("外部归并", parser.merge_json_external)):
+                stats, elapsed, peak = measure(merge, upstreams, output_file, rule_set_name=f"merge-{size}")
+                rows.append([size, label, stats["total_rules"], f"{elapsed * 1000:.0f}", f"{peak / 1024 / 1024:.1f}"])
+            parser.rule_sets.clear()
+
+    print_table(
+        "规则集合并 (4 个上游)",
+        ["条目数", "模式", "合并后条目", "耗时ms", "峰值内存MB"],
+        rows
+    )
+
+
+@benchmark('build')
+def bench_build():
+    """ 并行构建调度器在合并阶段的扩展性：8 个规则集，每个合并 3 个 10 万行的上游 """
+    import main
+    from scheduler import BuildScheduler
+
+    links = []
+    for i in range(24):
+        for link, content in synthetic_rule_texts(100_000, seed=i).items():
+            if link.endswith('.list'):
+                link = link.replace('.list', f'-{i}.list')
+                fetcher.store[link] = content
+                links.append(link)
+
+    rows = []
+    baseline = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for jobs in sorted({1, 2, 4, os.cpu_count() or 1}):
+            build = BuildScheduler(max_workers=jobs)
+            for i in range(8):
+                output_file = os.path.join(tmp_dir, f"geosite-build-{i}.json")
+                build.add(f"build:{i}", main.build_rule_set_task, (links[i * 3:i * 3 + 3], output_file, f"build-{i}", 'geosite'))
+            failed = build.run()
+            baseline = baseline or build.elapsed
+            rows.append([jobs, f"{build.elapsed * 1000:.0f}", f"{baseline / build.elapsed:.2f}", len(failed)])
+    for link in links:
+        del fetcher.store[link]
+
+    print_table(
+        f"并行构建 (CPU 核数 {os.cpu_count()})",
+        ["进程数", "墙钟ms", "加速比", "失败任务"],
+        rows
+    )
+
+
+@benchmark('json')
+def bench_json():
+    """ 各 JSON 输出格式对 rule/singbox 全部规则集的写出耗时、读回耗时与总体积 """
+    rule_sets = []
+    for path in sorted(glob.glob(os.path.join(config.singbox_output_directory, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            rule_sets.append(json.load(f))
+    backends = ['json'] + (['auto'] if utils.orjson is not None else [])
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for profile in ('pretty', 'compact', 'lines'):
+            for backend in backends:
+                utils.config.json_backend = backend
+                paths = [os.path.join(tmp_dir, f"{i}.json") for i in range(len(rule_sets))]
+
+                start = time.perf_counter()
+                for rule_set, path in zip(rule_sets, paths):
+                    utils.write_text(path, utils.dumps_rule_set(rule_set, profile))
+                write_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for path in paths:
+                    utils.load_json(path)
+                read_time = time.perf_counter() - start
+
+                size = sum(os.path.getsize(path) for path in paths)
+                rows.append([profile, 'orjson' if backend == 'auto' else 'json',
+                             f"{write_time * 1000:.0f}", f"{read_time * 1000:.0f}", f"{size / 1024 / 1024:.2f}"])
+    utils.config.json_backend = config.json_backend
+
+    print_table(
+        f"JSON 输出格式 ({len(rule_sets)} 个规则集)",
+        ["格式", "后端", "写出ms", "读回ms", "总体积MB"],
+        rows
+    )
+
+
+@benchmark('srs')
+def bench_srs():
+    """ 内置 SRS 编解码器对照 rule/singbox 中由 sing-box 编译的 .srs：比较解压后的数据并统计耗时 """
+    rows = []
+    for path in sorted(glob.glob(os.path.join(config.singbox_output_directory, '*.json'))):
+        srs_path = path[:-len('.json')] + '.srs'
+        if not os.path.exists(srs_path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            rule_set = json.load(f)
+        with open(srs_path, 'rb') as f:
+            data = f.read()
+
+        payload, encode_time, _ = measure(srs.encode_rules, rule_set["rules"], rule_set["version"])
+        decoded, decode_time, _ = measure(srs.read_rule_set, data)
+        expected = zlib.decompress(data[4:])
+        rows.append([
+            os.path.basename(srs_path), len(expected),
+            f"{encode_time * 1000:.0f}", f"{decode_time * 1000:.0f}",
+            "一致" if payload == expected else "不一致",
+            "一致" if srs.encode_rules(decoded["rules"], decoded["version"]) == expected else "不一致"
+        ])
+
+    print_table(
+        "SRS 编解码 (对照 sing-box 编译结果)",
+        ["规则集", "数据字节", "编码ms", "解码ms", "编码结果", "解码再编码"],
+        rows
+    )
+
+
+@benchmark('mrs')
+def bench_mrs():
+    """ 内置 MRS 编码器对照 rule/clash 中由 mihomo 转换的 .mrs：比较 zstd 解压后的数据并统计耗时 """
+    if not mrs.available():
+        print("未安装 zstandard，跳过 MRS 基准")
+        return
+    import zstandard
+
+    rows = []
+    for path in sorted(glob.glob(os.path.join(config.singbox_output_directory, '*.json'))):
+        name = os.path.basename(path)[:-len('.json')]
+        behavior = mrs_behavior(name)
+        mrs_path = os.path.join(config.clash_output_directory, f"{name}.mrs")
+        if behavior is None or not os.path.exists(mrs_path):
+            continue
+        items = [value for value, _ in clash_payload(load_json(path)["rules"])]
+        with open(mrs_path, 'rb') as f:
+            data = f.read()
+
+        payload, encode_time, _ = measure(mrs.encode_payload, behavior, items)
+        expected = zstandard.ZstdDecompressor().stream_reader(data).read() if data else b''
+        rows.append([
+            f"{name}.mrs", len(items), len(expected), f"{encode_time * 1000:.0f}",
+            "一致" if (payload or b'') == expected else "不一致"
+        ])
+
+    print_table(
+        "MRS 编码 (对照 mihomo 转换结果)",
+        ["规则集", "条目数", "数据字节", "编码ms", "编码结果"],
+        rows
+    )
+
+
+def scale_repeat(scale):
+    """ 小规模的耗时波动大，多测几次取最小值 """
+    return {'1k': 5, '100k': 3}.get(scale, 1)
+
+
+@benchmark('core')
+def bench_core():
+    """ 合成规则集上逐个测量构建热点函数的耗时与峰值内存 """
+    rows = []
+    for scale in scales:
+        count = synthetic.SCALES[scale]
+        rules = synthetic.rule_set(count, seed=count)
+        values = {category: rule_values for rule in rules for category, rule_values in rule.items()}
+        # 另一个上游：一半条目重叠，并带有较粗的后缀；cn 规则集覆盖其中四分之一
+        other = synthetic.rule_set(count, seed=count + 1)
+        other = [{category: rule_values[::2] + values[category][::2]} for rule in other
+                 for category, rule_values in rule.items()]
+        cn = [{category: rule_values[::4]} for rule in rules for category, rule_values in rule.items()]
+        first, second = RuleSet(rules), RuleSet(other)
+        deduplicated = deduplicate_json(rules + other)
+        domain_items = [value for value, _ in clash_payload([{"domain": values["domain"]},
+                                                             {"domain_suffix": values["domain_suffix"]}])]
+        keywords = synthetic.domain_keywords(min(max(count // 1000, 5), 200), random.Random(count))
+        repeat = scale_repeat(scale)
+
+        cases = [
+            ("RuleSet", RuleSet, rules + other),
+            ("RuleSet.union", RuleSet.__or__, first, second),
+            ("deduplicate_json", deduplicate_json, rules + other),
+            ("subtract_rules", subtract_rules, rules + other, cn),
+            ("SuffixIndex", SuffixIndex, values["domain_suffix"]),
+            ("filter_domains_with_trie", filter_domains_with_trie, values["domain"], values["domain_suffix"]),
+            ("aggregate_cidrs", aggregate_cidrs, values["ip_cidr"]),
+            ("KeywordAutomaton.covered", KeywordAutomaton(keywords).covered, values["domain"]),
+            ("RegexFilter.filter", RegexFilter(values["domain_regex"]).filter, values["domain"], 'search'),
+            ("render_surge_rules", render_surge_rules, deduplicated),
+            ("render_clash_rules", render_clash_rules, deduplicated),
+            ("clash_payload", clash_payload, deduplicated),
+            ("dumps_rule_set", dumps_rule_set, {"version": 1, "rules": deduplicated}),
+            ("srs.encode_rules", srs.encode_rules, deduplicated),
+            ("mrs.encode_payload(domain)", mrs.encode_payload, 'domain', domain_items),
+            ("mrs.encode_payload(ipcidr)", mrs.encode_payload, 'ipcidr', values["ip_cidr"]),
+        ]
+        for name, func, *args in cases:
+            if name.startswith('mrs.') and not mrs.available():
+                continue
+            _, elapsed, peak = record(f"core/{scale}/{name}", func, *args, repeat=repeat)
+            rows.append([scale, name, f"{elapsed * 1000:.1f}", f"{peak / 1024 / 1024:.1f}"])
+
+    print_table("构建热点函数 (合成规则集)", ["规模", "函数", "耗时ms", "峰值内存MB"], rows)
+
+
+@benchmark('publish')
+def bench_publish():
+    """ publish：各目标格式的文本产物生成 .gz 与 .zst 预压缩副本的耗时、峰值内存与压缩率 """
+    encoders = publish.encoders()
+    rows = []
+    for scale in scales:
+        count = synthetic.SCALES[scale]
+        rules = deduplicate_json(synthetic.rule_set(count, seed=count))
+        artifacts = {
+            "json": dumps_rule_set({"version": 1, "rules": rules}).encode('utf-8'),
+            "list": render_surge_rules(rules).encode('utf-8'),
+            "yaml": render_clash_rules(rules).encode('utf-8'),
+        }
+        for ext, data in artifacts.items():
+            for encoding, compress in encoders.items():
+                compressed, elapsed, peak = record(f"publish/{scale}/{ext}.{encoding}", compress, data,
+                                                   repeat=scale_repeat(scale))
+                rows.append([scale, f"{ext}.{encoding}", f"{len(data) / 1024:.0f}", f"{len(compressed) / 1024:.0f}",
+                             f"{len(compressed) / len(data):.1%}", f"{elapsed * 1000:.1f}", f"{peak / 1024 / 1024:.1f}"])
+
+    print_table("产物预压缩 (合成规则集)", ["规模", "产物", "原始KB", "压缩后KB", "压缩率", "耗时ms", "峰值内存MB"], rows)
+
+
+def lookup_all(matcher, queries):
+    """ 清空查询缓存后逐条查询，测量的是索引本身的吞吐 """
+    matcher.cache.clear()
+    return matcher.lookup_many(queries)
+
+
+@benchmark('query')
+def bench_query():
+    """ query.RouteMatcher：三个合成规则集组成的路由上，索引构建耗时与域名、IP 的查询吞吐 """
+    from query import RouteMatcher
+
+    rows = []
+    for scale in scales:
+        count = synthetic.SCALES[scale]
+        rule_sets = {f"rule-set-{i}": RuleSet(synthetic.rule_set(count // 3, seed=count + i)) for i in range(3)}
+        route = {
+            "rules": [{"rule_set": [tag], "action": "route", "outbound": f"outbound-{i}"}
+                      for i, tag in enumerate(rule_sets)],
+            "final": "final"
+        }
+        rng = random.Random(count)
+        # 一半查询来自规则集 (命中)，一半为新生成的域名与地址 (多数未命中)
+        domains = [rng.choice(synthetic.SUBDOMAIN_PREFIXES) + '.' + suffix
+                   for rule_set in rule_sets.values() for suffix in list(rule_set.domain_suffix)[:count // 6]]
+        domains += synthetic.domains(len(domains), rng, synthetic.registrable_domains(max(count // 10, 10), rng))
+        addresses = [cidr.split('/')[0] for rule_set in rule_sets.values() for cidr in rule_set.ip_cidr]
+        addresses += [f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+                      for _ in range(len(addresses))]
+
+        matcher, elapsed, peak = record(f"query/{scale}/build", RouteMatcher, route, rule_sets)
+        rows.append([scale, "build", len(rule_sets), f"{elapsed * 1000:.1f}", "-", f"{peak / 1024 / 1024:.1f}"])
+        for name, queries in (("domain", domains), ("ip", addresses)):
+            _, elapsed, peak = record(f"query/{scale}/lookup({name})", lookup_all, matcher, queries,
+                                      repeat=scale_repeat(scale))
+            rows.append([scale, f"lookup({name})", len(queries), f"{elapsed * 1000:.1f}",
+                         f"{len(queries) / elapsed:,.0f}", f"{peak / 1024 / 1024:.1f}"])
+
+    print_table("规则集查询 (合成规则集)", ["规模", "操作", "条目/查询数", "耗时ms", "次/秒", "峰值内存MB"], rows)
+
+
+def parse_adguard(link):
+    """ AdGuard 列表解析并应用例外，返回与 parse_link_file_to_json 相同形式的结果 """
+    rule_set, _ = parse_adguard_link(link).resolve()
+    return {"rules": rule_set.to_rules()}
+
+
+@benchmark('formats')
+def bench_formats():
+    """ 解析器接受的每种输入格式：由 parse_link_file_to_json (AdGuard 列表由 parse_adguard_link) 解析合成夹具的耗时与峰值内存 """
+    import main
+
+    parser = main.RuleParser()
+    rows = []
+    for scale in scales:
+        count = synthetic.SCALES[scale]
+        for filename, content in synthetic.fixtures(synthetic.rule_set(count, seed=count), f"bench-{scale}").items():
+            parse = parser.parse_link_file_to_json
+            if any(keyword in filename for keyword in config.adg_keyword):
+                parse = parse_adguard
+            link = f"benchmark://{filename}"
+            fetcher.store[link] = content
+            result, elapsed, peak = record(f"formats/{filename}", parse, link, repeat=scale_repeat(scale))
+            del fetcher.store[link]
+            parsed = sum(len(values) for rule in (result or {}).get("rules", [])
+                         for values in rule.values() if isinstance(values, list))
+            rows.append([scale, filename, f"{len(content) / 1024:.0f}", parsed,
+                         f"{elapsed * 1000:.1f}", f"{peak / 1024 / 1024:.1f}"])
+
+    print_table("输入格式解析 (合成夹具)", ["规模", "文件", "大小KB", "解析条目", "耗时ms", "峰值内存MB"], rows)
+
+
+def write_fixtures(directory):
+    """ 把各规模的合成夹具写入 directory，便于手工检查或交给 sing-box / mihomo 对照 """
+    os.makedirs(directory, exist_ok=True)
+    for scale in scales:
+        count = synthetic.SCALES[scale]
+        for filename, content in synthetic.fixtures(synthetic.rule_set(count, seed=count), f"bench-{scale}").items():
+            with open(os.path.join(directory, filename), 'wb') as f:
+                f.write(content)
+    print(f"合成夹具已写入 {directory}")
+
+
+def compare_baseline(path, time_tolerance, memory_tolerance):
+    """ 对照基准线，返回回归的条目数；基准线中没有的条目只列出不判定 """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"\n基准线 {path} 不存在，跳过对照 (使用 --save-baseline 生成)")
+        return 0
+    meta = baseline.get("meta", {})
+    print(f"\n基准线: {path} (Python {meta.get('python')}, {meta.get('machine')}, CPU 核数 {meta.get('cpu_count')})")
+
+    rows = []
+    regressions = 0
+    for key, current in RESULTS.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            rows.append([key, "-", f"{current['time'] * 1000:.1f}", "-", "-", f"{current['memory'] / 1024 / 1024:.1f}", "新增"])
+            continue
+        slow = current["time"] > base["time"] * time_tolerance and current["time"] - base["time"] > TIME_NOISE
+        heavy = (current["memory"] > base["memory"] * memory_tolerance
+                 and current["memory"] - base["memory"] > MEMORY_NOISE)
+        status = "/".join(label for label, flag in (("耗时回归", slow), ("内存回归", heavy)) if flag) or "正常"
+        regressions += slow or heavy
+        rows.append([
+            key, f"{base['time'] * 1000:.1f}", f"{current['time'] * 1000:.1f}",
+            f"{current['time'] / base['time']:.2f}" if base["time"] else "-",
+            f"{base['memory'] / 1024 / 1024:.1f}", f"{current['memory'] / 1024 / 1024:.1f}", status
+        ])
+    print_table(
+        f"基准线对照 (耗时容差 {time_tolerance}x, 内存容差 {memory_tolerance}x)",
+        ["条目", "基准ms", "本次ms", "比值", "基准MB", "本次MB", "结果"],
+        rows
+    )
+    return regressions
+
+
+def save_baseline(path):
+    """ 把本次结果合并写入基准线，未运行的条目保留原值 """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            results = json.load(f).get("results", {})
+    except FileNotFoundError:
+        results = {}
+    results.update(RESULTS)
+    baseline = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "cpu_count": os.cpu_count()},
+        "results": dict(sorted(results.items()))
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    print(f"\n基准线已写入 {path} ({len(RESULTS)} 项)")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="规则集构建核心的性能基准")
+    arg_parser.add_argument('names', nargs='*', help=f"要运行的基准，可选: {', '.join(BENCHMARKS)}")
+    arg_parser.add_argument('--scales', default=','.join(scales),
+                            help=f"core / formats / query / publish 基准的规模，逗号分隔，可选: {', '.join(synthetic.SCALES)}")
+    arg_parser.add_argument('--baseline', default=BASELINE_FILE, help="基准线文件路径")
+    arg_parser.add_argument('--save-baseline', action='store_true', help="用本次结果更新基准线，不做对照")
+    arg_parser.add_argument('--tolerance', type=float, default=1.3, help="耗时超过基准线的该倍数时判定为回归")
+    arg_parser.add_argument('--memory-tolerance', type=float, default=1.2, help="峰值内存超过基准线的该倍数时判定为回归")
+    arg_parser.add_argument('--fixtures', metavar='DIR', help="把合成夹具写入该目录后退出")
+    args = arg_parser.parse_args()
+
+    scales[:] = [scale.strip() for scale in args.scales.split(',') if scale.strip()]
+    for scale in scales:
+        if scale not in synthetic.SCALES:
+            arg_parser.error(f"未知的规模: {scale}")
+    if args.fixtures:
+        write_fixtures(args.fixtures)
+        return
+
+    for name in args.names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            arg_parser.error(f"未知的基准: {name}")
+        BENCHMARKS[name]()
+
+    if not RESULTS:
+        return
+    if args.save_baseline:
+        save_baseline(args.baseline)
+    elif compare_baseline(args.baseline, args.tolerance, args.memory_tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# compiler.py
+
+import concurrent.futures
+import logging
+import os
+import subprocess
+import time
+
+from config import Config
+from profiler import profiler
+
+config = Config()
+
+
+def run_compile_job(name, command, timeout=None):
+    """
+    执行单个编译命令，返回退出码、stderr 与耗时。命令不存在或超过 timeout 秒被终止时退出码为 None。
+    """
+    start = time.perf_counter()
+    with profiler.span('compile_job', job=name):
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+            returncode, stderr = result.returncode, result.stderr.strip()
+        except subprocess.TimeoutExpired:
+            returncode, stderr = None, f"超过 {timeout}s 未完成，已终止"
+        except OSError as e:
+            returncode, stderr = None, str(e)
+    return {
+        "name": name,
+        "command": command,
+        "returncode": returncode,
+        "stderr": stderr,
+        "elapsed": time.perf_counter() - start
+    }
+
+
+class CompileScheduler:
+    """
+    并行编译调度器：收集 sing-box / mihomo 编译命令，在有界的工作池中并发执行。
+    每个命令本身就是独立的子进程，因此工作池只负责派发和等待，并发数默认等于 CPU 核数。
+    单个命令超过 timeout 秒 (默认 config.compile_timeout) 时终止并记为失败，卡住的编译器不会拖住整个构建。
+    """
+
+    def __init__(self, max_workers=None, timeout=None):
+        self.max_workers = max_workers or config.compile_workers or os.cpu_count() or 1
+        self.timeout = timeout or config.compile_timeout
+        self.jobs = []
+        self.results = []
+
+    def submit(self, name, command):
+        self.jobs.append((name, command))
+
+    def run(self):
+        """
+        执行所有已提交的命令并清空队列，返回失败的任务列表。
+        """
+        jobs, self.jobs = self.jobs, []
+        if not jobs:
+            return []
+
+        start = time.perf_counter()
+        results = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(run_compile_job, name, command, self.timeout) for name, command in jobs]
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result["returncode"] == 0:
+                    logging.debug(f"成功生成 {result['name']}, 耗时 {result['elapsed']:.3f}s")
+                else:
+                    logging.error(
+                        f"生成 {result['name']} 失败, 退出码 {result['returncode']}, "
+                        f"耗时 {result['elapsed']:.3f}s: {result['stderr']}"
+                    )
+
+        self.results.extend(results)
+        failed = [result for result in results if result["returncode"] != 0]
+        slowest = max(results, key=lambda r: r["elapsed"])
+        logging.info(
+            f"编译完成: {len(results) - len(failed)}/{len(results)} 成功, 并发 {self.max_workers}, "
+            f"总耗时 {time.perf_counter() - start:.3f}s, 最慢 {slowest['name']} {slowest['elapsed']:.3f}s"
+        )
+        return failed
@@ -20,6 +20,54 @@ class Config:
         self.shadowrocket_output_directory = os.path.join(self.rule_dir, 'shadowrocket')
         self.clash_output_directory = os.path.join(self.rule_dir, 'clash')
 
+        # 下载设置
+        self.fetch_max_workers = 16  # 预下载阶段的最大并发数
+        self.fetch_per_host_limit = 6  # 同一主机的最大并发连接数
+        self.http_pool_size = 6  # 每个主机连接池的最大连接数
+        self.http_pool_hosts = 16  # 保留连接池的主机数量
+        self.http_timeout = (10, 60)  # (连接超时, 读取超时) 秒
+        self.http_retries = 4  # 429/5xx 及连接错误的最大重试次数
+        self.http_backoff_factor = 1  # 指数退避基数: factor * 2^(n-1) 秒
+        self.http_backoff_jitter = 0.5  # 每次退避额外增加的随机抖动上限 (秒)
+        self.http_cache_dir = './.cache/http'  # 上游内容磁盘缓存目录
+        self.http_cache_max_size = 512 * 1024 * 1024  # 缓存最大字节数，设为 0 关闭缓存
+        self.offline = False  # 离线模式：只使用磁盘缓存构建，不访问网络
+
+        # 增量构建设置
+        self.incremental_build = True  # 只重建输入发生变化的规则集
+        self.build_manifest_file = os.path.join(self.rule_dir, 'build_manifest.json')
+        self.regex_group_size = 8  # domain_regex 合并为交替分支时每组的正则数量
+        self.regex_parallel_threshold = 200000  # 条目数超过该值时使用进程池分片匹配 domain_regex (构建工作进程中始终在本进程匹配)
+        self.regex_workers = None  # domain_regex 分片匹配的进程数，None 表示使用 CPU 核数
+        self.compile_workers = None  # SRS/MRS 并行编译数，None 表示使用 CPU 核数
+        self.compile_timeout = 300  # 单个 sing-box / mihomo 编译命令的超时时间 (秒)，超时后终止并记为失败
+        self.build_jobs = None  # 并行构建规则集的进程数，None 表示使用 CPU 核数，1 表示在当前进程中依次构建
+        self.native_srs = True  # 使用内置的 SRS 编解码器，不支持的规则项回退到 sing-box
+        self.native_mrs = True  # 使用内置的 MRS 编码器 (需要 zstandard)，未安装时回退到 mihomo
+        self.external_merge = False  # 外部归并：条目排序后分段溢写到磁盘，多路归并去重并流式写出，用于超大规则集
+        self.merge_memory_limit = 256 * 1024 * 1024  # 外部归并时内存缓冲区的上限 (字节)，超过后溢写到磁盘
+        self.merge_spill_dir = None  # 外部归并分段文件的目录，None 表示系统临时目录
+
+        # 输出设置
+        self.json_profile = 'lines'  # sing-box JSON 格式: pretty (indent=4) / compact (无空白) / lines (每个条目一行，无缩进)
+        self.json_sort_rules = True  # 规则条目按字典序输出，相同输入总是生成相同的文件，git diff 最小
+        self.json_backend = 'auto'  # auto: 已安装 orjson 时用它读写 JSON; json: 始终使用标准库
+
+        # 发布设置
+        self.publish_artifacts = True  # 构建结束后生成预压缩副本、以内容哈希命名的不可变副本与内容清单
+        self.publish_manifest_file = os.path.join(self.rule_dir, 'manifest.json')
+        self.publish_encodings = ['gz', 'zst']  # 文本产物 (.json/.list/.yaml) 的预压缩格式，zst 需要 zstandard
+        self.publish_gzip_level = 9
+        self.publish_zstd_level = 19
+        self.publish_keep_generations = 3  # 不再被引用的不可变副本保留的发布代数，之后删除
+
+        # 性能剖析设置
+        self.profile_file = './.cache/profile.json'  # 各阶段耗时、计数器与峰值内存的 JSON 输出，设为 None 关闭
+        self.trace_file = None  # Chrome trace 输出路径，None 表示不导出
+
+        # 查询设置
+        self.query_cache_size = 262144  # query.py 批量查询时缓存的查询结果数，日志中重复出现的域名只匹配一次
+
         self.trust_upstream = False
         self.ls_index = 1
         self.enable_trie_filtering = [True, False][0] # 是否按照 domain_suffix 剔除重复的 domain
@@ -0,0 +1,355 @@
+# fetcher.py
+
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import Config
+from profiler import profiler
+
+config = Config()
+
+# 源 YAML 中包含上游链接的字段
+SOURCE_LINK_KEYS = ('geosite', 'geoip', 'process', 'adguard')
+
+
+def read_source_links(yaml_file_path):
+    """
+    读取单个源 YAML 文件中的全部上游链接，去重后按出现顺序返回。
+    """
+    try:
+        with open(yaml_file_path, 'r') as file:
+            data = yaml.safe_load(file) or {}
+    except Exception as e:
+        logging.error(f"读取 {yaml_file_path} 时出错: {e}")
+        return []
+    links = {}
+    for key in SOURCE_LINK_KEYS:
+        for link in data.get(key) or []:
+            links[link] = None
+    return list(links)
+
+
+def collect_source_links(source_directory):
+    """
+    收集 source 目录下所有 YAML 文件中的上游链接，去重后按出现顺序返回。
+    """
+    links = {}
+    for yaml_file in sorted(os.listdir(source_directory)):
+        if yaml_file.endswith('.yaml'):
+            for link in read_source_links(os.path.join(source_directory, yaml_file)):
+                links[link] = None
+    return list(links)
+
+
+def create_session(pool_size=None):
+    """
+    创建带连接池与重试策略的共享会话：保持长连接，
+    对 429/5xx 及连接错误按指数退避 (带随机抖动) 重试，并遵循 Retry-After。
+    """
+    pool_size = pool_size or config.http_pool_size
+    retry = Retry(
+        total=config.http_retries,
+        backoff_factor=config.http_backoff_factor,
+        backoff_jitter=config.http_backoff_jitter,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=config.http_pool_hosts, pool_maxsize=pool_size,
+                          max_retries=retry, pool_block=True)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class HttpCache:
+    """
+    以 URL 为键的磁盘缓存。每个条目保存响应内容及其 ETag / Last-Modified，
+    用于发送条件请求；每次写入后检查总大小，超过 max_size 时按最近使用时间 (LRU) 淘汰。
+    缓存目录在第一次写入时才创建，只读取缓存的脚本 (query.py、benchmark.py) 不会留下空目录。
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or config.http_cache_dir
+        self.max_size = config.http_cache_max_size if max_size is None else max_size
+        self._lock = threading.Lock()
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.body', base + '.meta'
+
+    def load(self, url):
+        """
+        返回 (content, meta)，缓存中不存在时返回 (None, None)。
+        """
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None, None
+        return content, meta
+
+    @staticmethod
+    def conditional_headers(meta):
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def _write_temp(self, data):
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return path
+
+    def save(self, url, content, headers):
+        """
+        写入条目并按需淘汰。内容与元数据先写入临时文件再依次替换：旧元数据先删除，新元数据最后替换，
+        中途中断只会留下没有元数据的内容 (load 视为不存在)，不会出现 ETag 与内容不一致的条目。
+        """
+        body_path, meta_path = self._paths(url)
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'size': len(content)
+        }
+        temp_paths = []
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_paths.append(self._write_temp(content))
+            temp_paths.append(self._write_temp(json.dumps(meta, ensure_ascii=False).encode('utf-8')))
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+            os.replace(temp_paths[0], body_path)
+            os.replace(temp_paths[1], meta_path)
+        except OSError as e:
+            logging.error(f"写入缓存 {url} 时出错: {e}")
+            for path in temp_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+        self.evict()
+
+    def touch(self, url):
+        """
+        更新条目的最近使用时间，LRU 淘汰以内容文件的 mtime 为准。
+        """
+        body_path, _ = self._paths(url)
+        try:
+            os.utime(body_path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """
+        按最近使用时间从旧到新删除条目，直到总大小不超过 max_size。
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.body'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            for stale in (path, path[:-len('.body')] + '.meta'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            logging.info(f"HTTP 缓存淘汰 {evicted} 个条目, 剩余 {total_size} 字节")
+
+
+class Fetcher:
+    """
+    上游规则下载器：在解析开始前并发下载全部链接，内容保存在内存中供后续解析阶段复用。
+    同一主机的并发请求数受 per_host_limit 限制，避免触发 GitHub 的限流。
+    启用缓存时发送条件请求，上游返回 304 则直接使用磁盘缓存；离线模式下只读取缓存。
+    """
+
+    def __init__(self, max_workers=None, per_host_limit=None, cache=None, offline=None, session=None):
+        self.max_workers = max_workers or config.fetch_max_workers
+        self.per_host_limit = per_host_limit or config.fetch_per_host_limit
+        self.session = session or create_session()
+        self.cache = cache
+        self.offline = config.offline if offline is None else offline
+        self.store = {}  # url -> bytes
+        self.stats = {}  # url -> {"elapsed": 秒, "bytes": 字节数, "source": 来源}
+        self.digests = {}  # url -> 内容的 sha256
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+
+    def after_fork(self):
+        """ 在进程池的工作进程中调用：重建 HTTP 会话与锁，不与父进程共享连接 """
+        self.session = create_session()
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+        if self.cache:
+            self.cache._lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_semaphores[host]
+
+    def download(self, url):
+        """
+        下载单个链接并记录耗时与字节数，失败时抛出 requests 异常。
+        """
+        with profiler.span('fetch', url=url) as span:
+            content = self._download(url)
+            span["source"] = self.stats[url]["source"]
+        profiler.count('bytes_downloaded', len(content))
+        if span["source"] == 'network':
+            profiler.count('bytes_network', len(content))
+        return content
+
+    def _download(self, url):
+        cached, meta = self.cache.load(url) if self.cache else (None, None)
+        start = time.perf_counter()
+
+        if self.offline:
+            if cached is None:
+                raise requests.exceptions.ConnectionError(f"离线模式下缓存中不存在 {url}")
+            content, source = cached, 'cache'
+        else:
+            headers = HttpCache.conditional_headers(meta) if cached is not None else {}
+            with self._host_semaphore(url):
+                response = self.session.get(url, headers=headers, timeout=config.http_timeout)
+                if response.status_code == 304 and cached is not None:
+                    content, source = cached, '304'
+                else:
+                    response.raise_for_status()
+                    content, source = response.content, 'network'
+
+            if self.cache and source == 'network':
+                self.cache.save(url, content, response.headers)
+
+        if self.cache and source != 'network':
+            self.cache.touch(url)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.store[url] = content
+            self.digests.pop(url, None)
+            self.stats[url] = {"elapsed": elapsed, "bytes": len(content), "source": source}
+        logging.info(f"下载完成 {url}: {len(content)} 字节, 来源 {source}, 耗时 {elapsed:.3f}s")
+        return content
+
+    def prefetch(self, urls):
+        """
+        使用有界线程池并发下载所有尚未缓存的链接。单个链接失败只记录日志，
+        解析阶段再次访问该链接时会重新尝试下载。
+        """
+        pending = [url for url in dict.fromkeys(urls) if url not in self.store]
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.download, url): url for url in pending}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"下载 {futures[future]} 时出错: {e}")
+
+        elapsed = time.perf_counter() - start
+        done = [url for url in pending if url in self.stats]
+        total_bytes = sum(self.stats[url]["bytes"] for url in done)
+        network_bytes = sum(self.stats[url]["bytes"] for url in done if self.stats[url]["source"] == 'network')
+        logging.info(
+            f"预下载完成: {len(done)}/{len(pending)} 个链接, "
+            f"共 {total_bytes} 字节 (网络传输 {network_bytes} 字节), 耗时 {elapsed:.3f}s"
+        )
+
+        connections = self.connection_stats()
+        logging.info(
+            f"HTTP 连接: 新建 {connections['opened']}, 复用 {connections['reused']}, "
+            f"请求 {connections['requests']}"
+        )
+
+    def connection_stats(self):
+        """
+        统计会话连接池中新建与复用的连接数。
+        """
+        opened = requests_count = 0
+        for adapter in {id(a): a for a in self.session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                opened += pool.num_connections
+                requests_count += pool.num_requests
+        return {"opened": opened, "reused": max(requests_count - opened, 0), "requests": requests_count}
+
+    def get(self, url):
+        """
+        返回链接内容 (bytes)，未预下载的链接按需下载。
+        """
+        content = self.store.get(url)
+        if content is None:
+            content = self.download(url)
+        return content
+
+    def digest(self, url):
+        """
+        返回链接内容的 sha256，下载失败时返回 None。结果按链接缓存，内容重新下载后失效。
+        """
+        digest = self.digests.get(url)
+        if digest is None:
+            try:
+                digest = self.digests[url] = hashlib.sha256(self.get(url)).hexdigest()
+            except Exception:
+                return None
+        return digest
+
+    def get_text(self, url):
+        return self.get(url).decode('utf-8', errors='replace')
+
+
+# 全局共享的下载器实例
+fetcher = Fetcher(cache=HttpCache() if config.http_cache_max_size > 0 else None)
@@ -0,0 +1,114 @@
+# keywords.py
+"""
+domain_keyword 的多模式匹配：所有关键字构建为一个 Aho-Corasick 自动机，
+每个条目只需从头到尾扫描一遍即可判断是否包含任意关键字，耗时与条目总字节数成线性关系，与关键字数量无关。
+"""
+
+import logging
+import time
+from collections import Counter, deque
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick 自动机。状态转移保存在每个状态的字典中，失配时沿 fail 链回退；
+    ends[状态] 为恰好在该状态结束的关键字，match[状态] 为到达该状态时已经出现的关键字
+    (该状态自身的关键字优先，否则取 fail 链上最近的关键字)。hits 记录每个关键字覆盖的条目数，用于 report。
+    """
+    __slots__ = ('keywords', 'goto', 'fail', 'ends', 'match', 'hits', 'build_time', 'scanned')
+
+    def __init__(self, keywords=()):
+        start = time.perf_counter()
+        self.keywords = sorted({keyword for keyword in keywords if keyword})
+        goto = [{}]
+        own = [None]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = goto[state][char] = len(goto)
+                    goto.append({})
+                    own.append(None)
+                state = next_state
+            own[state] = keyword
+
+        # 按深度广度优先计算 fail 链，较浅状态的 fail 与 match 总是先确定
+        fail = [0] * len(goto)
+        match = list(own)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                if state:
+                    fallback = fail[state]
+                    while fallback and char not in goto[fallback]:
+                        fallback = fail[fallback]
+                    fail[next_state] = goto[fallback].get(char, 0)
+                if match[next_state] is None:
+                    match[next_state] = match[fail[next_state]]
+
+        self.goto, self.fail, self.ends, self.match = goto, fail, own, match
+        self.hits = Counter()
+        self.scanned = 0
+        self.build_time = time.perf_counter() - start
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def search(self, text, exclude=None):
+        """ 返回 text 中最先出现的关键字，不包含任何关键字时返回 None；exclude 为不计入的关键字 (用于关键字自身) """
+        goto, fail, match = self.goto, self.fail, self.match
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = match[state]
+            if found is not None:
+                if found != exclude:
+                    return found
+                # exclude 恰好在此结束，继续检查 fail 链上更短的关键字
+                found = match[fail[state]]
+                if found is not None:
+                    return found
+        return None
+
+    def findall(self, text):
+        """ 返回 text 中出现的全部关键字 (集合)，fail 链上不再有关键字时立即停止回溯 """
+        goto, fail, ends, match = self.goto, self.fail, self.ends, self.match
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            output = state
+            while output and match[output] is not None:
+                if ends[output] is not None:
+                    found.add(ends[output])
+                output = fail[output]
+        return found
+
+    def covered(self, values, exclude_self=False):
+        """ 返回 values 中包含任意关键字的条目，并把命中计入 hits；exclude_self 为 True 时条目自身不算命中 """
+        covered = []
+        for value in values:
+            found = self.search(value, exclude=value if exclude_self else None)
+            if found is not None:
+                covered.append(value)
+                self.hits[found] += 1
+        self.scanned += len(values)
+        return covered
+
+    def report(self, label, top=10):
+        """ 记录各关键字覆盖的条目数，便于发现过宽的上游关键字 """
+        if not self.hits:
+            return
+        ranking = ", ".join(f"{keyword} ({count})" for keyword, count in self.hits.most_common(top))
+        logging.info(
+            f"{label}: domain_keyword {len(self.keywords)} 个, 自动机状态 {len(self.goto)} 个, "
+            f"构建 {self.build_time * 1000:.1f} ms, 扫描 {self.scanned} 条, 覆盖 {sum(self.hits.values())} 条; "
+            f"覆盖最多的关键字: {ranking}"
+        )
@@ -1,14 +1,28 @@
+import argparse
 import configparser
 import os
 import json
 import logging
 import subprocess
-import time
 import yaml
 import re
-import concurrent.futures
+import requests
 from utils import *
+from compiler import CompileScheduler
 from config import Config
+from fetcher import fetcher, collect_source_links, read_source_links
+from manifest import BuildManifest, file_digest, list_group_outputs, rule_set_group
+from publish import publish_artifacts
+from route import RouteBuilder
+from merger import ExternalMerger, write_rule_set_json
+from profiler import peak_rss, profiled, profiler, reset_peak_rss
+from adguard import AdGuardRules, parse_adguard_link
+from keywords import KeywordAutomaton
+from ruleset import RuleSet, regex_domain
+from scheduler import BuildScheduler
+from upstream import upstream_store
+import mrs
+import srs
 from collections import defaultdict
 import tempfile
 import shutil
@@ -19,10 +33,78 @@ config = Config()
 class RuleParser:
     def __init__(self):
         self.ls_index = 1
+        self.rule_sets = {}  # JSON 输出路径 -> 规则列表，全部阶段结束后由 emit_rule_sets 统一写出
+
+    def save_rule_set(self, path, rules):
+        """暂存规则集，不立即写盘"""
+        self.rule_sets[os.path.normpath(path)] = rules
+
+    def load_rule_set(self, path):
+        """优先读取内存中的规则集，不存在时读取磁盘上的 JSON 文件"""
+        rules = self.rule_sets.get(os.path.normpath(path))
+        return rules if rules is not None else load_json(path).get("rules", [])
+
+    def discard_rule_set(self, path):
+        self.rule_sets.pop(os.path.normpath(path), None)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def emit_rule_sets(self, paths, scheduler):
+        """
+        一次性写出规则集的全部目标格式。内存中没有的规则集 (例如信任上游时直接写出的 JSON) 从磁盘读取。
+        SRS 与 MRS 由内置编码器直接生成，无法生成时提交给 scheduler 调用 sing-box / mihomo 编译。
+        """
+        for path in paths:
+            try:
+                rules = self.load_rule_set(path)
+            except Exception as e:
+                logging.error(f"读取规则集 {path} 时出错: {e}")
+                continue
+            if config.json_sort_rules:
+                rules = sort_rules(rules)
+            with profiler.span('emit'):
+                # 包含关键字的 domain 与 domain_suffix 只从 sing-box 与 Surge 规则中剔除，Clash 无法表达关键字，保留原条目
+                payload = clash_payload(rules)
+                rules = drop_keyword_covered(rules, os.path.basename(path))
+                emit_rule_set(path, rules, payload)
+            with profiler.span('srs'):
+                self.compile_srs(path, rules, scheduler)
+            with profiler.span('mrs'):
+                self.compile_mrs(path, payload, scheduler)
+
+    def compile_srs(self, json_path, rules, scheduler):
+        srs_path = json_path.replace(".json", ".srs")
+        if config.native_srs:
+            try:
+                srs.compile_rule_set({"version": 1, "rules": rules}, srs_path)
+                return
+            except srs.UnsupportedRuleError as e:
+                logging.info(f"{srs_path} 回退到 sing-box 编译: {e}")
+            except Exception as e:
+                logging.error(f"生成 {srs_path} 时出错: {e}")
+                return
+        scheduler.submit(srs_path, ["sing-box", "rule-set", "compile", "--output", srs_path, json_path])
+
+    def compile_mrs(self, json_path, payload, scheduler):
+        name = os.path.basename(json_path)[:-len('.json')]
+        behavior = mrs_behavior(name)
+        if behavior is None:
+            return
+        yaml_path = os.path.join(config.clash_output_directory, f"{name}.yaml")
+        mrs_path = os.path.join(config.clash_output_directory, f"{name}.mrs")
+        if config.native_mrs and mrs.available():
+            try:
+                if not mrs.compile_rule_set(behavior, [value for value, _ in payload], mrs_path):
+                    logging.warning(f"{mrs_path} 没有有效规则，生成空文件")
+            except Exception as e:
+                logging.error(f"生成 {mrs_path} 时出错: {e}")
+            return
+        scheduler.submit(mrs_path, ["mihomo", "convert-ruleset", behavior, "yaml", yaml_path, mrs_path])
 
     def parse_adguard_file(self, yaml_file_path, output_directory):
         """
-        处理 AdGuard 链接并返回解析后的 JSON 数据。
+        流式解析 YAML 中 adguard 下的全部过滤列表，应用例外规则并去重后暂存为规则集，
+        与其他规则集一样由 emit 一次性生成 sing-box、Clash、Surge 与 Shadowrocket 规则。返回统计信息。
         """
         try:
             with open(yaml_file_path, 'r') as file:
@@ -30,86 +112,61 @@ class RuleParser:
                 logging.debug(f"解析的 YAML 数据: {data}")
 
             rule_set_name = os.path.basename(yaml_file_path).split('.')[0]
-            adg_links = data.get('adguard', [])
-            unique_lines = set()
+            adguard_rules = AdGuardRules()
 
-            # 遍历每个 AdGuard 规则文件链接，获取并处理数据
-            for link in adg_links:
+            # 逐个列表解析后并入，被多个 YAML 引用的列表只解析一次
+            for link in data.get('adguard', []):
                 try:
-                    response = requests.get(link)
-                    response.raise_for_status()
-                    raw_data = response.text
-
-                    # 将数据按行分割，并添加到集合中去重
-                    lines = raw_data.splitlines()
-                    for line in lines:
-                        if line.strip():  # 过滤掉空行
-                            unique_lines.add(line.strip())
-
+                    with profiler.span('parse', url=link):
+                        adguard_rules.update(upstream_store.get(link, parse_adguard_link))
                 except requests.RequestException as e:
                     logging.error(f"获取链接 {link} 时出错: {e}")
 
-            # 创建临时目录和文件
-            tmp_dir = tempfile.mkdtemp()
-            logging.debug(f"创建临时目录: {tmp_dir}")
-            adguard_file_path = os.path.join(tmp_dir, "adguard_combined.txt")
-
-            # 将去重后的行写入临时文件
-            with open(adguard_file_path, "w") as f:
-                f.write("\n".join(sorted(unique_lines)))  # 排序并写入文件
-
-            # 执行 sing-box 转换为 srs 格式
-            srs_file_path = os.path.join(output_directory, "{}.srs".format(rule_set_name))
-            conversion_command = [
-                "sing-box", "rule-set", "convert", "--type", "adguard",
-                "--output", srs_file_path, adguard_file_path
-            ]
-            logging.debug(f"执行转换命令: {' '.join(conversion_command)}")
-
-            result = subprocess.run(conversion_command, capture_output=True, text=True)
-            if result.returncode != 0:
-                logging.error(f"转换命令失败，错误信息: {result.stderr}")
-                return None
-
-            # 确认 .srs 文件已经生成
-            if not os.path.exists(srs_file_path):
-                logging.error(f"转换失败，没有找到生成的 SRS 文件: {srs_file_path}")
-                return None
+            rule_set, adguard_stats = adguard_rules.resolve()
+            del adguard_rules
+            profiler.count('entries_in', len(rule_set))
+            logging.info(
+                f"{rule_set_name}: AdGuard 规则 {adguard_stats['lines']} 行, 例外 {adguard_stats['exceptions']} 条, "
+                f"例外剔除 {adguard_stats['removed_by_exceptions']}, "
+                f"无法表达的例外 {adguard_stats['unexpressed_exceptions']} 条, 跳过 {adguard_stats['skipped']}"
+            )
+            deduplicate_rule_set(rule_set)
 
-            # 读取 AdGuard 规则并转换为 Surge/Shadowrocket
-            # convert_adguard_to_surge(adguard_file_path, rule_set_name)
-            # convert_adguard_to_clash(adguard_file_path, rule_set_name)
+            output_file = os.path.join(output_directory, f"{rule_set_name}.json")
+            final_rules = rule_set.to_rules()
+            self.save_rule_set(output_file, final_rules)
+            profiler.count('entries_out', len(rule_set))
 
-            # 清理临时文件
-            os.remove(adguard_file_path)
-            os.rmdir(tmp_dir)  # 删除临时目录
+            counts = rule_set.counts()
+            return {
+                "filtered_count": 0,
+                "removed_counts": adguard_stats['removed_by_exceptions'],
+                "total_rules": len(rule_set),
+                "domain_count": counts["domain"],
+                "domain_suffix_count": counts["domain_suffix"],
+                "domain_keyword_count": counts["domain_keyword"],
+                "ip_cidr_count": counts["ip_cidr"],
+                "process_name_count": counts["process_name"],
+                "domain_regex_count": counts["domain_regex"]
+            }
 
         except Exception as e:
             logging.error(f"处理 AdGuard 文件时出错: {e}")
             return None
 
-    def parse_littlesnitch_file(self, link, retries=3, delay=5):
+    def parse_littlesnitch_file(self, link):
         """
         处理 Little Snitch 链接并返回解析后的 JSON 数据。
         """
         try:
             logging.debug(f"正在处理 Little Snitch 链接: {link}")
 
-            for attempt in range(retries):
-                try:
-                    response = requests.get(link)
-                    response.raise_for_status()  # 如果请求失败，抛出异常
-                    break  # 请求成功，退出循环
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"请求失败: {e}")
-                    if attempt < retries - 1:  # 如果不是最后一次尝试
-                        # logging.info(f"等待 {delay} 秒后重试...")
-                        time.sleep(delay)  # 等待一段时间再重试
-                    else:
-                        logging.error(f"已达到最大重试次数 ({retries})，停止请求。")
-                        return None
+            try:
+                raw_data = fetcher.get_text(link)  # 重试由共享会话负责
+            except requests.exceptions.RequestException as e:
+                logging.error(f"请求失败: {e}")
+                return None
 
-            raw_data = response.text
             logging.debug(f"获取到的原始数据: {raw_data[:500]}")  # 打印前 500 个字符
 
             # 清理数据
@@ -150,59 +207,67 @@ class RuleParser:
             logging.error(f"处理链接 {link} 时发生未知错误：{e}")
             return None
 
-    def parse_yaml_file(self, yaml_file, output_directory):
+    def plan_yaml_file(self, yaml_file, output_directory):
         """
-        解析 YAML 文件中的链接，并根据类别生成相应的 JSON 文件。
+        读取 YAML 文件中的链接，返回需要生成的规则集 [(类型, 链接列表, JSON 输出路径, 规则集名)]。
         """
         with open(yaml_file, 'r') as file:
             data = yaml.safe_load(file)
             logging.debug(f"解析的 YAML 数据: {data}")
 
-        # 按类别存储链接
-        geosite_links = data.get('geosite', [])
-        geoip_links = data.get('geoip', [])
-        process_links = data.get('process', [])
-
-        # 定义生成文件的路径
         rule_set_name = os.path.basename(yaml_file).split('.')[0]
+        plan = []
+        for result_type in ('geosite', 'geoip', 'process'):
+            links = data.get(result_type, [])
+            if links:
+                output_file = os.path.join(output_directory, f"{result_type}-{rule_set_name}.json")
+                plan.append((result_type, links, output_file, rule_set_name))
+        return plan
 
-        geosite_file = os.path.join(output_directory, f"geosite-{rule_set_name}.json")
-        geoip_file = os.path.join(output_directory, f"geoip-{rule_set_name}.json")
-        process_file = os.path.join(output_directory, f"process-{rule_set_name}.json")
-
-        # 初始化结果存储
+    def parse_yaml_file(self, yaml_file, output_directory):
+        """
+        解析 YAML 文件中的链接，并根据类别生成相应的 JSON 文件。
+        """
+        rule_set_name = os.path.basename(yaml_file).split('.')[0]
         final_results = []
-
-        # 处理 geosite
-        if geosite_links:
-            geosite_result = self.generate_json_file(geosite_links, geosite_file, rule_set_name, type='geosite')
-            final_results.append(("geosite", geosite_result))
-
-        # 处理 geoip
-        if geoip_links:
-            geoip_result = self.generate_json_file(geoip_links, geoip_file, rule_set_name, type='geoip')
-            final_results.append(("geoip", geoip_result))
-
-        # 处理 process
-        if process_links:
-            process_result = self.generate_json_file(process_links, process_file, rule_set_name, type='process')
-            final_results.append(("process", process_result))
+        for result_type, links, output_file, _ in self.plan_yaml_file(yaml_file, output_directory):
+            result = self.generate_with_peak_rss(links, output_file, rule_set_name, type=result_type)
+            final_results.append((result_type, result))
 
         # 输出最终处理结果
         logging.info(f"{rule_set_name} 规则整理完成:")
         for result_type, result_data in final_results:
-            logging.info(
-                f"类型: {result_type}\n"
-                f"domain 被过滤掉的条目数量: {result_data['filtered_count']}\n"
-                f"剩余规则总数: {result_data['total_rules']}\n"
-                f"规则分析:\n"
-                f"  domain 条目数: {result_data['domain_count']}\n"
-                f"  domain_suffix 条目数: {result_data['domain_suffix_count']}\n"
-                f"  ip_cidr 条目数: {result_data['ip_cidr_count']}\n"
-                f"  process_name 条目数: {result_data['process_name_count']}\n"
-                f"  domain_regex 条目数: {result_data['domain_regex_count']}\n"
-                f"{'-' * 50}"
-            )
+            self.log_rule_set_stats(result_type, result_data)
+
+    @staticmethod
+    def log_rule_set_stats(result_type, result_data):
+        logging.info(
+            f"类型: {result_type}\n"
+            f"domain 被过滤掉的条目数量: {result_data['filtered_count']}\n"
+            f"各类别剔除数量: {result_data.get('removed_counts', {})}\n"
+            f"剩余规则总数: {result_data['total_rules']}\n"
+            f"规则分析:\n"
+            f"  domain 条目数: {result_data['domain_count']}\n"
+            f"  domain_suffix 条目数: {result_data['domain_suffix_count']}\n"
+            f"  domain_keyword 条目数: {result_data.get('domain_keyword_count', 0)}\n"
+            f"  ip_cidr 条目数: {result_data['ip_cidr_count']}\n"
+            f"  process_name 条目数: {result_data['process_name_count']}\n"
+            f"  domain_regex 条目数: {result_data['domain_regex_count']}\n"
+            f"峰值内存 (RSS): {result_data.get('peak_rss', '未知')}\n"
+            f"{'-' * 50}"
+        )
+
+    def generate_with_peak_rss(self, links, output_file, rule_set_name, type='geosite'):
+        """
+        调用 generate_json_file 并在统计信息中记录该规则集处理期间的峰值 RSS。
+        平台不支持重置峰值时记录的是进程启动以来的峰值。
+        """
+        scoped = reset_peak_rss()
+        stats = self.generate_json_file(links, output_file, rule_set_name, type=type)
+        peak = peak_rss()
+        if peak is not None and isinstance(stats, dict):
+            stats["peak_rss"] = f"{peak / 1024 / 1024:.1f} MB" + ("" if scoped else " (进程峰值)")
+        return stats
 
     def download_srs_file(self, url):
         """
@@ -213,11 +278,9 @@ class RuleParser:
             tmp_dir = tempfile.mkdtemp()
             srs_file_path = os.path.join(tmp_dir, os.path.basename(url))
 
-            # 下载文件
-            response = requests.get(url)
-            response.raise_for_status()  # 确保请求成功
+            # 写入预下载的文件内容
             with open(srs_file_path, 'wb') as file:
-                file.write(response.content)
+                file.write(fetcher.get(url))
 
             # logging.info(f"成功下载 {url} 到 {srs_file_path}")
             return srs_file_path
@@ -228,30 +291,10 @@ class RuleParser:
 
     def download_and_parse_json(self, json_file_url):
         """
-        下载远程 JSON 文件到临时目录，并解析为 JSON 数据。
+        获取远程 JSON 文件内容，并解析为 JSON 数据。
         """
         try:
-            # logging.info(f"正在下载远程 JSON 文件: {json_file_url}")
-
-            # 创建临时文件用于存储下载的 JSON 文件
-            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp_file:
-                response = requests.get(json_file_url, stream=True)
-                response.raise_for_status()  # 检查请求是否成功
-                for chunk in response.iter_content(chunk_size=8192):
-                    tmp_file.write(chunk)
-                tmp_file_path = tmp_file.name  # 获取临时文件路径
-
-            # logging.info(f"JSON 文件下载成功，临时路径: {tmp_file_path}")
-
-            # 读取临时 JSON 文件
-            with open(tmp_file_path, 'r', encoding='utf-8') as file:
-                json_data = json.load(file)
-
-            # 清理临时文件
-            os.remove(tmp_file_path)
-            # logging.info(f"已清理临时文件: {tmp_file_path}")
-
-            return json_data
+            return json.loads(fetcher.get(json_file_url))
 
         except requests.exceptions.RequestException as e:
             logging.error(f"下载 JSON 文件失败: {json_file_url}, 错误: {e}")
@@ -269,15 +312,11 @@ class RuleParser:
         # 去重链接
         unique_links = list(set(links))
 
-        json_file_list = []
-        for link in unique_links:
-            json_file = self.parse_link_file_to_json(link)
-            json_file_list.append(json_file)
-
         # 如果只有一个 JSON 文件，直接保存，不调用 merge_json
-        if len(json_file_list) == 1 and config.trust_upstream:
-            single_file_stats = json_file_list[0]
-            final_rules = single_file_stats
+        if len(unique_links) == 1 and config.trust_upstream:
+            with profiler.span('parse'):
+                single_file_stats = upstream_store.get(unique_links[0], self.parse_link_file_to_json) or {}
+            final_rules = single_file_stats.get("rules", [])
 
             # 如果 type 不是 'process'，则去除 process_name 条目 (debug)
             if type != 'process':
@@ -288,6 +327,7 @@ class RuleParser:
             # 统计信息
             domain_count = len(single_file_stats.get("domain", []))
             domain_suffix_count = len(single_file_stats.get("domain_suffix", []))
+            domain_keyword_count = len(single_file_stats.get("domain_keyword", []))
             ip_cidr_count = len(single_file_stats.get("ip_cidr", []))
             process_name_count = len(single_file_stats.get("process_name", []))
             domain_regex_count = len(single_file_stats.get("domain_regex", []))
@@ -298,106 +338,198 @@ class RuleParser:
                 "total_rules": len(final_rules),
                 "domain_count": domain_count,
                 "domain_suffix_count": domain_suffix_count,
+                "domain_keyword_count": domain_keyword_count,
                 "ip_cidr_count": ip_cidr_count,
                 "process_name_count": process_name_count,
                 "domain_regex_count": domain_regex_count
             }
-            try:
-                with open(output_file, 'w', encoding='utf-8') as file:
-                    json.dump(final_rules, file, ensure_ascii=False, indent=4)
-            except Exception as e:
-                logging.error(f"保存 JSON 文件时出错: {e}")
-                return {"error": str(e)}
+            save_json(final_rules, output_file)
             # 返回统计信息
             return statistics
-        # 否则调用 merge_json
+        # 否则调用 merge_json，上游逐个解析并合并，合并后即释放
         else:
-            return self.merge_json(json_file_list, output_file, rule_set_name=rule_set_name, type=type)
+            json_file_list = self.parse_links(unique_links)
+            with profiler.span('merge'):
+                if config.external_merge:
+                    return self.merge_json_external(json_file_list, output_file, rule_set_name=rule_set_name, type=type)
+                return self.merge_json(json_file_list, output_file, rule_set_name=rule_set_name, type=type)
+
+    def parse_links(self, links):
+        """ 逐个解析上游链接，解析耗时计入 parse 阶段；被多个规则集引用的上游取共享的解析结果 """
+        for link in links:
+            with profiler.span('parse'):
+                json_file = upstream_store.get(link, self.parse_link_file_to_json)
+            yield json_file
 
     def merge_json(self, json_file_list, output_file, rule_set_name,
                    enable_trie_filtering=config.enable_trie_filtering, type='geosite'):
         """
         合并 JSON 文件并返回规则统计信息。
         """
-        logging.debug(f"正在合并 JSON 文件: {json_file_list}")
-
-        # 初始化合并规则
-        merged_rules = {
-            "process_name": set(),
-            "domain": set(),
-            "domain_suffix": set(),
-            "ip_cidr": set(),
-            "domain_regex": set()
-        }
+        logging.debug(f"正在合并 {rule_set_name} 的 JSON 数据")
 
         # 第一轮合并与去重
+        rule_set = RuleSet()
         for json_file in json_file_list:
+            if not json_file:
+                continue
             try:
-                for rule in json_file.get("rules", []):
-                    if isinstance(rule, dict):
-                        for category, values in rule.items():
-                            if category in merged_rules and values:
-                                if isinstance(values, list):
-                                    merged_rules[category].update(values)
-                                elif isinstance(values, str):
-                                    merged_rules[category].add(values)
+                profiler.count('entries_in', rule_set.add_rules(json_file.get("rules", [])))
             except Exception as e:
                 logging.error(f"解析 JSON 数据时出错: {e}")
 
-        # 基于 domain_suffix 的 Trie 去重
-        original_domain_count = len(merged_rules.get("domain", set()))
-        filtered_count = 0
-        final_domains = set()
+        # 聚合 ip_cidr：剔除被覆盖的网段并合并相邻网段
+        if rule_set.ip_cidr:
+            rule_set.ip_cidr = set(aggregate_cidrs(rule_set.ip_cidr))
 
-        if enable_trie_filtering and merged_rules.get("domain_suffix"):
-            if merged_rules.get("domain"):
-                final_domains, filtered_count = filter_domains_with_trie(
-                    merged_rules["domain"], merged_rules["domain_suffix"]
-                )
-            else:
-                final_domains = merged_rules.get("domain", set())
-        else:
-            final_domains = merged_rules.get("domain", set())
+        # 基于 domain_suffix 的后缀索引去重：先精简 domain_suffix 与被覆盖的 domain_regex，再剔除被覆盖的 domain
+        filtered_count = 0
+        removed = {}
+        if enable_trie_filtering and rule_set.domain_suffix:
+            removed = rule_set.collapse_suffixes()
+            log_collapsed(removed, rule_set_name)
+            if rule_set.domain:
+                rule_set.domain, filtered_count = filter_domains_with_trie(rule_set.domain, rule_set.domain_suffix)
+        removed["domain"] = filtered_count
+
+        # domain_keyword 覆盖：剔除包含其他关键字的关键字
+        if rule_set.domain_keyword:
+            keyword_removed, automaton = rule_set.prune_keywords()
+            log_keyword_pruning(keyword_removed, automaton, rule_set_name)
+            for category, count in keyword_removed.items():
+                removed[category] = removed.get(category, 0) + count
+
+        # 转换为最终规则列表，如果 type 不是 'process'，则去除 process_name 条目 (debug)
+        final_rules = rule_set.to_rules(exclude=() if type == 'process' else ('process_name',))
+
+        # 暂存结果，category 拆分后统一写出
+        self.save_rule_set(output_file, final_rules)
+        profiler.count('entries_out', sum(len(values) for rule in final_rules for values in rule.values()))
 
-        # 更新合并后的 domain 规则
-        merged_rules["domain"] = final_domains
+        # 返回统计信息
+        counts = rule_set.counts()
+        return {
+            "filtered_count": filtered_count,
+            "removed_counts": removed,
+            "total_rules": len(rule_set),
+            "domain_count": counts["domain"],
+            "domain_suffix_count": counts["domain_suffix"],
+            "domain_keyword_count": counts["domain_keyword"],
+            "ip_cidr_count": counts["ip_cidr"],
+            "process_name_count": counts["process_name"],
+            "domain_regex_count": counts["domain_regex"]
+        }
 
-        # 转换为最终规则列表
-        final_rules = [
-            {category: list(values)}
-            for category, values in merged_rules.items()
-            if values
-        ]
+    def merge_json_external(self, json_file_list, output_file, rule_set_name,
+                            enable_trie_filtering=config.enable_trie_filtering, type='geosite'):
+        """
+        merge_json 的外部归并版本：条目按类别排序溢写到磁盘，多路归并去重后直接流式写出 JSON，
+        内存占用受 config.merge_memory_limit 约束。结果与 merge_json 相同，仅条目按字典序排列。
+        """
+        categories = ("process_name", "domain", "domain_suffix", "domain_keyword", "ip_cidr", "domain_regex")
+        with ExternalMerger(memory_limit=config.merge_memory_limit, spill_dir=config.merge_spill_dir) as merger:
+            for json_file in json_file_list:
+                if not json_file:
+                    continue
+                try:
+                    merger.add_rules(json_file.get("rules", []), categories)
+                except Exception as e:
+                    logging.error(f"解析 JSON 数据时出错: {e}")
+            merger.report(rule_set_name)
+            profiler.count('entries_in', merger.added)
+            profiler.count('spilled_bytes', merger.spilled_bytes)
+
+            # 聚合 ip_cidr：剔除被覆盖的网段并合并相邻网段
+            ip_cidrs = list(merger.merged("ip_cidr"))
+            if ip_cidrs:
+                ip_cidrs = aggregate_cidrs(ip_cidrs)
+
+            # 基于 domain_suffix 的后缀索引去重，domain、domain_suffix 与 domain_regex 逐条过滤
+            index = SuffixIndex(merger.merged("domain_suffix")) if enable_trie_filtering else None
+            removed = {"domain": 0, "domain_suffix": 0, "domain_regex": 0}
+            # domain_keyword 覆盖：包含其他关键字的关键字逐条剔除
+            automaton = KeywordAutomaton(merger.merged("domain_keyword"))
+            keyword_removed = {"domain_keyword": 0}
+
+            def filter_domains(domains):
+                for domain in domains:
+                    # 与精简后的后缀相同的 domain 保留，而精简后的后缀不会再有上级后缀，只需检查上级
+                    if index and index.has_parent(domain):
+                        removed["domain"] += 1
+                    else:
+                        yield domain
 
-        # 如果 type 不是 'process'，则去除 process_name 条目 (debug)
-        if type != 'process':
-            final_rules = [
-                rule for rule in final_rules
-                if 'process_name' not in rule
-            ]
+            def filter_suffixes(suffixes):
+                for suffix in suffixes:
+                    if index and index.redundant(suffix):
+                        removed["domain_suffix"] += 1
+                    else:
+                        yield suffix
+
+            def filter_keywords(keywords):
+                for keyword in keywords:
+                    found = automaton.search(keyword, exclude=keyword) if len(automaton) else None
+                    automaton.scanned += 1
+                    if found is None:
+                        yield keyword
+                    else:
+                        automaton.hits[found] += 1
+                        keyword_removed["domain_keyword"] += 1
+
+            def filter_regexes(patterns):
+                for pattern in patterns:
+                    parsed = regex_domain(pattern) if index else None
+                    if parsed is None or not index.implies(*parsed):
+                        yield pattern
+                    else:
+                        removed["domain_regex"] += 1
+
+            counts = write_rule_set_json(output_file, [
+                ("process_name", merger.merged("process_name") if type == 'process' else ()),
+                ("domain", filter_domains(merger.merged("domain"))),
+                ("domain_suffix", filter_suffixes(merger.merged("domain_suffix"))),
+                ("domain_keyword", filter_keywords(merger.merged("domain_keyword"))),
+                ("ip_cidr", ip_cidrs),
+                ("domain_regex", filter_regexes(merger.merged("domain_regex"))),
+            ])
+            log_collapsed(removed, rule_set_name)
+            log_keyword_pruning(keyword_removed, automaton, rule_set_name)
+            for category, count in keyword_removed.items():
+                removed[category] = removed.get(category, 0) + count
+            profiler.count('entries_out', sum(counts.values()))
+            if type != 'process':
+                counts["process_name"] = sum(1 for _ in merger.merged("process_name"))
 
-        # 保存结果
-        try:
-            with open(output_file, 'w', encoding='utf-8') as file:
-                json.dump({"version": 1, "rules": final_rules}, file, ensure_ascii=False, indent=4)
-        except Exception as e:
-            logging.error(f"保存 JSON 文件时出错: {e}")
+        # 已写盘，丢弃可能残留的内存副本，后续阶段从磁盘读取
+        self.rule_sets.pop(os.path.normpath(output_file), None)
 
-        # 返回统计信息
         return {
-            "filtered_count": filtered_count,
-            "total_rules": sum(len(values) for values in merged_rules.values()),
-            "domain_count": len(merged_rules["domain"]),
-            "domain_suffix_count": len(merged_rules["domain_suffix"]),
-            "ip_cidr_count": len(merged_rules["ip_cidr"]),
-            "process_name_count": len(merged_rules["process_name"]),
-            "domain_regex_count": len(merged_rules["domain_regex"])
+            "filtered_count": removed["domain"],
+            "removed_counts": removed,
+            "total_rules": sum(counts.values()),
+            "domain_count": counts["domain"],
+            "domain_suffix_count": counts["domain_suffix"],
+            "domain_keyword_count": counts["domain_keyword"],
+            "ip_cidr_count": counts["ip_cidr"],
+            "process_name_count": counts["process_name"],
+            "domain_regex_count": counts["domain_regex"]
         }
 
+    @profiled('decompile')
     def decompile_srs_to_json(self, srs_file_url):
         """
-        处理远程 .srs 文件，下载并使用 sing-box 的 decompile 命令转换为 JSON 文件。
+        处理远程 .srs 文件。优先使用内置解码器在内存中解析，
+        包含不支持的规则项时下载并使用 sing-box 的 decompile 命令转换为 JSON 文件。
         """
+        if config.native_srs:
+            try:
+                return srs.read_rule_set(fetcher.get(srs_file_url))
+            except srs.UnsupportedRuleError as e:
+                logging.info(f"{srs_file_url} 回退到 sing-box 解编译: {e}")
+            except Exception as e:
+                logging.error(f"处理 SRS 文件 {srs_file_url} 时出错: {e}")
+                return None
+
         try:
             # 下载 .srs 文件到临时目录
             srs_file = self.download_srs_file(srs_file_url)
@@ -448,34 +580,15 @@ class RuleParser:
                 json_file = self.parse_littlesnitch_file(link)
                 return json_file
 
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                results = list(executor.map(parse_and_convert_to_dataframe, [link]))
-                dfs = [df for df, rules in results]
-                rules_list = [rules for df, rules in results]
-                df = pd.concat(dfs, ignore_index=True)
-
-            logging.debug(f"生成的 DataFrame: {df.head()}")
-            df = df[~df['pattern'].str.contains('IP-CIDR6')].reset_index(drop=True)
-            df = df[~df['pattern'].str.contains('#')].reset_index(drop=True)
-            df = df[df['pattern'].isin(config.map_dict.keys())].reset_index(drop=True)
-            df = df.drop_duplicates().reset_index(drop=True)
-            df['pattern'] = df['pattern'].replace(config.map_dict)
+            buckets, logical_rules = parse_rule_text(link)
 
             result_rules = {"version": 1, "rules": []}
-            domain_entries = []
-            for pattern, addresses in df.groupby('pattern')['address'].apply(list).to_dict().items():
-                if pattern == 'domain_suffix':
-                    rule_entry = {pattern: [address.strip() for address in addresses]}
-                    result_rules["rules"].append(rule_entry)
-                elif pattern == 'domain':
-                    domain_entries.extend([address.strip() for address in addresses])
-                else:
-                    rule_entry = {pattern: [address.strip() for address in addresses]}
-                    result_rules["rules"].append(rule_entry)
-
-            domain_entries = list(set(domain_entries))
-            if domain_entries:
-                result_rules["rules"].insert(0, {'domain': domain_entries})
+            if buckets.get('domain'):
+                result_rules["rules"].append({'domain': list(buckets['domain'])})
+            for category in sorted(buckets):
+                if category != 'domain':
+                    result_rules["rules"].append({category: list(buckets[category])})
+            result_rules["rules"].extend(logical_rules)
 
             logging.debug(f"生成的 JSON 数据: {result_rules}")
             return result_rules
@@ -484,15 +597,19 @@ class RuleParser:
             logging.error(f"解析链接 {link} 出现错误: {e}")
             return None
 
-    def process_category_files(self, directory):
-        # 找到包含 category 的文件并按类别分组
-        category_files = [f for f in os.listdir(directory) if "category" in f and f.endswith('.json')]
+    def process_category_files(self, directory, groups=None):
+        # 找到包含 category 的文件并按类别分组，groups 不为空时只处理其中的构建组
+        candidates = set(os.listdir(directory)) | {
+            os.path.basename(path) for path in self.rule_sets
+            if os.path.dirname(path) == os.path.normpath(directory)
+        }
+        category_files = [f for f in sorted(candidates) if "category" in f and f.endswith('.json')
+                          and (groups is None or rule_set_group(f[:-len('.json')]) in groups)]
         grouped_files = defaultdict(list)
 
         # 按类别分组文件，例如 geoip-category-communitaion.json -> geoip-category-communitaion
         for file in category_files:
-            base_name = file.split("@")[0].replace(".json", "")
-            grouped_files[base_name].append(file)
+            grouped_files[category_key(file)].append(file)
 
         # 分别处理每一组文件
         for category, files in grouped_files.items():
@@ -512,7 +629,7 @@ class RuleParser:
 
         # 加载全体文件
         general_file_path = os.path.join(directory, general_files[0])
-        general_data = load_json(general_file_path).get("rules", [])
+        general_data = RuleSet(self.load_rule_set(general_file_path))
 
         # 如果同时有 @cn 和 @!cn 文件
         if cn_files and non_cn_files:
@@ -520,170 +637,263 @@ class RuleParser:
             cn_path = os.path.join(directory, cn_files[0])
             non_cn_path = os.path.join(directory, non_cn_files[0])
 
-            cn_data = load_json(cn_path).get("rules", [])
+            cn_data = self.load_rule_set(cn_path)
 
             # 从全体文件中剔除 cn 文件的规则，剩余部分保存到 非cn 文件
-            updated_non_cn_data = subtract_rules(general_data, cn_data)
-
-            # @!cn 文件已存在，增量更新.
-            non_cn_data = load_json(non_cn_path).get("rules", [])
-            updated_non_cn_data = merge_rules(non_cn_data, updated_non_cn_data)
+            non_cn_data = subtract_rule_set(general_data, RuleSet(cn_data))
 
-            # !cn 增量更新，cn不变
-            final_non_cn_data = updated_non_cn_data
-            final_cn_data = cn_data
-
-            final_non_cn_data = deduplicate_json(final_non_cn_data)
-            final_non_cn_data = convert_sets_to_lists(final_non_cn_data)
+            # @!cn 文件已存在，增量更新，cn不变
+            non_cn_data.update(RuleSet(self.load_rule_set(non_cn_path)))
+            deduplicate_rule_set(non_cn_data)
 
             # 保存去重后的非cn文件
-            save_json(final_non_cn_data, non_cn_path)
-            save_json(final_cn_data, cn_path)
+            self.save_rule_set(non_cn_path, non_cn_data.to_rules())
+            self.save_rule_set(cn_path, cn_data)
 
         # 只有 @cn 文件
         elif cn_files and not non_cn_files:
             cn_path = os.path.join(directory, cn_files[0])
-            cn_data = load_json(cn_path).get("rules", [])
+            cn_data = self.load_rule_set(cn_path)
 
-            # 从全体文件中剔除 cn 文件的规则，剩余部分保存到 非cn 文件
-            non_cn_data = subtract_rules(general_data, cn_data)
+            # 从全体文件中剔除 cn 文件的规则，剩余部分保存到 非cn 文件，无须去重
+            non_cn_data = subtract_rule_set(general_data, RuleSet(cn_data))
             non_cn_path = os.path.join(directory, f"{category}@!cn.json")
 
-            final_non_cn_data = non_cn_data  # 保存非cn数据
-            final_cn_data = cn_data  # 保留原始的cn数据
-
-            # 无须去重
-            save_json(final_non_cn_data, non_cn_path)
-            save_json(final_cn_data, cn_path)
+            self.save_rule_set(non_cn_path, non_cn_data.to_rules())
+            self.save_rule_set(cn_path, cn_data)  # 保留原始的cn数据
 
         # 只有 @!cn 文件
         elif non_cn_files and not cn_files:
             non_cn_path = os.path.join(directory, non_cn_files[0])
-            non_cn_data = load_json(non_cn_path).get("rules", [])
+            non_cn_data = self.load_rule_set(non_cn_path)
 
-            # 从全体文件中剔除 非cn 文件的规则，更新 cn 文件
-            cn_data = subtract_rules(general_data, non_cn_data)
+            # 从全体文件中剔除 非cn 文件的规则，更新 cn 文件，无须去重
+            cn_data = subtract_rule_set(general_data, RuleSet(non_cn_data))
             cn_path = os.path.join(directory, f"{category}@cn.json")
 
-            final_non_cn_data = non_cn_data  # 保留原始的非cn数据
-            final_cn_data = cn_data  # 更新后的cn数据
-
-            # 无须去重
-            save_json(final_non_cn_data, non_cn_path)
-            save_json(final_cn_data, cn_path)
+            self.save_rule_set(non_cn_path, non_cn_data)  # 保留原始的非cn数据
+            self.save_rule_set(cn_path, cn_data.to_rules())
 
         else:
             logging.info(f"跳过处理 {category}，因为没有 @cn 或 @!cn 文件")
             return
 
         try:
-            os.remove(general_file_path)
+            self.discard_rule_set(general_file_path)
         except OSError as e:
             logging.error(f"删除全体文件 {general_files[0]} 失败: {e}")
 
-    def main(self):
+    def plan_build(self, source_directory, yaml_files, manifest, full_rebuild=False):
+        """
+        计算每个构建组的输入指纹，返回 (需要重建的构建组 -> 输入指纹, 全部构建组)。
+        """
+        sources = defaultdict(dict)
+        upstreams = defaultdict(dict)
+        for yaml_file in yaml_files:
+            yaml_file_path = os.path.join(source_directory, yaml_file)
+            group = rule_set_group(yaml_file.split('.')[0])
+            sources[group][yaml_file] = file_digest(yaml_file_path)
+            for link in read_source_links(yaml_file_path):
+                upstreams[group][link] = fetcher.digest(link)
+
+        dirty_groups = {}
+        for group in sources:
+            inputs = BuildManifest.input_digest(sources[group], upstreams[group])
+            if full_rebuild or not manifest.is_up_to_date(group, inputs):
+                dirty_groups[group] = inputs
+            else:
+                logging.info(f"跳过未变化的规则集: {group}")
+
+        logging.info(f"增量构建: 需要重建 {len(dirty_groups)}/{len(sources)} 个构建组")
+        return dirty_groups, set(sources)
+
+    def main(self, full_rebuild=not config.incremental_build, jobs=None):
         #### 解析规则，生成sing-box规则集
         source_directory = config.source_dir
         output_directory = config.singbox_output_directory
-        if os.path.exists(output_directory):
-            shutil.rmtree(output_directory)
-        os.makedirs(output_directory)
+        os.makedirs(output_directory, exist_ok=True)
         yaml_files = [f for f in os.listdir(source_directory) if f.endswith('.yaml')]
-        for yaml_file in yaml_files:
+
+        # 解析前统一并发下载所有源文件中的上游链接
+        with profiler.span('download'):
+            fetcher.prefetch(collect_source_links(source_directory))
+
+        # 对比构建清单，只重建输入发生变化的构建组，并清理它们及已删除规则集的旧产物
+        manifest = BuildManifest()
+        with profiler.span('plan'):
+            dirty_groups, all_groups = self.plan_build(source_directory, yaml_files, manifest, full_rebuild)
+        for path in set(list_group_outputs(dirty_groups)) | set(manifest.prune(all_groups)):
+            if os.path.exists(path):
+                os.remove(path)
+
+        #### 并行构建：解析合并 → category 拆分 → 写出 sing-box JSON/SRS 及 Surge/Shadowrocket/Clash/MRS 规则
+        compile_scheduler = CompileScheduler()
+        build = BuildScheduler(max_workers=jobs, initializer=fetcher.after_fork)
+        self.schedule_build(build, compile_scheduler, source_directory, output_directory, yaml_files, dirty_groups)
+        # 被多个规则集引用的上游先在主进程中解析一次，工作进程 fork 后共享
+        upstream_store.warm(self.parse_link_file_to_json, {'adguard': parse_adguard_link})
+        failed_tasks = build.run()
+        upstream_store.report()
+        upstream_store.clear()
+
+        # 并行执行内置编码器无法处理的 SRS/MRS 编译任务
+        with profiler.span('compile'):
+            failed = compile_scheduler.run()
+        # 为全部产物生成预压缩副本、不可变副本与内容清单，只处理内容变化的产物
+        if config.publish_artifacts:
+            with profiler.span('publish'):
+                publish_artifacts()
+        self.report_profile(build)
+
+        # 记录本次重建的构建组的输入指纹与产物哈希，构建或编译失败的构建组下次重新构建
+        failed_groups = {rule_set_group(os.path.splitext(os.path.basename(job["name"]))[0]) for job in failed}
+        failed_groups |= {rule_set_group(name.split(':', 1)[1]) for name in failed_tasks}
+        for group, inputs in dirty_groups.items():
+            if group not in failed_groups:
+                manifest.update(group, inputs, list_group_outputs({group}))
+        manifest.save()
+
+    def schedule_build(self, build, compile_scheduler, source_directory, output_directory, yaml_files, groups):
+        """
+        把需要重建的规则集登记为 DAG 任务: build:<规则集> → emit:<规则集>。
+        category 规则集需要等同组全部构建完成后执行 split:<category>，再分别 emit。
+        任务结果 (规则集与性能剖析记录) 回到主进程汇总，emit 产生的回退编译命令交给 compile_scheduler。
+        """
+        categories = defaultdict(list)
+
+        def absorb(result):
+            self.rule_sets.update(result.get("rule_sets", {}))
+            profiler.merge(result["profile"])
+
+        def on_emitted(result):
+            profiler.merge(result["profile"])
+            for name, command in result["jobs"]:
+                compile_scheduler.submit(name, command)
+
+        def add_emit(path):
+            key = os.path.normpath(path)
+            build.add(f"emit:{os.path.basename(path)[:-len('.json')]}", emit_rule_set_task,
+                      prepare=lambda: (path, self.rule_sets.pop(key, None)), on_done=on_emitted)
+
+        for yaml_file in sorted(yaml_files):
+            stem = yaml_file.split('.')[0]
+            if rule_set_group(stem) not in groups:
+                continue
             print('正在处理{}'.format(yaml_file))
             yaml_file_path = os.path.join(source_directory, yaml_file)
             # 检查 adg文件
             if any(keyword in yaml_file for keyword in config.adg_keyword):
-                self.parse_adguard_file(yaml_file_path, output_directory)
-            else:
-                self.parse_yaml_file(yaml_file_path, output_directory)
+                upstream_store.reference(read_source_links(yaml_file_path), kind='adguard')
 
-        # 生成 SRS 文件
-        self.process_category_files(output_directory)  # 拆分!cn规则 与 cn规则
-        json_files = [f for f in os.listdir(output_directory) if f.endswith('.json')]
-
-        for json_file in json_files:
-            json_file_path = os.path.join(output_directory, json_file)
-            srs_path = json_file_path.replace(".json", ".srs")
-            os.system(f"sing-box rule-set compile --output {srs_path} {json_file_path}")
-            logging.debug(f"成功生成 SRS 文件 {srs_path}")
-
-        #### 调用工具函数 将 sing-box 规则转化为 Surge/Shadowrocket 规则
-        convert_json_to_surge(output_directory)
-        convert_json_to_clash(output_directory)
-
-        convert_yaml_to_mrs(config.clash_output_directory)
+                def on_adguard(result, stem=stem):
+                    absorb(result)
+                    if result["stats"] is not None:
+                        logging.info(f"{stem} 规则整理完成:")
+                        self.log_rule_set_stats('adguard', result["stats"])
+                        add_emit(os.path.join(output_directory, f"{stem}.json"))
 
+                build.add(f"adguard:{stem}", adguard_task, (yaml_file_path, output_directory), on_done=on_adguard)
+                continue
 
-class SB_ConfigParser:
+            for result_type, links, output_file, rule_set_name in self.plan_yaml_file(yaml_file_path, output_directory):
+                name = os.path.basename(output_file)
+                upstream_store.reference(links)
+
+                def on_built(result, result_type=result_type, output_file=output_file, rule_set_name=rule_set_name):
+                    absorb(result)
+                    logging.info(f"{rule_set_name} 规则整理完成:")
+                    self.log_rule_set_stats(result_type, result["stats"])
+                    if "category" not in os.path.basename(output_file):
+                        add_emit(output_file)
+
+                build.add(f"build:{name[:-len('.json')]}", build_rule_set_task,
+                          (links, output_file, rule_set_name, result_type), on_done=on_built)
+                if "category" in name:
+                    categories[category_key(name)].append(name)
+
+        # 拆分!cn规则 与 cn规则
+        for category, files in categories.items():
+            def prepare_split(category=category, files=files):
+                paths = [os.path.normpath(os.path.join(output_directory, f)) for f in files]
+                return output_directory, category, files, {
+                    path: self.rule_sets.pop(path) for path in paths if path in self.rule_sets
+                }
+
+            def on_split(result, category=category, files=files):
+                absorb(result)
+                for name in sorted(set(files) | {f"{category}@cn.json", f"{category}@!cn.json"}):
+                    path = os.path.join(output_directory, name)
+                    if os.path.normpath(path) in self.rule_sets or os.path.exists(path):
+                        add_emit(path)
+
+            build.add(f"split:{category}", split_category_task,
+                      deps=[f"build:{f[:-len('.json')]}" for f in files], prepare=prepare_split, on_done=on_split)
+
+    def report_profile(self, build):
+        """ 输出各阶段耗时汇总表，并导出性能剖析 JSON 与可选的 Chrome trace """
+        task_time = sum(span["end"] - span["start"] for span in profiler.spans
+                        if span["name"] in ('build', 'split', 'emit_task', 'adguard'))
+        summary = (
+            f"并行构建: 进程数 {build.max_workers}, 墙钟 {build.elapsed:.3f}s, 任务累计 {task_time:.3f}s, "
+            f"并行度 {task_time / build.elapsed if build.elapsed else 0:.2f}, 失败任务 {len(build.failed)}"
+        )
+        table = profiler.format_table()
+        logging.info("性能剖析:\n" + table + "\n" + summary)
+        print(table)
+        print(summary)
+        if config.profile_file:
+            profiler.export_json(config.profile_file)
+        if config.trace_file:
+            profiler.export_chrome_trace(config.trace_file)
+
+
+def category_key(filename):
+    """ category 规则集的分组名，例如 geoip-category-communication@cn.json -> geoip-category-communication """
+    return filename.split("@")[0].replace(".json", "")
+
+
+def build_rule_set_task(links, output_file, rule_set_name, type):
+    """ 工作进程: 解析并合并单个规则集 """
+    parser = RuleParser()
+    with profiler.capture() as captured, profiler.span('build', rule_set=os.path.basename(output_file)):
+        stats = parser.generate_with_peak_rss(links, output_file, rule_set_name, type=type)
+    return {"rule_sets": parser.rule_sets, "stats": stats, "profile": captured}
+
+
+def adguard_task(yaml_file_path, output_directory):
+    """ 工作进程: 解析 AdGuard 过滤列表并合并为单个规则集 """
+    parser = RuleParser()
+    with profiler.capture() as captured, profiler.span('adguard', source=os.path.basename(yaml_file_path)):
+        stats = parser.parse_adguard_file(yaml_file_path, output_directory)
+    return {"rule_sets": parser.rule_sets, "stats": stats, "profile": captured}
+
+
+def split_category_task(directory, category, files, rule_sets):
+    """ 工作进程: 拆分同一 category 的 cn / !cn 规则集，未在 rule_sets 中的规则集从磁盘读取 """
+    parser = RuleParser()
+    parser.rule_sets = rule_sets
+    with profiler.capture() as captured, profiler.span('split', category=category):
+        parser.process_single_category(directory, category, files)
+    return {"rule_sets": parser.rule_sets, "profile": captured}
+
+
+def emit_rule_set_task(path, rules):
+    """ 工作进程: 写出单个规则集的全部目标格式，返回需要回退到外部程序的编译命令 """
+    parser = RuleParser()
+    scheduler = CompileScheduler()
+    with profiler.capture() as captured, profiler.span('emit_task', rule_set=os.path.basename(path)):
+        if rules is not None:
+            parser.save_rule_set(path, rules)
+        parser.emit_rule_sets([path], scheduler)
+    return {"jobs": scheduler.jobs, "profile": captured}
+
+
+class SB_ConfigParser(RouteBuilder):
     def __init__(self):
         self.config = config
 
     def generate_singbox_route(self):
-        # 固定字段
-        fixed_rules = [
-            {"inbound": ["tun-in", "mixed-in"], "action": "sniff", "timeout": "1s"},
-            {"clash_mode": "全局代理", "action": "route", "outbound": "默认代理"},
-            {"clash_mode": "全局直连", "action": "route", "outbound": "直连"},
-            {"protocol": "dns", "action": "hijack-dns"},
-            {"port": 853, "network": "tcp", "action": "reject", "method": "default", "no_drop": False},
-            {"port": 443, "network": "udp", "action": "reject", "method": "default", "no_drop": False}
-        ]
-
-        # 动态生成的规则
-        rules = []
-        rule_set = []
-
-        for file in os.listdir('./rule/singbox'):
-            if file.endswith('.srs'):
-                tag = os.path.splitext(file)[0]
-                # 添加规则集
-                rule_set.append({
-                    "tag": tag,
-                    "type": "remote",
-                    "format": "binary",
-                    "url": f"https://raw.githubusercontent.com/vstar37/proxy-ruleset-manager/main/rule/singbox/{file}",
-                    "download_detour": "下载 (海外服务)"
-                })
-
-                # 排除 fakeip 和 @cn规则
-                if 'fakeip' in tag or 'geolocation-!cn' in tag or '@cn' in tag:
-                    continue
-
-                # 判断规则类型并生成相应的动作, blocker 默认使用 adguard-blocker@default
-                if 'adguard-blocker@default' in tag:
-                    rules.append({"rule_set": [tag], "action": "reject", "method": "default", "no_drop": False})
-                elif 'direct' in tag or '@cn' in tag:
-                    rules.append({"rule_set": [tag], "action": "route", "outbound": "直连"})
-                elif 'category' in tag or 'process' in tag:
-                    outbound = self.determine_outbound(tag)
-                    if outbound:  # 只在命中时添加
-                        rules.append({"rule_set": [tag], "action": "route", "outbound": outbound})
-
-                elif 'geoip-geolocation' in tag:
-                    match = re.search(r'geoip-geolocation-(\w+)', tag)  # 匹配 'geoip-geolocation-' 后的国家代码
-                    if match:
-                        country_code = match.group(1)  # 提取国家编号（如 jp）
-                        outbound = self.determine_geolocation_outbound(country_code)  # 根据国家编号确定 outbound
-                        rules.append({"rule_set": [tag], "action": "route", "outbound": outbound})
-
-        # 合并 geosite 和 geoip 规则
-        rules = self.merge_geosite_geoip_rules(rules)
-
-        # 组合所有规则
-        all_rules = fixed_rules + rules
-
-        # 按规则分类排序
-        all_rules = sorted(all_rules, key=self.rule_priority)
-
-        route_config = {
-            "route": {
-                "rules": all_rules,
-                "rule_set": rule_set,
-                "auto_detect_interface": True,
-                "final": "默认代理"
-            }
-        }
+        route_config = {"route": self.build_route()}
         # 写入带换行的紧凑 JSON
         with open('./src/config/singbox/sb_route.json', 'w', encoding='utf-8') as f:
             json.dump(route_config, f, ensure_ascii=False, separators=(',', ':'), indent=2)
@@ -716,110 +926,27 @@ class SB_ConfigParser:
             logging.error(f"❌ sing-box 配置合并失败，错误码 {result.returncode}")
             logging.error(f"stderr: {result.stderr}")
 
-    def merge_geosite_geoip_rules(self, rules):
-        """检查并合并 geosite 和 geoip 规则"""
-        merged_rules = []
-        seen_tags = set()
-
-        for rule in rules:
-            rule_set = rule.get('rule_set', [])
-            if not rule_set:
-                merged_rules.append(rule)
-                continue
-
-            tag = rule_set[0]
-            if tag in seen_tags:
-                continue
-
-            # 尝试找出对应的 geosite 和 geoip 规则
-            geosite_tag = tag.replace('geoip', 'geosite')
-            geoip_tag = tag.replace('geosite', 'geoip')
-
-            # 检查是否有相同的规则
-            matching_rule = None
-            for r in merged_rules:
-                if geosite_tag in r.get('rule_set', []) or geoip_tag in r.get('rule_set', []):
-                    matching_rule = r
-                    break
-
-            if matching_rule:
-                # 如果有匹配的规则，将当前规则的 tags 合并
-                matching_rule['rule_set'].extend(rule_set)
-            else:
-                # 没有匹配的规则，直接添加当前规则
-                merged_rules.append(rule)
-
-            seen_tags.add(tag)
-
-        return merged_rules
-
-    def determine_outbound(self, tag):
-        # 根据tag关键字确定outbound
-        if 'video' in tag and '!cn' in tag:
-            return "影音 (海外服务)"
-        if 'download' in tag and '!cn' in tag:
-            return "下载 (海外服务)"
-        if 'communication' in tag and '!cn' in tag:
-            return "通信 (海外服务)"
-        if 'game' in tag and '!cn' in tag:
-            return  "游戏 (海外服务)"
-        if 'vpn' in tag and '!cn' in tag:
-            return "VPN (区域伪装)"
-        if 'media' in tag and '!cn' in tag:
-            return  "媒体 (海外服务)"
-        if 'nsfw' in tag and '!cn' in tag:
-            return "成人 (过滤服务)"
-        if 'direct' in tag:
-            return "直连"
-        else:
-            return None
-
-    def rule_priority(self, rule):
-        # 定义规则的优先级
-        if "inbound" in rule:
-            return 0
-        if "clash_mode" in rule:
-            return 1
-        if "protocol" in rule:
-            return 2
-        if "port" in rule:
-            return 3
-        if "rule_set" in rule:
-            if 'blocker' in rule["rule_set"][0] and 'process' not in rule["rule_set"][0]:
-                return 4
-            if '@cn' in rule["rule_set"][0]:
-                return 5
-            if 'category' in rule["rule_set"][0] and 'direct' not in rule["rule_set"][0]:
-                return 6
-            if 'geolocation' in rule["rule_set"][0]:
-                return 7
-            if 'direct' in rule["rule_set"][0] and 'process' not in rule["rule_set"][0]:
-                return 8
-            if 'process' in rule["rule_set"][0]:
-                return 9
-            return 10
-        return 11
-
-    def determine_geolocation_outbound(self, country_code):
-        # 根据国家编号确定outbound
-        geolocation_map = {
-            'jp': '日本线路',
-            'us': '美国线路',
-            'cn': '大陆线路',
-            'uk': '香港线路',
-            'eu': '欧洲线路',
-            'hk': '香港线路',
-            'kr': '韩国线路',
-            'tw': '台湾线路'
-            # 可以添加更多国家映射
-        }
-        return geolocation_map.get(country_code, "Other")
-
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="多格式规则集构建工具")
+    arg_parser.add_argument('--offline', action='store_true', help="离线模式，仅使用 HTTP 缓存中的上游内容构建")
+    arg_parser.add_argument('--full-rebuild', action='store_true', help="忽略构建清单，重建全部规则集")
+    arg_parser.add_argument('--external-merge', action='store_true', help="使用外部归并合并规则集，限制内存占用")
+    arg_parser.add_argument('--merge-memory-limit', type=int, metavar='MB', help="外部归并的内存缓冲区上限 (MB)")
+    arg_parser.add_argument('--jobs', '-j', type=int, metavar='N', help="并行构建规则集的进程数，默认使用 CPU 核数")
+    arg_parser.add_argument('--profile', metavar='PATH', help=f"性能剖析 JSON 的输出路径，默认 {config.profile_file}")
+    arg_parser.add_argument('--trace', metavar='PATH', help="同时导出 Chrome trace 文件 (chrome://tracing 或 Perfetto 打开)")
+    args = arg_parser.parse_args()
+    fetcher.offline = args.offline or config.offline
+    config.external_merge = args.external_merge or config.external_merge
+    if args.merge_memory_limit:
+        config.merge_memory_limit = args.merge_memory_limit * 1024 * 1024
+    config.profile_file = args.profile or config.profile_file
+    config.trace_file = args.trace or config.trace_file
+
     # 使用类的实例
     rule_parser = RuleParser()
-    rule_parser.main()
+    rule_parser.main(full_rebuild=args.full_rebuild or not config.incremental_build, jobs=args.jobs)
 
     SB_ConfigParser = SB_ConfigParser()
     SB_ConfigParser.generate_singbox_route()
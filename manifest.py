@@ -0,0 +1,146 @@
+# manifest.py
+
+import hashlib
+import json
+import logging
+import os
+
+from config import Config
+
+config = Config()
+
+# 规则文件名中表示规则类型的前缀
+RULE_TYPE_PREFIXES = ('geosite-', 'geoip-', 'process-')
+# 决定产物内容的构建模块；benchmark.py、synthetic.py、query.py 等工具脚本的改动不会让增量构建失效
+BUILD_MODULES = ('main', 'utils', 'config', 'ruleset', 'keywords', 'srs', 'mrs', 'adguard', 'merger', 'upstream',
+                 'publish')
+# 预压缩副本的扩展名，副本由 publish.py 按内容清单管理，不属于任何构建组
+COMPRESSED_EXTENSIONS = ('.gz', '.zst')
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path):
+    """计算文件内容的 sha256，文件不存在时返回 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def code_digest():
+    """构建代码的指纹，决定产物内容的模块变化时所有规则集都需要重新生成"""
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in sorted(BUILD_MODULES):
+        path = os.path.join(directory, f"{module}.py")
+        digest.update(os.path.basename(path).encode('utf-8'))
+        digest.update((file_digest(path) or '').encode('utf-8'))
+    return digest.hexdigest()
+
+
+def rule_set_group(name):
+    """
+    返回规则集所属的构建组。category 规则集的 @cn / @!cn 拆分依赖同组的全体文件，
+    因此同一 category 的所有源文件作为一个整体重建；其他规则集各自成组。
+    name 可以是源文件名 (category-media@cn) 或输出文件名 (geosite-category-media@!cn)。
+    """
+    for prefix in RULE_TYPE_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return name.split('@')[0] if 'category' in name else name
+
+
+def output_directories():
+    return [
+        config.singbox_output_directory,
+        config.surge_output_directory,
+        config.shadowrocket_output_directory,
+        config.clash_output_directory
+    ]
+
+
+def list_group_outputs(groups):
+    """列出输出目录中属于指定构建组的所有产物路径"""
+    outputs = []
+    for directory in output_directories():
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            stem, ext = os.path.splitext(filename)
+            if ext and ext not in COMPRESSED_EXTENSIONS and rule_set_group(stem) in groups:
+                outputs.append(os.path.join(directory, filename))
+    return sorted(outputs)
+
+
+class BuildManifest:
+    """
+    增量构建清单：记录每个构建组的输入指纹 (源 YAML、上游内容、构建代码) 与产物哈希。
+    输入未变化且产物完好的构建组在下次运行时直接跳过。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config.build_manifest_file
+        self.code = code_digest()
+        self.groups = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('code') == self.code:
+                self.groups = data.get('groups', {})
+            else:
+                logging.info("构建代码已变化，忽略旧的构建清单")
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def input_digest(source_files, upstream_digests):
+        """
+        计算构建组的输入指纹。
+        source_files: {源文件名: 内容哈希}，upstream_digests: {链接: 内容哈希或 None}
+        """
+        digest = hashlib.sha256()
+        for name in sorted(source_files):
+            digest.update(f"source {name} {source_files[name]}\n".encode('utf-8'))
+        for url in sorted(upstream_digests):
+            digest.update(f"upstream {url} {upstream_digests[url]}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def is_up_to_date(self, group, inputs):
+        """输入指纹一致且记录的所有产物都存在且未被修改时返回 True"""
+        record = self.groups.get(group)
+        if not record or record.get('inputs') != inputs or not record.get('outputs'):
+            return False
+        return all(file_digest(path) == digest for path, digest in record['outputs'].items())
+
+    def recorded_outputs(self, group):
+        return list(self.groups.get(group, {}).get('outputs', {}))
+
+    def update(self, group, inputs, outputs):
+        self.groups[group] = {
+            'inputs': inputs,
+            'outputs': {path: file_digest(path) for path in outputs}
+        }
+
+    def prune(self, active_groups):
+        """移除已不存在的构建组，返回它们遗留的产物路径"""
+        stale = []
+        for group in list(self.groups):
+            if group not in active_groups:
+                stale.extend(self.recorded_outputs(group))
+                del self.groups[group]
+        return stale
+
+    def save(self):
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'code': self.code, 'groups': self.groups}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        except OSError as e:
+            logging.error(f"保存构建清单时出错: {e}")
@@ -0,0 +1,187 @@
+# merger.py
+"""
+超大规则集的外部归并：每个类别的条目先在有上限的内存缓冲区中去重，超过上限后排序溢写为磁盘上的有序分段，
+最后对各分段做多路归并并去重，按序流式产出，内存占用与规则集大小无关。
+"""
+
+import heapq
+import logging
+import os
+import re
+import shutil
+import tempfile
+from json.encoder import encode_basestring
+
+from config import Config
+
+config = Config()
+
+# 缓冲区中每个条目的额外开销估算值：str 对象头约 49 字节，set 槽位及排序时的列表约 32 字节
+ENTRY_OVERHEAD = 81
+# add 每批加入的条目数，缓冲区最多超出上限一批
+ADD_BATCH_SIZE = 8192
+_MISSING = object()
+# 分段文件每行一个条目，只转义反斜杠与换行
+_RUN_UNESCAPE = re.compile(r'\\(.)')
+
+
+def escape_run_value(value):
+    if '\\' in value or '\n' in value:
+        return value.replace('\\', '\\\\').replace('\n', '\\n')
+    return value
+
+
+def unescape_run_value(line):
+    if '\\' in line:
+        return _RUN_UNESCAPE.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), line)
+    return line
+
+
+class ExternalMerger:
+    """
+    按类别收集条目，缓冲区超过 memory_limit 字节后把每个类别排序溢写为一个分段文件。
+    merged(category) 对该类别的所有分段及剩余缓冲区做多路归并，按字典序产出去重后的条目，可多次调用。
+    """
+
+    def __init__(self, memory_limit=None, spill_dir=None):
+        self.memory_limit = memory_limit or config.merge_memory_limit
+        self.spill_dir = spill_dir or config.merge_spill_dir
+        self.buffers = {}
+        self.runs = {}
+        self.buffered_bytes = 0
+        self.spill_count = 0
+        self.spilled_bytes = 0
+        self.added = 0  # 加入的条目总数 (去重前)
+        self.tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, category, values):
+        """ 加入一个类别的条目，values 可以是字符串或字符串列表 """
+        if isinstance(values, str):
+            values = [values]
+        elif not isinstance(values, list):
+            values = list(values)
+        self.added += len(values)
+        buffer = self.buffers.setdefault(category, set())
+        # 按批更新缓冲区，每批之后检查一次内存上限
+        for start in range(0, len(values), ADD_BATCH_SIZE):
+            batch = values[start:start + ADD_BATCH_SIZE]
+            size = len(buffer)
+            buffer.update(batch)
+            added = len(buffer) - size
+            if added:
+                self.buffered_bytes += added * (sum(map(len, batch)) // len(batch) + ENTRY_OVERHEAD)
+                if self.buffered_bytes > self.memory_limit:
+                    self.spill()
+
+    def add_rules(self, rules, categories):
+        """ 加入 sing-box 规则列表中属于 categories 的条目 """
+        for rule in rules:
+            if isinstance(rule, dict):
+                for category, values in rule.items():
+                    if category in categories and values:
+                        self.add(category, values)
+
+    def spill(self):
+        """ 把所有缓冲区排序后写为分段文件并清空 """
+        if self.tmp_dir is None:
+            self.tmp_dir = tempfile.mkdtemp(prefix='merge-', dir=self.spill_dir)
+        for category, buffer in self.buffers.items():
+            buffer.discard('')
+            if not buffer:
+                continue
+            path = os.path.join(self.tmp_dir, f"{category}-{len(self.runs.get(category, []))}.run")
+            values = sorted(buffer)
+            text = '\n'.join(values)
+            # 绝大多数条目不含反斜杠与换行，整体检查一次即可跳过逐条转义
+            if '\\' in text or text.count('\n') != len(values) - 1:
+                text = '\n'.join(map(escape_run_value, values))
+            with open(path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(text + '\n')
+            del values, text
+            self.runs.setdefault(category, []).append(path)
+            self.spilled_bytes += os.path.getsize(path)
+            buffer.clear()
+        self.spill_count += 1
+        self.buffered_bytes = 0
+
+    @staticmethod
+    def _read_run(path):
+        with open(path, 'r', encoding='utf-8', newline='\n') as f:
+            for line in f:
+                yield unescape_run_value(line[:-1])
+
+    def merged(self, category):
+        """ 多路归并某个类别的全部分段，按字典序产出去重后的条目 """
+        sources = [self._read_run(path) for path in self.runs.get(category, [])]
+        buffer = self.buffers.get(category, set())
+        buffer.discard('')
+        sources.append(iter(sorted(buffer)))
+        previous = None
+        for value in heapq.merge(*sources):
+            if value != previous:
+                yield value
+                previous = value
+
+    def report(self, label):
+        if self.spill_count:
+            logging.info(
+                f"{label}: 外部归并溢写 {self.spill_count} 次, 分段 {sum(len(runs) for runs in self.runs.values())} 个, "
+                f"共 {self.spilled_bytes / 1024 / 1024:.2f} MB"
+            )
+
+    def close(self):
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            self.tmp_dir = None
+        self.buffers.clear()
+        self.runs.clear()
+
+
+# 各输出格式的流式写出片段: (开头, 第一条规则前, 规则之间, 规则开头 (含类别名占位), 条目之间, 规则结尾, 非空结尾, 空规则集结尾)
+# 与 utils.dumps_rule_set 的 pretty / compact / lines 输出逐字节一致
+_JSON_LAYOUTS = {
+    'pretty': ('{\n    "version": 1,\n    "rules": [', '\n', ',\n', '        {{\n            {}: [\n                ',
+               ',\n                ', '\n            ]\n        }', '\n    ]\n}', ']\n}'),
+    'compact': ('{"version":1,"rules":[', '', ',', '{{{}:[', ',', ']}', ']}', ']}'),
+    'lines': ('{"version":1,"rules":[', '\n', ',\n', '{{{}:[\n', ',\n', '\n]}', '\n]}\n', ']}\n'),
+}
+
+
+def write_rule_set_json(path, categories, profile=None):
+    """
+    流式写出 sing-box 规则集 JSON，格式由 config.json_profile 决定，与 utils.dumps_rule_set 的输出相同。
+    categories 为 [(类别, 字符串条目迭代器)]，空类别不输出。迭代器应已按字典序产出 (外部归并的输出即是)，
+    json_sort_rules 为 True 时列表、集合形式的条目在写出前排序。返回各类别写出的条目数。
+    """
+    head, first_sep, rule_sep, rule_open, value_sep, rule_close, tail, empty_tail = \
+        _JSON_LAYOUTS[profile or config.json_profile]
+    counts = {}
+    wrote_rule = False
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(head)
+        for category, values in categories:
+            if config.json_sort_rules and isinstance(values, (list, tuple, set, frozenset)):
+                values = sorted(values)
+            values = iter(values)
+            first = next(values, _MISSING)
+            if first is _MISSING:
+                counts[category] = 0
+                continue
+            f.write(rule_sep if wrote_rule else first_sep)
+            f.write(rule_open.format(encode_basestring(category)))
+            f.write(encode_basestring(first))
+            count = 1
+            for value in values:
+                f.write(value_sep + encode_basestring(value))
+                count += 1
+            f.write(rule_close)
+            counts[category] = count
+            wrote_rule = True
+        f.write(tail if wrote_rule else empty_tail)
+    return counts
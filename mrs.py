@@ -0,0 +1,106 @@
+# mrs.py
+"""
+mihomo 规则集二进制格式 (.mrs) 的编码，支持 domain 与 ipcidr 两种 behavior。
+
+文件为 zstd 压缩流，内容: "MRS" + 版本号 1 + behavior (1 字节) + int64 规则数量 + int64 附加数据长度，
+之后是 domain 的 succinct trie (与 sing-box 结构相同，但长度字段为 int64) 或 ipcidr 的地址区间列表。
+规则数量与条目的合法性判断与 mihomo 的 convert-ruleset 保持一致。
+zstandard 为可选依赖，未安装时 available() 返回 False，由调用方回退到 mihomo 可执行文件。
+"""
+
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from srs import build_succinct_set
+from utils import cidr_ranges
+
+MAGIC = b'MRS\x01'
+BEHAVIORS = {'domain': 0, 'ipcidr': 1}
+# 接近 mihomo 使用的 SpeedBestCompression
+ZSTD_LEVEL = 11
+
+
+def available():
+    return zstandard is not None
+
+
+def split_domain(domain):
+    """ 与 mihomo 的 ValidAndSplitDomain 一致：转为小写并按 . 切分，非法域名返回 None """
+    if not domain or domain[-1] == '.' or domain[0].isspace() or domain[-1].isspace():
+        return None
+    parts = domain.lower().split('.')
+    if len(parts) == 1:
+        return parts
+    if any(part == '' for part in parts[1:]):
+        return None
+    return parts
+
+
+def domain_trie_entries(items):
+    """
+    模拟 mihomo DomainTrie 的插入与遍历，返回 (遍历得到的域名集合, 成功插入的条目数)。
+    "+.example.com" 同时插入 example.com 与 .example.com，遍历时以 . 开头的域名输出为 "+." 形式。
+    """
+    domains = set()
+    count = 0
+    for item in items:
+        # 混入 domain 规则集的 CIDR 被 mihomo 直接丢弃
+        parts = None if '/' in item else split_domain(item)
+        if parts is None:
+            continue
+        count += 1
+        if parts[0] == '+':
+            domains.add('.'.join(parts[1:]))
+            parts[0] = ''
+        domain = '.'.join(parts)
+        domains.add('+' + domain if domain.startswith('.') else domain)
+    domains.discard('')
+    return domains, count
+
+
+def encode_domain_set(items):
+    domains, count = domain_trie_entries(items)
+    leaves, label_bitmap, labels = build_succinct_set(sorted(domain[::-1].encode('utf-8') for domain in domains))
+    buffer = bytearray([1])
+    for words in (leaves, label_bitmap):
+        buffer += struct.pack(f'>q{len(words)}Q', len(words), *words)
+    buffer += struct.pack('>q', len(labels)) + labels
+    return count, bytes(buffer)
+
+
+def encode_ipcidr_set(items):
+    """ 只接受带前缀长度的 CIDR (netip.ParsePrefix)，合并后按 IPv4、IPv6 顺序写出 16 字节地址区间 """
+    cidrs = [item for item in items if '/' in item]
+    ranges, invalid = cidr_ranges(cidrs)
+    count = len(cidrs) - len(invalid)
+    buffer = bytearray([1])
+    buffer += struct.pack('>q', len(ranges[4]) + len(ranges[6]))
+    for version, offset in ((4, 0xFFFF << 32), (6, 0)):
+        for start, end in ranges[version]:
+            buffer += (offset | start).to_bytes(16, 'big') + (offset | end).to_bytes(16, 'big')
+    return count, bytes(buffer)
+
+
+def encode_payload(behavior, items):
+    """ 生成 zstd 压缩前的 .mrs 数据，没有有效规则时返回 None (mihomo 此时报错 empty rule) """
+    encoder = encode_domain_set if behavior == 'domain' else encode_ipcidr_set
+    count, body = encoder(items)
+    if count == 0:
+        return None
+    return MAGIC + bytes([BEHAVIORS[behavior]]) + struct.pack('>qq', count, 0) + body
+
+
+def compile_rule_set(behavior, items, output_path):
+    """
+    由 Clash payload 条目直接生成 .mrs 文件，返回写入的字节数。
+    没有有效规则时与 mihomo 一样留下空文件。
+    """
+    payload = encode_payload(behavior, items)
+    data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload) if payload else b''
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return len(data)
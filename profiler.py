@@ -0,0 +1,222 @@
+# profiler.py
+"""
+构建流程的性能剖析：记录各阶段的时间段 (span)、计数器与峰值内存，
+导出为 JSON 及可选的 Chrome trace (chrome://tracing 或 Perfetto 可直接打开)，并在构建结束时输出汇总表。
+工作进程中的记录由 capture() 取出，随任务结果返回主进程后 merge。
+"""
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from config import Config
+
+config = Config()
+
+
+def peak_rss():
+    """ 当前进程的峰值常驻内存 (字节)，平台不支持时返回 None """
+    try:
+        # Linux 上 VmHWM 可以被 reset_peak_rss 重置，getrusage 的 ru_maxrss 不行
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    """ 重置峰值常驻内存 (Linux 4.0+)，成功时返回 True，之后的 peak_rss() 只统计重置后的峰值 """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class Profiler:
+    """
+    span 可以嵌套，每个 span 同时记录总耗时与自身耗时 (扣除内层 span)，嵌套关系按线程分别维护。
+    每个 span 结束时采样一次进程的峰值 RSS。
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.spans = []
+        self.counters = defaultdict(int)
+        self.memory = []  # [(时间, pid, 峰值 RSS)]
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """ 记录一个时间段，yield 出的 args 字典可以在 with 块中补充附加信息 """
+        stack = self._stack()
+        frame = [0.0]  # 内层 span 的耗时
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            if stack:
+                stack[-1][0] += end - start
+            rss = peak_rss()
+            pid = os.getpid()
+            with self._lock:
+                self.spans.append({
+                    "name": name, "start": start, "end": end, "self": end - start - frame[0],
+                    "pid": pid, "tid": threading.get_ident(), "args": args
+                })
+                if rss is not None:
+                    self.memory.append((end, pid, rss))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    @contextlib.contextmanager
+    def capture(self):
+        """
+        暂存已有的记录，with 块结束时把块内产生的记录填入 yield 出的字典并恢复原有记录。
+        用于工作进程任务：返回值中携带该字典，主进程调用 merge 合并。
+        """
+        with self._lock:
+            saved = self.spans, self.counters, self.memory
+            self.reset()
+        captured = {}
+        try:
+            yield captured
+        finally:
+            with self._lock:
+                captured.update(spans=self.spans, counters=dict(self.counters), memory=self.memory)
+                self.spans, self.counters, self.memory = saved
+
+    def merge(self, captured):
+        with self._lock:
+            self.spans.extend(captured.get("spans", ()))
+            for name, value in captured.get("counters", {}).items():
+                self.counters[name] += value
+            self.memory.extend(captured.get("memory", ()))
+
+    def summary(self):
+        """ 按 span 名称汇总: [(名称, 次数, 总耗时, 自身耗时, 最长耗时)]，按自身耗时降序 """
+        stats = {}
+        for span in self.spans:
+            elapsed = span["end"] - span["start"]
+            row = stats.setdefault(span["name"], [span["name"], 0, 0.0, 0.0, 0.0])
+            row[1] += 1
+            row[2] += elapsed
+            row[3] += span["self"]
+            row[4] = max(row[4], elapsed)
+        return sorted((tuple(row) for row in stats.values()), key=lambda row: -row[3])
+
+    def peak_memory(self):
+        """ 返回 {pid: 峰值 RSS 字节} """
+        peaks = {}
+        for _, pid, rss in self.memory:
+            peaks[pid] = max(peaks.get(pid, 0), rss)
+        return peaks
+
+    def to_dict(self):
+        peaks = self.peak_memory()
+        return {
+            "wall_time": time.perf_counter() - self.origin,
+            "stages": [
+                {"name": name, "count": count, "total": total, "self": self_time, "max": longest}
+                for name, count, total, self_time, longest in self.summary()
+            ],
+            "counters": dict(sorted(self.counters.items())),
+            "peak_rss": max(peaks.values(), default=None),
+            "peak_rss_by_pid": {str(pid): rss for pid, rss in sorted(peaks.items())},
+            "spans": [
+                dict(span, start=span["start"] - self.origin, end=span["end"] - self.origin)
+                for span in sorted(self.spans, key=lambda span: span["start"])
+            ]
+        }
+
+    def export_json(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2, default=str)
+        logging.info(f"性能剖析结果已写入 {path}")
+
+    def export_chrome_trace(self, path):
+        """ 导出 Chrome trace event 格式：span 为完整事件，峰值 RSS 为计数器事件 """
+        main_pid = os.getpid()
+        events = [
+            {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "main" if pid == main_pid else f"worker {pid}"}}
+            for pid in sorted({span["pid"] for span in self.spans} | {main_pid})
+        ]
+        for span in self.spans:
+            events.append({
+                "name": span["name"], "cat": "build", "ph": "X", "pid": span["pid"], "tid": span["tid"],
+                "ts": (span["start"] - self.origin) * 1e6, "dur": (span["end"] - span["start"]) * 1e6,
+                "args": {key: str(value) for key, value in span["args"].items()}
+            })
+        for at, pid, rss in self.memory:
+            events.append({"name": "peak_rss", "ph": "C", "pid": pid, "ts": (at - self.origin) * 1e6,
+                           "args": {"MB": round(rss / 1024 / 1024, 1)}})
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        logging.info(f"Chrome trace 已写入 {path}")
+
+    def format_table(self):
+        rows = [("阶段", "次数", "总耗时s", "自身耗时s", "最长s")]
+        rows += [(name, str(count), f"{total:.3f}", f"{self_time:.3f}", f"{longest:.3f}")
+                 for name, count, total, self_time, longest in self.summary()]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        lines = ["  ".join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                           for i, (cell, width) in enumerate(zip(row, widths))) for row in rows]
+        if self.counters:
+            lines.append("")
+            lines += [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        peaks = self.peak_memory()
+        if peaks:
+            lines.append(f"峰值内存 (RSS): {max(peaks.values()) / 1024 / 1024:.1f} MB ({len(peaks)} 个进程中的最大值)")
+        return "\n".join(lines)
+
+
+# 每个进程一个全局实例
+profiler = Profiler()
+
+
+def profiled(name=None):
+    """ 装饰器：把函数调用记录为一个 span，名称默认为函数的限定名 """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiler.span(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
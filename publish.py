@@ -0,0 +1,253 @@
+# publish.py
+"""
+规则产物的发布：构建结束后为 rule/ 下的产物生成
+- 文本产物 (.json/.list/.yaml) 的 .gz 与 .zst 预压缩副本，与原文件放在同一目录；
+- 以内容哈希命名的不可变副本 (rule/objects/<目标>/<名称>.<哈希><扩展名>)，内容变化时换一个文件名，可以设置很长的缓存时间；
+- 内容清单 rule/manifest.json: {产物路径: sha256、大小、条目数、不可变副本、各压缩副本}。
+下游镜像与路由器先比较清单中的 sha256，未变化的产物不必重新下载。
+gzip 头部不含文件名且 mtime 固定为 0，相同内容总是得到相同的压缩文件；zstandard 为可选依赖，未安装时只生成 .gz。
+清单不含时间戳，产物未变化时清单也不变。不再被引用的不可变副本保留 config.publish_keep_generations 代后删除，
+让仍持有旧清单的客户端有时间切换。
+"""
+
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import logging
+import os
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import srs
+from config import Config
+from manifest import COMPRESSED_EXTENSIONS, output_directories
+from profiler import profiler
+
+config = Config()
+
+TEXT_EXTENSIONS = ('.json', '.list', '.yaml')
+BINARY_EXTENSIONS = ('.srs', '.mrs')
+ENCODINGS = dict(zip(('gz', 'zst'), COMPRESSED_EXTENSIONS))
+MANIFEST_VERSION = 1
+
+
+def gzip_bytes(data):
+    return gzip.compress(data, compresslevel=config.publish_gzip_level, mtime=0)
+
+
+def zstd_bytes(data):
+    return zstandard.ZstdCompressor(level=config.publish_zstd_level).compress(data)
+
+
+def encoders():
+    """ 本次启用且可用的压缩编码 """
+    available = {'gz': gzip_bytes}
+    if zstandard is not None:
+        available['zst'] = zstd_bytes
+    elif 'zst' in config.publish_encodings:
+        logging.warning("未安装 zstandard，跳过 .zst 预压缩副本")
+    return {name: available[name] for name in config.publish_encodings if name in available}
+
+
+def count_rule_items(rule):
+    """ sing-box 规则中的条目数，逻辑规则递归统计子规则 """
+    if rule.get("type") == "logical":
+        return sum(count_rule_items(sub_rule) for sub_rule in rule.get("rules", []))
+    return sum(len(value) if isinstance(value, list) else 1
+               for key, value in rule.items() if key not in ("type", "invert"))
+
+
+def count_entries(name, data):
+    """ 产物中的规则条目数，无法解析时返回 None """
+    ext = os.path.splitext(name)[1]
+    try:
+        if ext == '.json':
+            return sum(count_rule_items(rule) for rule in json.loads(data).get("rules", []))
+        if ext == '.srs':
+            return sum(count_rule_items(rule) for rule in srs.read_rule_set(data)["rules"])
+        if ext == '.mrs':
+            if not data:  # 空规则集由 mihomo 写出空文件
+                return 0
+            if zstandard is None:
+                return None
+            # "MRS" + 版本号 + behavior + int64 规则数量
+            header = zstandard.ZstdDecompressor().stream_reader(data).read(13)
+            return struct.unpack('>q', header[5:13])[0]
+        lines = data.decode('utf-8').splitlines()
+        if ext == '.yaml':
+            return sum(1 for line in lines if line.lstrip().startswith('- '))
+        return sum(1 for line in lines if line.strip() and not line.startswith('#'))
+    except Exception as e:
+        logging.warning(f"统计 {name} 条目数时出错: {e}")
+        return None
+
+
+def object_path(name, digest):
+    """ 产物的不可变副本路径 (相对 rule 目录)，例如 singbox/a.srs -> objects/singbox/a.0123456789abcdef.srs """
+    directory, filename = os.path.split(name)
+    stem, ext = os.path.splitext(filename)
+    return '/'.join(filter(None, ('objects', directory, f"{stem}.{digest[:16]}{ext}")))
+
+
+def write_atomic(path, data):
+    """ 先写临时文件再替换，镜像同步时不会读到写了一半的文件 """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class ArtifactPublisher:
+    """
+    根据上一次的内容清单增量发布：内容未变化且副本齐全的产物直接沿用旧记录，只有变化的产物重新压缩。
+    路径均相对 rule 目录，以 / 分隔。
+    """
+
+    def __init__(self, rule_dir=None, path=None):
+        self.rule_dir = rule_dir or config.rule_dir
+        self.path = path or config.publish_manifest_file
+        self.generation = 0
+        self.artifacts = {}
+        self.retired = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.generation = data.get('generation', 0)
+                self.artifacts = data.get('artifacts', {})
+                self.retired = data.get('retired', {})
+        except (OSError, ValueError):
+            pass
+
+    def local_path(self, name):
+        return os.path.join(self.rule_dir, *name.split('/'))
+
+    def list_artifacts(self):
+        names = []
+        for directory in output_directories():
+            if not os.path.isdir(directory):
+                continue
+            target = os.path.relpath(directory, self.rule_dir).replace(os.sep, '/')
+            for filename in os.listdir(directory):
+                if filename.endswith(TEXT_EXTENSIONS + BINARY_EXTENSIONS):
+                    names.append(f"{target}/{filename}")
+        return sorted(names)
+
+    @staticmethod
+    def referenced_paths(entry):
+        """ 记录中的全部副本路径: (同目录的压缩副本, 不可变副本) """
+        siblings = [encoding['path'] for encoding in entry.get('encodings', {}).values()]
+        objects = [entry['object']] + [encoding['object'] for encoding in entry.get('encodings', {}).values()]
+        return siblings, objects
+
+    def is_intact(self, entry, previous, encodings):
+        """ 内容未变化、压缩编码与上次一致且所有副本都存在时沿用旧记录 """
+        if not previous or previous.get('sha256') != entry['sha256'] or set(previous.get('encodings', {})) != set(encodings):
+            return False
+        siblings, objects = self.referenced_paths(previous)
+        return all(os.path.exists(self.local_path(path)) for path in siblings + objects)
+
+    def publish_artifact(self, name, encodings):
+        path = self.local_path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        entry = {'sha256': digest, 'size': len(data)}
+        previous = self.artifacts.get(name)
+        if self.is_intact(entry, previous, encodings if name.endswith(TEXT_EXTENSIONS) else {}):
+            return name, previous, False
+
+        entry['entries'] = count_entries(name, data)
+        entry['object'] = object_path(name, digest)
+        write_atomic(self.local_path(entry['object']), data)
+        if name.endswith(TEXT_EXTENSIONS):
+            entry['encodings'] = {}
+            for encoding, compress in encodings.items():
+                suffix = ENCODINGS[encoding]
+                compressed = compress(data)
+                write_atomic(path + suffix, compressed)
+                entry['encodings'][encoding] = {
+                    'path': name + suffix,
+                    'object': entry['object'] + suffix,
+                    'sha256': hashlib.sha256(compressed).hexdigest(),
+                    'size': len(compressed),
+                }
+                write_atomic(self.local_path(entry['object'] + suffix), compressed)
+        return name, entry, True
+
+    def publish(self, workers=None):
+        """ 发布全部产物并写出内容清单，返回 (产物数, 重新发布的产物数) """
+        encodings = encoders()
+        names = self.list_artifacts()
+        # zlib 与 zstd 压缩时释放 GIL，线程池即可并行
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            results = list(pool.map(lambda name: self.publish_artifact(name, encodings), names))
+        artifacts = {name: entry for name, entry, _ in results}
+        changed = sum(1 for _, _, updated in results if updated)
+        if changed or set(artifacts) != set(self.artifacts):
+            self.generation += 1
+
+        siblings, objects = set(), set()
+        for entry in artifacts.values():
+            entry_siblings, entry_objects = self.referenced_paths(entry)
+            siblings.update(entry_siblings)
+            objects.update(entry_objects)
+        self.prune_siblings(siblings)
+        self.prune_objects(objects)
+        self.artifacts = artifacts
+        self.save()
+        profiler.count('published_artifacts', changed)
+        return len(artifacts), changed
+
+    def prune_siblings(self, referenced):
+        """ 删除已不存在的产物或已关闭的编码遗留的压缩副本 """
+        for directory in output_directories():
+            if not os.path.isdir(directory):
+                continue
+            target = os.path.relpath(directory, self.rule_dir).replace(os.sep, '/')
+            for filename in os.listdir(directory):
+                if filename.endswith(COMPRESSED_EXTENSIONS) and f"{target}/{filename}" not in referenced:
+                    os.remove(os.path.join(directory, filename))
+
+    def prune_objects(self, referenced):
+        """ 不再被引用的不可变副本记入 retired，超过保留代数后删除 """
+        for entry in self.artifacts.values():
+            for path in self.referenced_paths(entry)[1]:
+                if path not in referenced:
+                    self.retired.setdefault(path, self.generation)
+        for path in list(self.retired):
+            if path in referenced:
+                del self.retired[path]
+            elif self.generation - self.retired[path] >= config.publish_keep_generations:
+                del self.retired[path]
+        object_directory = self.local_path('objects')
+        for root, _, filenames in os.walk(object_directory):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(root, filename), self.rule_dir).replace(os.sep, '/')
+                if name not in referenced and name not in self.retired:
+                    os.remove(os.path.join(root, filename))
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'generation': self.generation,
+            'artifacts': self.artifacts,
+            'retired': self.retired,
+        }
+        try:
+            write_atomic(self.path, (json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True) + '\n').encode('utf-8'))
+        except OSError as e:
+            logging.error(f"保存内容清单时出错: {e}")
+
+
+def publish_artifacts(workers=None):
+    """ 构建结束后发布 rule/ 下的全部产物 """
+    total, changed = ArtifactPublisher().publish(workers)
+    logging.info(f"发布产物: {total} 个，其中 {changed} 个重新生成压缩副本与不可变副本")
+    return total, changed
@@ -0,0 +1,357 @@
+# query.py
+"""
+本地规则集查询：不启动 sing-box，直接判断某个域名或 IP 会命中哪个规则集、走哪个出站。
+路由规则来自 route.RouteBuilder.build_route，与 main.py 生成的 sing-box 配置顺序一致；全部规则集预先合并为几个索引：
+- domain / domain_suffix: 哈希表，值为命中该条目的最靠前的规则序号，查询时按域名的标签边界逐级查找
+- domain_keyword: 一个 Aho-Corasick 自动机，扫描一遍域名即得到出现的全部关键字
+- domain_regex: 按正则结尾必须出现的字面量 (如 .example.com) 以域名后缀为键分桶，查询时只匹配后缀相符的正则
+- ip_cidr: 前缀树展开为有序不相交区间表，每个区间记录覆盖它的最靠前的规则序号，查询只需一次二分查找
+用法: python query.py example.com 1.1.1.1
+     python query.py --batch domains.log [--field N] [--output result.tsv]
+"""
+
+import argparse
+import bisect
+import heapq
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import srs
+from config import Config
+from keywords import KeywordAutomaton
+from route import RouteBuilder
+from ruleset import RuleSet
+from utils import cidr_ranges, load_json, parse_cidr
+
+config = Config()
+
+
+# 正则结尾字面量中允许的字符，其余字符都视为元字符
+LITERAL_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-')
+ESCAPED_LITERALS = frozenset('.-/')
+# 字面量之前的这些写法表示字面量从标签边界开始
+LABEL_BOUNDARIES = ('^', '(^|\\.)', '(?:^|\\.)')
+# 结尾由纯字面量组成的分支，例如 \.(com|net)$
+TRAILING_ALTERNATION = re.compile(r'\((?:\?:)?([\w-]+(?:\|[\w-]+)+)\)\$')
+
+
+def has_top_level_branch(pattern):
+    """ pattern 在括号与字符类之外含有 | 分支时返回 True """
+    depth = 0
+    escaped = in_class = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+
+def trailing_literal(pattern):
+    """ 返回 (结尾 $ 之前连续的字面量, 字面量之前的部分) """
+    literal = []
+    pos = len(pattern) - 2
+    while pos >= 0:
+        char = pattern[pos]
+        if pos >= 1 and pattern[pos - 1] == '\\':
+            # \. 等转义字符是字面量，\d、\w 等字符类以及 \\. 中的 . 不是
+            if char not in ESCAPED_LITERALS or pos >= 2 and pattern[pos - 2] == '\\':
+                break
+            literal.append(char)
+            pos -= 2
+        elif char in LITERAL_CHARS:
+            literal.append(char)
+            pos -= 1
+        else:
+            break
+    return ''.join(reversed(literal)), pattern[:pos + 1]
+
+
+def regex_suffix_keys(pattern):
+    r"""
+    返回 pattern 命中的域名一定以其中之一结尾的后缀列表 (都在标签边界上，可能是域名本身)，无法确定时返回 None。
+    例如 (^|\.)foo-.+\.example\.com$ 返回 ['example.com']，(^|\.)example\.(com|net)$ 返回 ['example.com', 'example.net']。
+    只识别以 $ 结尾、没有顶层 | 分支与内联标志的正则。
+    """
+    if not pattern.endswith('$') or pattern.endswith('\\$') or pattern.startswith('(?') \
+            or has_top_level_branch(pattern):
+        return None
+    alternation = TRAILING_ALTERNATION.search(pattern)
+    if alternation and alternation.end() == len(pattern):
+        head = pattern[:alternation.start()]
+        variants = [head + alternative + '$' for alternative in alternation.group(1).split('|')]
+    else:
+        variants = [pattern]
+
+    keys = []
+    for variant in variants:
+        literal, head = trailing_literal(variant)
+        if head in LABEL_BOUNDARIES and literal and not literal.startswith('.'):
+            keys.append(literal)
+            continue
+        dot = literal.find('.')
+        if dot == -1 or dot == len(literal) - 1:
+            return None
+        keys.append(literal[dot + 1:])
+    return keys
+
+
+class CidrTable:
+    """
+    ip_cidr 的最长前缀查询表：各规则集的网段按地址切分为不相交的区间，每个区间取覆盖它的最小规则序号。
+    与逐位下降的前缀树 (radix tree) 结果相同，但查询只有一次 bisect，不在 Python 中逐位循环。
+    """
+    __slots__ = ('starts', 'values')
+
+    def __init__(self, ranges):
+        """ ranges 为 [(起始整数, 结束整数, 规则序号)] """
+        events = sorted(ranges)
+        points = sorted({start for start, _, _ in events} | {end + 1 for _, end, _ in events})
+        self.starts, self.values = [], []
+        active = []  # (规则序号, 结束整数)，已结束的区间在到达堆顶时才移除
+        i = 0
+        for point in points:
+            while i < len(events) and events[i][0] <= point:
+                heapq.heappush(active, (events[i][2], events[i][1]))
+                i += 1
+            while active and active[0][1] < point:
+                heapq.heappop(active)
+            value = active[0][0] if active else None
+            if not self.values or self.values[-1] != value:
+                self.starts.append(point)
+                self.values.append(value)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, address):
+        pos = bisect.bisect_right(self.starts, address) - 1
+        return self.values[pos] if pos >= 0 else None
+
+
+class RouteMatcher:
+    """
+    按路由规则顺序匹配域名与 IP。每个 (路由规则, 规则集) 组合编号为一个槽位，编号顺序即匹配优先级，
+    索引中只保存每个条目命中的最小槽位，查询结果是全部索引给出的最小槽位。
+    不含 rule_set 的固定规则 (入站、clash_mode、协议、端口) 与查询的域名或 IP 无关，不参与匹配。
+    """
+
+    def __init__(self, route, rule_sets):
+        """ route 为 build_route 的返回值，rule_sets 为 {tag: RuleSet}，缺失的规则集视为空 """
+        start = time.perf_counter()
+        self.final = route.get("final")
+        self.slots = []  # 槽位 -> (tag, 出站)
+        self.exact, self.suffixes, self.subdomains = {}, {}, {}
+        self.regexes = {}  # 域名后缀 -> [(槽位, 正则的 search)]
+        self.unkeyed_regexes = []  # 无法确定后缀的正则，每次查询都要匹配
+        keywords = {}
+        ranges = {4: [], 6: []}
+        for rule in route.get("rules", []):
+            if "rule_set" not in rule:
+                continue
+            outbound = rule.get("outbound") or rule.get("action")
+            for tag in rule["rule_set"]:
+                slot = len(self.slots)
+                self.slots.append((tag, outbound))
+                rule_set = rule_sets.get(tag)
+                if rule_set is None:
+                    continue
+                for domain in rule_set.domain:
+                    self.exact.setdefault(domain, slot)
+                for suffix in rule_set.domain_suffix:
+                    # .example.com 只匹配子域名
+                    target = self.subdomains if suffix.startswith('.') else self.suffixes
+                    target.setdefault(sys.intern(suffix.lstrip('.')), slot)
+                for keyword in rule_set.domain_keyword:
+                    keywords.setdefault(keyword, slot)
+                for pattern in sorted(rule_set.domain_regex):
+                    try:
+                        search = re.compile(pattern).search
+                    except re.error as e:
+                        logging.warning(f"跳过无效的 domain_regex {pattern}: {e}")
+                        continue
+                    keys = regex_suffix_keys(pattern)
+                    if keys is None:
+                        self.unkeyed_regexes.append((slot, search))
+                    for key in keys or ():
+                        self.regexes.setdefault(key, []).append((slot, search))
+                if rule_set.ip_cidr:
+                    for version, items in cidr_ranges(rule_set.ip_cidr)[0].items():
+                        ranges[version].extend((first, last, slot) for first, last in items)
+        self.keywords = keywords
+        self.automaton = KeywordAutomaton(keywords)
+        self.cidrs = {version: CidrTable(items) for version, items in ranges.items()}
+        self.cache = {}
+        self.lookups = 0
+        self.cache_hits = 0
+        self.build_time = time.perf_counter() - start
+
+    @classmethod
+    def load(cls, rule_dir=config.singbox_output_directory):
+        """ 读取 rule_dir 下生成的规则集与路由规则；优先读取 JSON，没有 JSON 时用内置 SRS 解码器 """
+        route = RouteBuilder().build_route(rule_dir)
+        tags = {tag for rule in route["rules"] for tag in rule.get("rule_set", [])}
+        rule_sets = {}
+        for tag in sorted(tags):
+            rule_set = load_rule_set(rule_dir, tag)
+            if rule_set is not None:
+                rule_sets[tag] = rule_set
+        return cls(route, rule_sets)
+
+    def match_domain(self, domain):
+        """ 返回命中 domain 的最小槽位，未命中时返回 None """
+        best = self.exact.get(domain)
+        suffixes, subdomains = self.suffixes, self.subdomains
+        slot = suffixes.get(domain)
+        if slot is not None and (best is None or slot < best):
+            best = slot
+        regexes = self.regexes
+        buckets = [self.unkeyed_regexes, regexes[domain]] if domain in regexes else [self.unkeyed_regexes]
+        pos = domain.find('.')
+        while pos != -1:
+            parent = domain[pos + 1:]
+            for slot in (suffixes.get(parent), subdomains.get(parent)):
+                if slot is not None and (best is None or slot < best):
+                    best = slot
+            if parent in regexes:
+                buckets.append(regexes[parent])
+            pos = domain.find('.', pos + 1)
+        if self.keywords:
+            for keyword in self.automaton.findall(domain):
+                slot = self.keywords[keyword]
+                if best is None or slot < best:
+                    best = slot
+        # 只有比当前结果更靠前的正则才可能改变结果；每个桶内的正则按槽位排列，各自找出第一个更靠前的命中
+        for bucket in buckets:
+            for slot, search in bucket:
+                if best is not None and slot >= best:
+                    break
+                if search(domain):
+                    best = slot
+                    break
+        return best
+
+    def match_ip(self, address):
+        parsed = parse_cidr(address)
+        return self.cidrs[parsed[0]].lookup(parsed[1]) if parsed else None
+
+    def lookup(self, value):
+        """ 返回 (命中的规则集 tag, 出站)；未命中任何规则集时返回 (None, final) """
+        self.lookups += 1
+        result = self.cache.get(value)
+        if result is not None:
+            self.cache_hits += 1
+            return result
+        query = value.strip().lower().rstrip('.')
+        slot = self.match_ip(query.strip('[]')) if is_ip(query) else self.match_domain(query)
+        result = self.slots[slot] if slot is not None else (None, self.final)
+        if len(self.cache) >= config.query_cache_size:
+            self.cache.clear()
+        self.cache[value] = result
+        return result
+
+    def lookup_many(self, values):
+        return [self.lookup(value) for value in values]
+
+    def report(self):
+        logging.info(
+            f"规则集查询索引: 规则集 {len({tag for tag, _ in self.slots})} 个, domain {len(self.exact)} 条, "
+            f"domain_suffix {len(self.suffixes) + len(self.subdomains)} 条, domain_keyword {len(self.keywords)} 个, "
+            f"domain_regex 后缀分桶 {len(self.regexes)} 个, 无法分桶的正则 {len(self.unkeyed_regexes)} 个, "
+            f"ip_cidr 区间 {sum(map(len, self.cidrs.values()))} 个, "
+            f"构建 {self.build_time * 1000:.1f} ms"
+        )
+
+
+def is_ip(value):
+    """ IPv4 / IPv6 地址 (IPv6 可带方括号) """
+    return ':' in value or value.replace('.', '').isdigit()
+
+
+def load_rule_set(rule_dir, tag):
+    """ 读取单个生成的规则集，无法读取时记录警告并返回 None """
+    json_path = os.path.join(rule_dir, f"{tag}.json")
+    srs_path = os.path.join(rule_dir, f"{tag}.srs")
+    try:
+        if os.path.exists(json_path):
+            return RuleSet(load_json(json_path).get("rules", []))
+        with open(srs_path, 'rb') as f:
+            return RuleSet(srs.read_rule_set(f.read())["rules"])
+    except (OSError, ValueError, srs.UnsupportedRuleError) as e:
+        logging.warning(f"无法读取规则集 {tag}，查询时视为空规则集: {e}")
+        return None
+
+
+def read_queries(path, field=0):
+    """ 逐行读取查询日志，取每行第 field 个空白分隔的字段，跳过空行与 # 注释 """
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            parts = line.split()
+            if parts and not parts[0].startswith('#') and -len(parts) <= field < len(parts):
+                yield parts[field]
+
+
+def resolve_batch(matcher, queries, output=None):
+    """ 批量查询，返回 (查询数, 耗时秒, 各出站命中数, 各规则集命中数)；output 为 TSV 路径时逐行写出结果 """
+    outbounds, tags = Counter(), Counter()
+    count = 0
+    out = open(output, 'w', encoding='utf-8') if output else None
+    start = time.perf_counter()
+    try:
+        for query in queries:
+            tag, outbound = matcher.lookup(query)
+            outbounds[outbound] += 1
+            tags[tag] += 1
+            count += 1
+            if out:
+                out.write(f"{query}\t{tag or '-'}\t{outbound}\n")
+    finally:
+        if out:
+            out.close()
+    return count, time.perf_counter() - start, outbounds, tags
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="查询域名或 IP 命中的规则集与出站")
+    arg_parser.add_argument('queries', nargs='*', help="要查询的域名或 IP")
+    arg_parser.add_argument('--batch', metavar='FILE', help="批量查询日志文件，每行一个查询")
+    arg_parser.add_argument('--field', type=int, default=0, help="批量查询时取每行第几个空白分隔的字段，默认 0")
+    arg_parser.add_argument('--output', metavar='FILE', help="批量查询结果的 TSV 输出路径 (查询, 规则集, 出站)")
+    arg_parser.add_argument('--rule-dir', default=config.singbox_output_directory, help="生成的 sing-box 规则集目录")
+    args = arg_parser.parse_args()
+    if not args.queries and not args.batch:
+        arg_parser.error("需要查询的域名 / IP 或 --batch")
+
+    matcher = RouteMatcher.load(args.rule_dir)
+    matcher.report()
+    print(f"索引构建 {matcher.build_time:.2f} s")
+    for query in args.queries:
+        tag, outbound = matcher.lookup(query)
+        print(f"{query}\t{tag or '-'}\t{outbound}")
+
+    if args.batch:
+        count, elapsed, outbounds, tags = resolve_batch(matcher, read_queries(args.batch, args.field), args.output)
+        rate = count / elapsed if elapsed else 0
+        print(f"查询 {count} 条, 耗时 {elapsed:.2f} s, {rate:,.0f} 次/秒, "
+              f"缓存命中率 {matcher.cache_hits / max(matcher.lookups, 1):.1%}")
+        print("出站: " + ", ".join(f"{outbound} {n}" for outbound, n in outbounds.most_common()))
+        print("规则集: " + ", ".join(f"{tag or '未命中'} {n}" for tag, n in tags.most_common(10)))
+        logging.info(f"批量查询 {count} 条, {rate:,.0f} 次/秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# route.py
+"""
+sing-box 路由配置：由 rule/singbox 下生成的 .srs 规则集推导路由规则与出站。
+main.SB_ConfigParser 用它写出 sb_route.json，query.py 用它按同样的顺序匹配查询；
+本模块不创建 Config，导入时不会清空日志或重新配置 logging。
+"""
+
+import os
+import re
+
+
+class RouteBuilder:
+    def build_route(self, rule_dir='./rule/singbox'):
+        """
+        由 rule_dir 下的 .srs 规则集生成 sing-box route 配置：规则按 rule_priority 排序，
+        query.py 按同样的顺序匹配，查询结果与 sing-box 加载生成的配置一致。
+        """
+        # 固定字段
+        fixed_rules = [
+            {"inbound": ["tun-in", "mixed-in"], "action": "sniff", "timeout": "1s"},
+            {"clash_mode": "全局代理", "action": "route", "outbound": "默认代理"},
+            {"clash_mode": "全局直连", "action": "route", "outbound": "直连"},
+            {"protocol": "dns", "action": "hijack-dns"},
+            {"port": 853, "network": "tcp", "action": "reject", "method": "default", "no_drop": False},
+            {"port": 443, "network": "udp", "action": "reject", "method": "default", "no_drop": False}
+        ]
+
+        # 动态生成的规则
+        rules = []
+        rule_set = []
+
+        for file in sorted(os.listdir(rule_dir)):
+            if file.endswith('.srs'):
+                tag = os.path.splitext(file)[0]
+                # 添加规则集
+                rule_set.append({
+                    "tag": tag,
+                    "type": "remote",
+                    "format": "binary",
+                    "url": f"https://raw.githubusercontent.com/vstar37/proxy-ruleset-manager/main/rule/singbox/{file}",
+                    "download_detour": "下载 (海外服务)"
+                })
+
+                # 排除 fakeip 和 @cn规则
+                if 'fakeip' in tag or 'geolocation-!cn' in tag or '@cn' in tag:
+                    continue
+
+                # 判断规则类型并生成相应的动作, blocker 默认使用 adguard-blocker@default
+                if 'adguard-blocker@default' in tag:
+                    rules.append({"rule_set": [tag], "action": "reject", "method": "default", "no_drop": False})
+                elif 'direct' in tag or '@cn' in tag:
+                    rules.append({"rule_set": [tag], "action": "route", "outbound": "直连"})
+                elif 'category' in tag or 'process' in tag:
+                    outbound = self.determine_outbound(tag)
+                    if outbound:  # 只在命中时添加
+                        rules.append({"rule_set": [tag], "action": "route", "outbound": outbound})
+
+                elif 'geoip-geolocation' in tag:
+                    match = re.search(r'geoip-geolocation-(\w+)', tag)  # 匹配 'geoip-geolocation-' 后的国家代码
+                    if match:
+                        country_code = match.group(1)  # 提取国家编号（如 jp）
+                        outbound = self.determine_geolocation_outbound(country_code)  # 根据国家编号确定 outbound
+                        rules.append({"rule_set": [tag], "action": "route", "outbound": outbound})
+
+        # 合并 geosite 和 geoip 规则
+        rules = self.merge_geosite_geoip_rules(rules)
+
+        # 组合所有规则
+        all_rules = fixed_rules + rules
+
+        # 按规则分类排序
+        all_rules = sorted(all_rules, key=self.rule_priority)
+
+        return {
+            "rules": all_rules,
+            "rule_set": rule_set,
+            "auto_detect_interface": True,
+            "final": "默认代理"
+        }
+
+    def merge_geosite_geoip_rules(self, rules):
+        """检查并合并 geosite 和 geoip 规则"""
+        merged_rules = []
+        seen_tags = set()
+
+        for rule in rules:
+            rule_set = rule.get('rule_set', [])
+            if not rule_set:
+                merged_rules.append(rule)
+                continue
+
+            tag = rule_set[0]
+            if tag in seen_tags:
+                continue
+
+            # 尝试找出对应的 geosite 和 geoip 规则
+            geosite_tag = tag.replace('geoip', 'geosite')
+            geoip_tag = tag.replace('geosite', 'geoip')
+
+            # 检查是否有相同的规则
+            matching_rule = None
+            for r in merged_rules:
+                if geosite_tag in r.get('rule_set', []) or geoip_tag in r.get('rule_set', []):
+                    matching_rule = r
+                    break
+
+            if matching_rule:
+                # 如果有匹配的规则，将当前规则的 tags 合并
+                matching_rule['rule_set'].extend(rule_set)
+            else:
+                # 没有匹配的规则，直接添加当前规则
+                merged_rules.append(rule)
+
+            seen_tags.add(tag)
+
+        return merged_rules
+
+    def determine_outbound(self, tag):
+        # 根据tag关键字确定outbound
+        if 'video' in tag and '!cn' in tag:
+            return "影音 (海外服务)"
+        if 'download' in tag and '!cn' in tag:
+            return "下载 (海外服务)"
+        if 'communication' in tag and '!cn' in tag:
+            return "通信 (海外服务)"
+        if 'game' in tag and '!cn' in tag:
+            return  "游戏 (海外服务)"
+        if 'vpn' in tag and '!cn' in tag:
+            return "VPN (区域伪装)"
+        if 'media' in tag and '!cn' in tag:
+            return  "媒体 (海外服务)"
+        if 'nsfw' in tag and '!cn' in tag:
+            return "成人 (过滤服务)"
+        if 'direct' in tag:
+            return "直连"
+        else:
+            return None
+
+    def rule_priority(self, rule):
+        # 定义规则的优先级
+        if "inbound" in rule:
+            return 0
+        if "clash_mode" in rule:
+            return 1
+        if "protocol" in rule:
+            return 2
+        if "port" in rule:
+            return 3
+        if "rule_set" in rule:
+            if 'blocker' in rule["rule_set"][0] and 'process' not in rule["rule_set"][0]:
+                return 4
+            if '@cn' in rule["rule_set"][0]:
+                return 5
+            if 'category' in rule["rule_set"][0] and 'direct' not in rule["rule_set"][0]:
+                return 6
+            if 'geolocation' in rule["rule_set"][0]:
+                return 7
+            if 'direct' in rule["rule_set"][0] and 'process' not in rule["rule_set"][0]:
+                return 8
+            if 'process' in rule["rule_set"][0]:
+                return 9
+            return 10
+        return 11
+
+    def determine_geolocation_outbound(self, country_code):
+        # 根据国家编号确定outbound
+        geolocation_map = {
+            'jp': '日本线路',
+            'us': '美国线路',
+            'cn': '大陆线路',
+            'uk': '香港线路',
+            'eu': '欧洲线路',
+            'hk': '香港线路',
+            'kr': '韩国线路',
+            'tw': '台湾线路'
+            # 可以添加更多国家映射
+        }
+        return geolocation_map.get(country_code, "Other")
@@ -0,0 +1,248 @@
+# ruleset.py
+"""
+规则集的规范化内存模型：每个规则类别是一个集合，条目驻留 (intern) 后存放，
+合并、剔除与后缀覆盖都直接在集合上完成，各阶段之间不再反复构造 {"rules": [{类别: [...]}]} 字典与列表。
+只在读入上游或写出规则集时与 sing-box 规则列表互相转换。
+"""
+
+import logging
+import re
+import sys
+import time
+
+from keywords import KeywordAutomaton
+
+# 合并阶段保留的规则类别，输出按此顺序排列；其他规则项 (逻辑规则、端口等) 在合并时丢弃
+CATEGORIES = ("process_name", "domain", "domain_suffix", "domain_keyword", "ip_cidr", "domain_regex")
+
+# 只匹配某个域名及其子域名的常见 domain_regex 写法：子域名前缀 + 转义后的域名 + 结尾锚点 $
+DOMAIN_REGEX_PREFIXES = ('^(.+\\.)?', '^(.*\\.)?', '^(?:.+\\.)?', '^(?:.*\\.)?', '(^|\\.)', '(?:^|\\.)',
+                         '^([a-z0-9-]+\\.)*', '^([\\w-]+\\.)*', '^')
+# 只匹配子域名、不匹配域名本身的前缀
+SUBDOMAIN_ONLY_PREFIXES = ('^.+\\.', '^.*\\.', '\\.')
+DOMAIN_REGEX_PATTERN = re.compile(
+    '(?P<prefix>' + '|'.join(map(re.escape, DOMAIN_REGEX_PREFIXES + SUBDOMAIN_ONLY_PREFIXES)) + ')'
+    r'(?P<domain>(?:[A-Za-z0-9_-]|\\[.-])+)\$'
+)
+
+
+def regex_domain(pattern):
+    r"""
+    识别只匹配某个域名及其子域名的 domain_regex，例如 ^(.+\.)?example\.com$、(^|\.)example\.com$，
+    返回 (域名, 是否只匹配子域名)；其他写法返回 None。域名中未转义的 . 是通配符，不识别。
+    """
+    match = DOMAIN_REGEX_PATTERN.fullmatch(pattern)
+    if match is None:
+        return None
+    return match.group('domain').replace('\\', ''), match.group('prefix') in SUBDOMAIN_ONLY_PREFIXES
+
+
+class RuleSet:
+    """
+    按类别存放去重后的条目。可由 sing-box 规则列表构造，to_rules() 转换回规则列表，空类别不输出。
+    update / difference_update 原地合并与剔除，covered_by 按后缀索引剔除被覆盖的域名。
+    """
+    __slots__ = CATEGORIES
+
+    def __init__(self, rules=None):
+        for category in CATEGORIES:
+            setattr(self, category, set())
+        if rules:
+            self.add_rules(rules)
+
+    @classmethod
+    def coerce(cls, data):
+        """ RuleSet 原样返回，规则列表转换为 RuleSet """
+        return data if isinstance(data, RuleSet) else cls(data)
+
+    def add_rules(self, rules):
+        """
+        加入 sing-box 规则列表中属于 CATEGORIES 的条目，返回加入的条目数 (去重前)。
+        条目驻留后存放，不同上游、不同进程传来的相同条目只保留一个字符串对象。
+        """
+        added = 0
+        for rule in rules:
+            if not isinstance(rule, dict):
+                continue
+            for category, values in rule.items():
+                if category not in CATEGORIES or not values:
+                    continue
+                bucket = getattr(self, category)
+                if isinstance(values, list):
+                    try:
+                        bucket.update(map(sys.intern, values))
+                    except TypeError:  # 非字符串条目原样保存
+                        bucket.update(values)
+                    added += len(values)
+                elif isinstance(values, str):
+                    bucket.add(sys.intern(values))
+                    added += 1
+        return added
+
+    def items(self):
+        """ 按 CATEGORIES 顺序返回 (类别, 集合) """
+        return [(category, getattr(self, category)) for category in CATEGORIES]
+
+    def counts(self):
+        return {category: len(values) for category, values in self.items()}
+
+    def __len__(self):
+        return sum(len(values) for _, values in self.items())
+
+    def copy(self):
+        result = RuleSet()
+        for category, values in self.items():
+            setattr(result, category, set(values))
+        return result
+
+    def update(self, other):
+        for category, values in other.items():
+            getattr(self, category).update(values)
+        return self
+
+    def __or__(self, other):
+        return self.copy().update(other)
+
+    def difference_update(self, other, categories=CATEGORIES):
+        """ 原地剔除 other 中完全相同的条目，返回各类别剔除数量 """
+        removed = {}
+        for category in categories:
+            values = getattr(self, category)
+            size = len(values)
+            values.difference_update(getattr(other, category))
+            removed[category] = size - len(values)
+        return removed
+
+    def covered_by(self, index, categories=("domain", "domain_suffix")):
+        """
+        原地剔除被 index 中后缀完全覆盖的条目，返回各类别剔除数量。
+        .example.com 形式的后缀只覆盖子域名，不剔除 example.com 本身及同名的 domain_suffix。
+        """
+        removed = {}
+        if not len(index):
+            return removed
+        for category in categories:
+            values = getattr(self, category)
+            if category == "domain_suffix":
+                covered = [value for value in values
+                           if index.implies(value.lstrip('.'), subdomains_only=value.startswith('.'))]
+            else:
+                covered = [value for value in values if index.covers(value)]
+            values.difference_update(covered)
+            removed[category] = len(covered)
+        return removed
+
+    def collapse_suffixes(self, index=None):
+        """
+        把 domain_suffix 精简为最小覆盖集合，并剔除已被 domain_suffix 覆盖的 domain_regex，原地修改。
+        判断基于后缀索引，每个条目只查询其标签边界，不做两两比较。返回各类别剔除数量。
+        domain_keyword 可以匹配任意位置的子串，不可能被 domain_suffix 覆盖，不在此处理。
+        """
+        index = index if index is not None else SuffixIndex(self.domain_suffix)
+        removed = {"domain_suffix": 0, "domain_regex": 0}
+        if not len(index):
+            return removed
+        redundant = [suffix for suffix in self.domain_suffix if index.redundant(suffix)]
+        self.domain_suffix.difference_update(redundant)
+        removed["domain_suffix"] = len(redundant)
+
+        implied = []
+        for pattern in self.domain_regex:
+            parsed = regex_domain(pattern)
+            if parsed is not None and index.implies(*parsed):
+                implied.append(pattern)
+        self.domain_regex.difference_update(implied)
+        removed["domain_regex"] = len(implied)
+        return removed
+
+    def prune_keywords(self, automaton=None):
+        """
+        剔除包含其他关键字的 domain_keyword，原地修改，返回 (各类别剔除数量, 自动机)。
+        包含关键字的 domain 与 domain_suffix 保留在规则集中：Clash 的 domain behavior 无法表达 domain_keyword，
+        只在生成 sing-box 与 Surge 规则时由 utils.drop_keyword_covered 剔除。
+        """
+        automaton = automaton if automaton is not None else KeywordAutomaton(self.domain_keyword)
+        if not len(automaton):
+            return {}, automaton
+        redundant = automaton.covered(self.domain_keyword, exclude_self=True)
+        self.domain_keyword.difference_update(redundant)
+        return {"domain_keyword": len(redundant)}, automaton
+
+    def to_rules(self, exclude=(), sort=False):
+        """ 转换为 sing-box 规则列表，exclude 中的类别与空类别不输出，sort 为 True 时条目按字典序排列 """
+        return [
+            {category: sorted(values) if sort else list(values)}
+            for category, values in self.items()
+            if values and category not in exclude
+        ]
+
+
+# 后缀覆盖索引
+class SuffixIndex:
+    """
+    domain_suffix 索引：后缀去掉前导点后驻留 (intern) 存入哈希集合。
+    查询时从域名的每个标签边界切出父级域名逐一查找，耗时只与域名的标签数有关，
+    不再像逐字符 Trie 那样为每个字符分配节点对象。
+    """
+    __slots__ = ('suffixes', 'subdomain_only', 'build_time', 'query_time', 'query_count')
+
+    def __init__(self, domain_suffixes=()):
+        start = time.perf_counter()
+        self.suffixes = set()
+        # 只以 .example.com 形式出现的后缀只匹配子域名，不匹配 example.com 本身
+        dotted, both = set(), set()
+        for suffix in domain_suffixes:
+            bare = sys.intern(suffix.lstrip('.'))
+            if bare != suffix:
+                if bare in self.suffixes and bare not in dotted:
+                    both.add(bare)
+                dotted.add(bare)
+            elif bare in dotted:
+                both.add(bare)
+            self.suffixes.add(bare)
+        self.suffixes.discard('')
+        self.subdomain_only = dotted - both
+        self.build_time = time.perf_counter() - start
+        self.query_time = 0.0
+        self.query_count = 0
+
+    def __len__(self):
+        return len(self.suffixes)
+
+    def __contains__(self, domain):
+        return domain in self.suffixes
+
+    def has_parent(self, domain):
+        """ domain 是某个后缀的子域名 (不含与后缀相等的情况) 时返回 True """
+        suffixes = self.suffixes
+        pos = domain.find('.')
+        while pos != -1:
+            if domain[pos + 1:] in suffixes:
+                return True
+            pos = domain.find('.', pos + 1)
+        return False
+
+    def covers(self, domain):
+        """ domain 是某个后缀的子域名，或等于某个不只匹配子域名的后缀时返回 True """
+        return self.has_parent(domain) or (domain in self.suffixes and domain not in self.subdomain_only)
+
+    def implies(self, domain, subdomains_only=False):
+        """ domain 的全部子域名 (subdomains_only 为 False 时还包括 domain 本身) 都被某个后缀覆盖时返回 True """
+        if self.has_parent(domain):
+            return True
+        return domain in self.suffixes and (subdomains_only or domain not in self.subdomain_only)
+
+    def redundant(self, suffix):
+        """ domain_suffix 条目被另一个条目完全覆盖时返回 True：存在更上级的后缀，或同时存在不带前导点的写法 """
+        bare = suffix.lstrip('.')
+        return self.has_parent(bare) or (bare != suffix and bare not in self.subdomain_only)
+
+    def memory_usage(self):
+        """ 估算索引占用的内存 (字节) """
+        return sys.getsizeof(self.suffixes) + sum(sys.getsizeof(suffix) for suffix in self.suffixes)
+
+    def report(self, label):
+        logging.info(
+            f"{label}: 后缀索引 {len(self.suffixes)} 条, 内存约 {self.memory_usage() / 1024 / 1024:.2f} MB, "
+            f"构建 {self.build_time * 1000:.1f} ms, 查询 {self.query_count} 次 {self.query_time * 1000:.1f} ms"
+        )
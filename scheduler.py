@@ -0,0 +1,150 @@
+# scheduler.py
+"""
+规则集构建的 DAG 调度：任务的依赖全部完成后立即提交到进程池，不同规则集的解析、合并与生成互不等待，
+只有 category 的 cn / !cn 拆分需要等待同组的全部规则集。任务完成后在主进程中调用 on_done，回调中可以继续添加任务。
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import time
+
+from config import Config
+
+config = Config()
+
+_in_worker = False
+
+
+def in_worker():
+    """ 当前进程是否为 BuildScheduler 进程池的工作进程；工作进程中不应再创建嵌套的进程池 """
+    return _in_worker
+
+
+def _init_worker(initializer):
+    global _in_worker
+    _in_worker = True
+    if initializer is not None:
+        initializer()
+
+
+def fork_context():
+    """ 工作进程需要继承已下载的上游内容与日志句柄，只使用 fork 启动方式；平台不支持时返回 None """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return None
+
+
+class BuildTask:
+    __slots__ = ('name', 'func', 'args', 'deps', 'prepare', 'on_done')
+
+    def __init__(self, name, func, args, deps, prepare, on_done):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.deps = set(deps)
+        self.prepare = prepare
+        self.on_done = on_done
+
+
+class BuildScheduler:
+    """
+    DAG 任务调度器。func 必须是模块级函数，args 在添加时给出，或由 prepare() 在依赖完成后于主进程中生成。
+    max_workers 为 1 或平台不支持 fork 时按依赖顺序在当前进程中依次执行。
+    """
+
+    def __init__(self, max_workers=None, initializer=None):
+        self.max_workers = max_workers or config.build_jobs or os.cpu_count() or 1
+        self.initializer = initializer
+        self.pending = {}
+        self.completed = set()
+        self.failed = {}  # 任务名 -> 错误信息
+        self.elapsed = 0.0
+
+    def add(self, name, func, args=(), deps=(), prepare=None, on_done=None):
+        if name in self.pending or name in self.completed or name in self.failed:
+            raise ValueError(f"重复的任务: {name}")
+        self.pending[name] = BuildTask(name, func, args, deps, prepare, on_done)
+
+    def _take_ready(self):
+        """ 取出依赖全部完成的任务；依赖失败的任务直接标记为失败 """
+        ready = []
+        for name, task in list(self.pending.items()):
+            failed_deps = task.deps & self.failed.keys()
+            if failed_deps:
+                del self.pending[name]
+                self.failed[name] = f"依赖任务失败: {', '.join(sorted(failed_deps))}"
+                logging.error(f"跳过任务 {name}: {self.failed[name]}")
+            elif task.deps <= self.completed:
+                del self.pending[name]
+                ready.append(task)
+        return ready
+
+    def _finish(self, task, result=None, error=None):
+        if error is None and task.on_done is not None:
+            try:
+                task.on_done(result)
+            except Exception as e:
+                error = e
+        if error is not None:
+            self.failed[task.name] = str(error)
+            logging.error(f"任务 {task.name} 失败: {error}")
+        else:
+            self.completed.add(task.name)
+
+    def _arguments(self, task):
+        return task.prepare() if task.prepare is not None else task.args
+
+    def run(self):
+        """ 执行全部任务，返回失败的任务 {任务名: 错误信息} """
+        start = time.perf_counter()
+        context = fork_context()
+        if self.max_workers <= 1 or context is None:
+            self._run_inline()
+        else:
+            self._run_pool(context)
+        self.elapsed = time.perf_counter() - start
+        for name in self.pending:
+            self.failed[name] = "依赖无法满足"
+            logging.error(f"任务 {name} 的依赖无法满足")
+        self.pending.clear()
+        return self.failed
+
+    def _run_inline(self):
+        while True:
+            ready = self._take_ready()
+            if not ready:
+                return
+            for task in ready:
+                try:
+                    result = task.func(*self._arguments(task))
+                except Exception as e:
+                    self._finish(task, error=e)
+                else:
+                    self._finish(task, result)
+
+    def _run_pool(self, context):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                    initializer=_init_worker, initargs=(self.initializer,)) as executor:
+            running = {}
+            while True:
+                for task in self._take_ready():
+                    try:
+                        running[executor.submit(task.func, *self._arguments(task))] = task
+                    except Exception as e:
+                        self._finish(task, error=e)
+                if not running:
+                    if self.pending and any(task.deps <= self.completed | self.failed.keys()
+                                            for task in self.pending.values()):
+                        continue
+                    return
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._finish(task, error=e)
+                    else:
+                        self._finish(task, result)
@@ -0,0 +1,489 @@
+# srs.py
+"""
+sing-box 规则集二进制格式 (.srs, 版本 1-3) 的编解码。
+
+文件结构: "SRS" + 版本号 (1 字节) + zlib 数据流，数据流内为 uvarint 规则数量与逐条规则。
+domain/domain_suffix 存储为反转域名的 succinct trie，ip_cidr 存储为合并后的地址区间。
+adguard_domain、query_type 与 network_type 不在支持范围内，遇到时抛出 UnsupportedRuleError，
+由调用方回退到 sing-box 可执行文件。
+"""
+
+import bisect
+import struct
+import zlib
+
+from utils import IP_FAMILIES, cidr_ranges, ranges_to_cidrs
+
+MAGIC = b'SRS'
+MAX_VERSION = 3
+
+# 规则项类型
+ITEM_QUERY_TYPE = 0
+ITEM_NETWORK = 1
+ITEM_DOMAIN = 2
+ITEM_DOMAIN_KEYWORD = 3
+ITEM_DOMAIN_REGEX = 4
+ITEM_SOURCE_IP_CIDR = 5
+ITEM_IP_CIDR = 6
+ITEM_SOURCE_PORT = 7
+ITEM_SOURCE_PORT_RANGE = 8
+ITEM_PORT = 9
+ITEM_PORT_RANGE = 10
+ITEM_PROCESS_NAME = 11
+ITEM_PROCESS_PATH = 12
+ITEM_PACKAGE_NAME = 13
+ITEM_WIFI_SSID = 14
+ITEM_WIFI_BSSID = 15
+ITEM_ADGUARD_DOMAIN = 16
+ITEM_PROCESS_PATH_REGEX = 17
+ITEM_NETWORK_TYPE = 18
+ITEM_NETWORK_IS_EXPENSIVE = 19
+ITEM_NETWORK_IS_CONSTRAINED = 20
+ITEM_FINAL = 0xFF
+
+# 字符串列表类型的规则项，顺序与 sing-box 写入顺序一致: (规则项类型, JSON 字段, 最低版本)
+STRING_ITEMS_BEFORE_IP = [
+    (ITEM_NETWORK, 'network', 1),
+]
+STRING_ITEMS_AFTER_DOMAIN = [
+    (ITEM_DOMAIN_KEYWORD, 'domain_keyword', 1),
+    (ITEM_DOMAIN_REGEX, 'domain_regex', 1),
+]
+STRING_ITEMS_AFTER_IP = [
+    (ITEM_SOURCE_PORT, 'source_port', 1),
+    (ITEM_SOURCE_PORT_RANGE, 'source_port_range', 1),
+    (ITEM_PORT, 'port', 1),
+    (ITEM_PORT_RANGE, 'port_range', 1),
+    (ITEM_PROCESS_NAME, 'process_name', 1),
+    (ITEM_PROCESS_PATH, 'process_path', 1),
+    (ITEM_PROCESS_PATH_REGEX, 'process_path_regex', 3),
+    (ITEM_PACKAGE_NAME, 'package_name', 1),
+]
+FLAG_ITEMS = [
+    (ITEM_NETWORK_IS_EXPENSIVE, 'network_is_expensive', 3),
+    (ITEM_NETWORK_IS_CONSTRAINED, 'network_is_constrained', 3),
+]
+STRING_ITEMS_LAST = [
+    (ITEM_WIFI_SSID, 'wifi_ssid', 1),
+    (ITEM_WIFI_BSSID, 'wifi_bssid', 1),
+]
+UINT16_ITEMS = {ITEM_SOURCE_PORT: 'source_port', ITEM_PORT: 'port'}
+STRING_ITEMS = {
+    item: key for item, key, _ in
+    STRING_ITEMS_BEFORE_IP + STRING_ITEMS_AFTER_DOMAIN + STRING_ITEMS_AFTER_IP + STRING_ITEMS_LAST
+    if item not in UINT16_ITEMS
+}
+FLAG_ITEM_KEYS = {item: key for item, key, _ in FLAG_ITEMS}
+UNSUPPORTED_KEYS = ('adguard_domain', 'query_type', 'network_type')
+
+# succinct trie 中的特殊标签：后缀匹配前缀标签与 (非旧版格式的) 根域名标签
+PREFIX_LABEL = '\r'
+ROOT_LABEL = '\n'
+
+LOGICAL_MODES = {'and': 0, 'or': 1}
+
+
+class UnsupportedRuleError(ValueError):
+    """规则集包含内置编解码器不支持的规则项"""
+
+
+class Reader:
+    """ 基于 memoryview 的顺序读取器 """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def byte(self):
+        value = self.data[self.pos]
+        self.pos += 1
+        return value
+
+    def read(self, size):
+        if self.pos + size > len(self.data):
+            raise ValueError("SRS 数据被截断")
+        value = self.data[self.pos:self.pos + size].tobytes()
+        self.pos += size
+        return value
+
+    def uvarint(self):
+        result = shift = 0
+        while True:
+            value = self.byte()
+            result |= (value & 0x7F) << shift
+            if value < 0x80:
+                return result
+            shift += 7
+
+    def uint64(self):
+        return struct.unpack('>Q', self.read(8))[0]
+
+    def bytes_value(self):
+        return self.read(self.uvarint())
+
+    def strings(self):
+        return [self.bytes_value().decode('utf-8') for _ in range(self.uvarint())]
+
+    def uint16s(self):
+        count = self.uvarint()
+        return list(struct.unpack(f'>{count}H', self.read(count * 2)))
+
+    def uint64s(self):
+        count = self.uvarint()
+        return list(struct.unpack(f'>{count}Q', self.read(count * 8)))
+
+
+def write_uvarint(buffer, value):
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def write_bytes(buffer, value):
+    write_uvarint(buffer, len(value))
+    buffer += value
+
+
+def write_strings(buffer, values):
+    write_uvarint(buffer, len(values))
+    for value in values:
+        write_bytes(buffer, str(value).encode('utf-8'))
+
+
+def write_uint16s(buffer, values):
+    write_uvarint(buffer, len(values))
+    buffer += struct.pack(f'>{len(values)}H', *(int(value) for value in values))
+
+
+def write_uint64s(buffer, values):
+    write_uvarint(buffer, len(values))
+    buffer += struct.pack(f'>{len(values)}Q', *values)
+
+
+def as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+# succinct trie (LOUDS)：节点按层序编号，labelBitmap 中每个节点的子节点记为若干 0 再跟一个 1
+def common_prefix_length(a, b):
+    """ 按大整数异或计算公共前缀的字节数 """
+    size = min(len(a), len(b))
+    diff = int.from_bytes(a[:size], 'big') ^ int.from_bytes(b[:size], 'big')
+    return size - (diff.bit_length() + 7) // 8
+
+
+def bits_to_words(bits):
+    """ '0'/'1' 字符串 (低位在前) 转换为 uint64 列表 """
+    bits += '0' * (-len(bits) % 64)
+    return [int(bits[i:i + 64][::-1], 2) for i in range(0, len(bits), 64)]
+
+
+def words_to_bits(words):
+    return ''.join(format(word, '064b')[::-1] for word in words)
+
+
+def build_succinct_set(keys):
+    """
+    由已排序、去重的 bytes 键构建 succinct trie，返回 (leaves, label_bitmap, labels)。
+    第 d 层的节点由与前一个键的公共前缀长度小于 d 的键引入，层内按键的顺序排列。
+    """
+    levels = []
+    previous = None
+    for index, key in enumerate(keys):
+        start = 0 if previous is None else common_prefix_length(previous, key) + 1
+        for depth in range(start, len(key) + 1):
+            if depth == len(levels):
+                levels.append([])
+            levels[depth].append(index)
+        previous = key
+
+    leaves = []
+    bitmap = []
+    labels = bytearray()
+    node_id = 0
+    for depth, nodes in enumerate(levels):
+        children = levels[depth + 1] if depth + 1 < len(levels) else []
+        labels += bytes(keys[index][depth] for index in children)
+        # 节点的子节点是下一层中由 [当前节点的键, 同层下一个节点的键) 之间的键引入的节点
+        boundaries = nodes[1:] + [len(keys)]
+        child = 0
+        for position, index in enumerate(nodes):
+            if len(keys[index]) == depth:
+                leaves.append(node_id + position)
+            end = bisect.bisect_left(children, boundaries[position], child)
+            bitmap.append('0' * (end - child) + '1')
+            child = end
+        node_id += len(nodes)
+
+    leaf_words = [0] * (leaves[-1] // 64 + 1 if leaves else 0)
+    for leaf in leaves:
+        leaf_words[leaf >> 6] |= 1 << (leaf & 63)
+    return leaf_words, bits_to_words(''.join(bitmap)), bytes(labels)
+
+
+def succinct_set_keys(leaves, label_bitmap, labels):
+    """ 按层遍历 succinct trie，返回全部键 (bytes) """
+    node_count = len(labels) + 1
+    child_counts = [len(run) for run in words_to_bits(label_bitmap).split('1')[:node_count]]
+    keys = []
+    level = [b'']
+    node_id = 0
+    next_child = 1
+    while level:
+        next_level = []
+        for key in level:
+            if node_id >> 6 < len(leaves) and leaves[node_id >> 6] >> (node_id & 63) & 1:
+                keys.append(key)
+            count = child_counts[node_id]
+            for child in range(next_child, next_child + count):
+                next_level.append(key + labels[child - 1:child])
+            next_child += count
+            node_id += 1
+        level = next_level
+    return keys
+
+
+def reverse_domain(domain):
+    return domain[::-1]
+
+
+def domain_matcher_keys(domains, domain_suffixes, legacy):
+    """ 与 sing-box 的 domain.NewMatcher 一致地生成 trie 键 """
+    keys = []
+    seen = set()
+    for suffix in domain_suffixes:
+        if not suffix or suffix in seen:
+            continue
+        seen.add(suffix)
+        if suffix[0] == '.':
+            keys.append(reverse_domain(PREFIX_LABEL + suffix))
+        elif legacy:
+            keys.append(reverse_domain(suffix))
+            dotted = '.' + suffix
+            if dotted not in seen:
+                seen.add(dotted)
+                keys.append(reverse_domain(PREFIX_LABEL + dotted))
+        else:
+            keys.append(reverse_domain(ROOT_LABEL + suffix))
+    for domain in domains:
+        if not domain or domain in seen:
+            continue
+        seen.add(domain)
+        keys.append(reverse_domain(domain))
+    return sorted(key.encode('utf-8') for key in keys)
+
+
+def dump_domain_matcher(keys):
+    """ 与 sing-box 的 Matcher.Dump 一致地还原 (domain, domain_suffix) """
+    domains = set()
+    prefixes = set()
+    suffixes = []
+    for key in keys:
+        key = reverse_domain(key.decode('utf-8'))
+        if key[0] == PREFIX_LABEL:
+            prefixes.add(key[1:])
+        elif key[0] == ROOT_LABEL:
+            suffixes.append(key[1:])
+        else:
+            domains.add(key)
+    for prefix in prefixes:
+        if prefix.startswith('.') and prefix[1:] in domains:
+            domains.discard(prefix[1:])
+            suffixes.append(prefix[1:])
+        else:
+            suffixes.append(prefix)
+    return sorted(domains), sorted(suffixes)
+
+
+def write_domain_matcher(buffer, domains, domain_suffixes, legacy):
+    leaves, label_bitmap, labels = build_succinct_set(domain_matcher_keys(domains, domain_suffixes, legacy))
+    buffer.append(0)
+    write_uint64s(buffer, leaves)
+    write_uint64s(buffer, label_bitmap)
+    write_bytes(buffer, labels)
+
+
+def read_domain_matcher(reader):
+    version = reader.byte()
+    if version != 0:
+        raise ValueError(f"未知的域名匹配器版本: {version}")
+    leaves = reader.uint64s()
+    label_bitmap = reader.uint64s()
+    labels = reader.bytes_value()
+    return dump_domain_matcher(succinct_set_keys(leaves, label_bitmap, labels))
+
+
+def write_ip_set(buffer, cidrs):
+    ranges, invalid = cidr_ranges(cidrs)
+    if invalid:
+        raise ValueError(f"无法解析的 CIDR: {invalid[:5]}")
+    buffer.append(1)
+    buffer += struct.pack('>Q', len(ranges[4]) + len(ranges[6]))
+    for version in (4, 6):
+        size = IP_FAMILIES[version][1] // 8
+        for start, end in ranges[version]:
+            write_bytes(buffer, start.to_bytes(size, 'big'))
+            write_bytes(buffer, end.to_bytes(size, 'big'))
+
+
+def read_ip_set(reader):
+    version = reader.byte()
+    if version != 1:
+        raise ValueError(f"未知的 IP 集合版本: {version}")
+    ranges = {4: [], 6: []}
+    for _ in range(reader.uint64()):
+        start = reader.bytes_value()
+        end = reader.bytes_value()
+        ip_version = 4 if len(start) == 4 else 6
+        ranges[ip_version].append((int.from_bytes(start, 'big'), int.from_bytes(end, 'big')))
+    return ranges_to_cidrs(ranges[4], 4) + ranges_to_cidrs(ranges[6], 6)
+
+
+def check_version(key, minimum, version):
+    if version < minimum:
+        raise ValueError(f"{key} 需要规则集版本 {minimum} 以上")
+
+
+def write_string_items(buffer, rule, items, version):
+    for item, key, minimum in items:
+        values = rule.get(key)
+        if not values:
+            continue
+        check_version(key, minimum, version)
+        buffer.append(item)
+        if item in UINT16_ITEMS:
+            write_uint16s(buffer, as_list(values))
+        else:
+            write_strings(buffer, as_list(values))
+
+
+def write_default_rule(buffer, rule, version):
+    unsupported = [key for key in UNSUPPORTED_KEYS if rule.get(key)]
+    if unsupported:
+        raise UnsupportedRuleError(f"不支持的规则项: {unsupported}")
+
+    buffer.append(0)
+    write_string_items(buffer, rule, STRING_ITEMS_BEFORE_IP, version)
+    if rule.get('domain') or rule.get('domain_suffix'):
+        buffer.append(ITEM_DOMAIN)
+        write_domain_matcher(buffer, as_list(rule.get('domain') or []), as_list(rule.get('domain_suffix') or []),
+                             legacy=version == 1)
+    write_string_items(buffer, rule, STRING_ITEMS_AFTER_DOMAIN, version)
+    for item, key in ((ITEM_SOURCE_IP_CIDR, 'source_ip_cidr'), (ITEM_IP_CIDR, 'ip_cidr')):
+        if rule.get(key):
+            buffer.append(item)
+            write_ip_set(buffer, as_list(rule[key]))
+    write_string_items(buffer, rule, STRING_ITEMS_AFTER_IP, version)
+    for item, key, minimum in FLAG_ITEMS:
+        if rule.get(key):
+            check_version(key, minimum, version)
+            buffer.append(item)
+    write_string_items(buffer, rule, STRING_ITEMS_LAST, version)
+    buffer.append(ITEM_FINAL)
+    buffer.append(1 if rule.get('invert') else 0)
+
+
+def write_rule(buffer, rule, version):
+    if rule.get('type', 'default') == 'default':
+        write_default_rule(buffer, rule, version)
+    elif rule['type'] == 'logical':
+        buffer.append(1)
+        buffer.append(LOGICAL_MODES[rule.get('mode', 'and')])
+        write_uvarint(buffer, len(rule['rules']))
+        for sub_rule in rule['rules']:
+            write_rule(buffer, sub_rule, version)
+        buffer.append(1 if rule.get('invert') else 0)
+    else:
+        raise ValueError(f"未知的规则类型: {rule['type']}")
+
+
+def read_default_rule(reader):
+    rule = {}
+    while True:
+        item = reader.byte()
+        if item == ITEM_FINAL:
+            if reader.byte():
+                rule['invert'] = True
+            return rule
+        if item == ITEM_DOMAIN:
+            domains, suffixes = read_domain_matcher(reader)
+            if domains:
+                rule['domain'] = domains
+            if suffixes:
+                rule['domain_suffix'] = suffixes
+        elif item == ITEM_SOURCE_IP_CIDR:
+            rule['source_ip_cidr'] = read_ip_set(reader)
+        elif item == ITEM_IP_CIDR:
+            rule['ip_cidr'] = read_ip_set(reader)
+        elif item in UINT16_ITEMS:
+            rule[UINT16_ITEMS[item]] = reader.uint16s()
+        elif item in STRING_ITEMS:
+            rule[STRING_ITEMS[item]] = reader.strings()
+        elif item in FLAG_ITEM_KEYS:
+            rule[FLAG_ITEM_KEYS[item]] = True
+        elif item in (ITEM_ADGUARD_DOMAIN, ITEM_QUERY_TYPE, ITEM_NETWORK_TYPE):
+            raise UnsupportedRuleError(f"不支持的规则项类型: {item}")
+        else:
+            raise ValueError(f"未知的规则项类型: {item}")
+
+
+def read_rule(reader):
+    rule_type = reader.byte()
+    if rule_type == 0:
+        return read_default_rule(reader)
+    if rule_type != 1:
+        raise ValueError(f"未知的规则类型: {rule_type}")
+    mode = {value: key for key, value in LOGICAL_MODES.items()}[reader.byte()]
+    rules = [read_rule(reader) for _ in range(reader.uvarint())]
+    rule = {"type": "logical", "mode": mode, "rules": rules}
+    if reader.byte():
+        rule['invert'] = True
+    return rule
+
+
+def encode_rules(rules, version=1):
+    """ 生成 zlib 压缩前的规则数据 """
+    if not 1 <= version <= MAX_VERSION:
+        raise ValueError(f"不支持的规则集版本: {version}")
+    buffer = bytearray()
+    write_uvarint(buffer, len(rules))
+    for rule in rules:
+        write_rule(buffer, rule, version)
+    return bytes(buffer)
+
+
+def write_rule_set(rule_set):
+    """
+    将 sing-box 源格式规则集 ({"version": n, "rules": [...]}) 编码为 .srs 字节。
+    zlib 输出与 Go 的实现不逐字节相同，但解压后的数据一致。
+    """
+    version = rule_set.get("version", 1)
+    payload = encode_rules(rule_set.get("rules", []), version)
+    return MAGIC + bytes([version]) + zlib.compress(payload, 9)
+
+
+def decode_rules(payload):
+    reader = Reader(payload)
+    rules = [read_rule(reader) for _ in range(reader.uvarint())]
+    if reader.pos != len(payload):
+        raise ValueError("SRS 数据末尾存在多余内容")
+    return rules
+
+
+def read_rule_set(data):
+    """ 将 .srs 字节解码为 sing-box 源格式规则集 """
+    if data[:3] != MAGIC:
+        raise ValueError("不是 SRS 文件")
+    version = data[3]
+    if not 1 <= version <= MAX_VERSION:
+        raise UnsupportedRuleError(f"不支持的规则集版本: {version}")
+    return {"version": version, "rules": decode_rules(zlib.decompress(data[4:]))}
+
+
+def compile_rule_set(rule_set, output_path):
+    """ 编码并写入 .srs 文件 """
+    data = write_rule_set(rule_set)
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return len(data)
@@ -0,0 +1,194 @@
+# synthetic.py
+"""
+基准测试用的合成规则集：按固定种子生成确定性的 domain、domain_suffix、domain_regex、ip_cidr 与 process_name，
+并渲染为解析器接受的全部输入格式。分布参照真实规则集：
+- 可注册域名由音节拼成，后缀按常见顶级域的占比抽取；少数热门域名拥有大量子域名 (长尾分布)
+- domain 以裸域名和一到两级常见前缀的子域名为主，domain_suffix 与 domain 共享同一批可注册域名
+- ip_cidr 以 /24 为主，包含相互覆盖与相邻的网段，约一成为 IPv6
+"""
+
+import ipaddress
+import json
+import random
+import re
+
+import srs
+from utils import dumps_rule_set, render_clash_rules, render_surge_rules
+
+# 基准规模
+SCALES = {'1k': 1_000, '100k': 100_000, '1M': 1_000_000}
+
+TLD_WEIGHTS = [
+    ('com', 40), ('cn', 14), ('net', 10), ('org', 5), ('io', 4), ('jp', 3), ('com.cn', 3), ('co', 2),
+    ('tv', 2), ('me', 2), ('de', 2), ('co.uk', 2), ('ru', 2), ('xyz', 2), ('top', 2), ('info', 1),
+    ('app', 1), ('dev', 1), ('cc', 1), ('hk', 1)
+]
+SUBDOMAIN_PREFIXES = [
+    'www', 'api', 'cdn', 'img', 'static', 'm', 'mail', 'ads', 'stats', 'log', 'dl', 'update', 'v', 'pic',
+    'track', 'push', 'login', 'video', 'music', 'news', 'shop', 'pay', 'app', 'edge', 'gw', 'open'
+]
+CONSONANTS = 'bcdfghjklmnprstvwxyz'
+VOWELS = 'aeiou'
+PROCESS_SUFFIXES = ['', 'Helper', 'Service', 'Agent', 'Daemon', 'Updater', 'Client', 'Launcher']
+
+
+def _label(rng):
+    """ 由 1-5 个音节拼成的标签，偶尔带数字或连字符 """
+    syllables = rng.choices((1, 2, 3, 4, 5), weights=(10, 35, 35, 15, 5))[0]
+    label = ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(syllables))
+    roll = rng.random()
+    if roll < 0.08:
+        label += str(rng.randrange(1, 1000))
+    elif roll < 0.12:
+        label += '-' + rng.choice(CONSONANTS) + rng.choice(VOWELS) + rng.choice(CONSONANTS)
+    return label
+
+
+def registrable_domains(count, rng):
+    tlds, weights = zip(*TLD_WEIGHTS)
+    result = set()
+    while len(result) < count:
+        result.add(f"{_label(rng)}.{rng.choices(tlds, weights)[0]}")
+    return sorted(result)
+
+
+def _popular(rng, items):
+    """ 按长尾分布抽取，靠前的条目被抽中的概率远高于靠后的条目 """
+    return items[int(len(items) * rng.random() ** 3)]
+
+
+def domains(count, rng, bases):
+    result = set()
+    while len(result) < count:
+        base = _popular(rng, bases)
+        roll = rng.random()
+        if roll < 0.35:
+            result.add(base)
+        elif roll < 0.8:
+            result.add(f"{rng.choice(SUBDOMAIN_PREFIXES)}.{base}")
+        elif roll < 0.95:
+            result.add(f"{rng.choice(SUBDOMAIN_PREFIXES)}.{_label(rng)}.{base}")
+        else:
+            result.add(f"{rng.choice(SUBDOMAIN_PREFIXES)}-{rng.randrange(100)}.{_label(rng)}.{_label(rng)}.{base}")
+    return sorted(result)
+
+
+def domain_suffixes(count, rng, bases):
+    result = set()
+    while len(result) < count:
+        base = _popular(rng, bases)
+        result.add(base if rng.random() < 0.85 else f"{rng.choice(SUBDOMAIN_PREFIXES)}.{base}")
+    return sorted(result)
+
+
+def domain_regexes(count, rng, bases):
+    templates = [
+        lambda base: rf"^(.+\.)?{re.escape(base)}$",
+        lambda base: rf"^ad[sx]?\d*\.{re.escape(base)}$",
+        lambda base: rf"(^|\.)track(ing|er)?\.{re.escape(base.split('.')[0])}\.",
+        lambda base: rf"^[a-z0-9-]+\.{re.escape(base)}$",
+        lambda base: rf"\.{re.escape(base.split('.')[0])}\d{{2,3}}\.(com|net)$",
+    ]
+    result = set()
+    while len(result) < count:
+        result.add(rng.choice(templates)(_popular(rng, bases)))
+    return sorted(result)
+
+
+def domain_keywords(count, rng):
+    """ 常见前缀与短音节组成的关键字，规则集中的关键字通常只有数十到数百个 """
+    result = set(rng.sample(SUBDOMAIN_PREFIXES, min(count, len(SUBDOMAIN_PREFIXES)) // 2))
+    while len(result) < count:
+        result.add(_label(rng)[:rng.randint(3, 6)])
+    return sorted(result)
+
+
+def ip_cidrs(count, rng):
+    prefixes, weights = zip(*[(8, 1), (12, 2), (14, 3), (16, 8), (18, 6), (20, 10), (22, 12), (23, 6), (24, 45),
+                              (26, 3), (28, 2), (32, 2)])
+    result = []
+    seen = set()
+    while len(result) < count:
+        roll = rng.random()
+        if roll < 0.1:
+            prefix = rng.randrange(32, 65, 4)
+            network = ipaddress.IPv6Network((0x2001 << 112 | rng.getrandbits(96) << 16, prefix), strict=False)
+        elif roll < 0.25 and result:
+            # 与已有网段重叠或相邻
+            previous = ipaddress.ip_network(rng.choice(result))
+            if previous.version == 6 or previous.prefixlen >= 32:
+                continue
+            if rng.random() < 0.5:
+                network = next(previous.subnets(new_prefix=min(previous.prefixlen + rng.randint(1, 4), 32)))
+            else:
+                network = ipaddress.IPv4Network((int(previous.broadcast_address) + 1 & 0xFFFFFFFF,
+                                                 previous.prefixlen), strict=False)
+        else:
+            prefix = rng.choices(prefixes, weights)[0]
+            network = ipaddress.IPv4Network((rng.randrange(1, 224) << 24 | rng.getrandbits(24), prefix), strict=False)
+        cidr = str(network)
+        if cidr not in seen:
+            seen.add(cidr)
+            result.append(cidr)
+    return result
+
+
+def process_names(count, rng):
+    result = set()
+    while len(result) < count:
+        name = _label(rng).capitalize() + rng.choice(('', _label(rng).capitalize()))
+        roll = rng.random()
+        if roll < 0.6:
+            result.add(f"{name}{rng.choice(PROCESS_SUFFIXES)}.exe")
+        elif roll < 0.9:
+            result.add(name.lower())
+        else:
+            result.add(f"{name} {rng.choice(PROCESS_SUFFIXES[1:])}")
+    return sorted(result)
+
+
+def rule_set(count, seed=0):
+    """
+    生成约 count 个条目的 sing-box 规则列表：domain 与 domain_suffix 各占约四成，
+    其余为 ip_cidr、domain_regex 与 process_name。真实规则集中的正则很少超过数百条，domain_regex 数量设有上限。
+    """
+    rng = random.Random(seed)
+    bases = registrable_domains(max(count // 3, 10), rng)
+    return [
+        {"domain": domains(max(count * 2 // 5, 1), rng, bases)},
+        {"domain_suffix": domain_suffixes(max(count * 2 // 5, 1), rng, bases)},
+        {"ip_cidr": ip_cidrs(max(count // 8, 1), rng)},
+        {"domain_regex": domain_regexes(min(max(count // 1000, 5), 200), rng, bases)},
+        {"process_name": process_names(max(count // 40, 1), rng)},
+    ]
+
+
+def fixtures(rules, name):
+    """
+    把规则列表渲染为解析器接受的全部输入格式，返回 {文件名: 内容字节}。
+    Clash payload 与 Little Snitch 格式只能表达域名与网段；Little Snitch 按链接中的 little-snitch 关键字识别。
+    AdGuard 列表包含例外、$important、hosts 写法、元素隐藏、正则与 IP，由 adguard.parse_adguard_link 解析。
+    """
+    surge_text = render_surge_rules(rules)
+    values = {category: list(rule_values) for rule in rules for category, rule_values in rule.items()}
+    domains, suffixes = values.get("domain", []), values.get("domain_suffix", [])
+    denied = domains + [suffix.lstrip('.') for suffix in suffixes]
+    payload_rules = [rule for rule in rules if rule.keys() & {"domain", "domain_suffix", "ip_cidr"}]
+    adguard = [f"! Title: {name}", "[Adblock Plus 2.0]"]
+    adguard += [f"||{suffix.lstrip('.')}^$important" if i % 50 == 0 else f"||{suffix.lstrip('.')}^"
+                for i, suffix in enumerate(suffixes)]
+    adguard += [(f"@@||{domain}^", f"|{domain}^", f"0.0.0.0 {domain}", f"{domain}##.banner")[i % 4]
+                for i, domain in enumerate(domains)]
+    adguard += [f"/{pattern}/" for pattern in values.get("domain_regex", [])]
+    adguard += [cidr.split('/')[0] for cidr in values.get("ip_cidr", []) if cidr.endswith('/32')]
+    return {
+        f"{name}.list": surge_text.encode('utf-8'),
+        f"{name}-classical.yaml": ("payload:\n" + "".join(f"  - {line}\n" for line in surge_text.splitlines()))
+        .encode('utf-8'),
+        f"{name}-payload.yaml": render_clash_rules(payload_rules).encode('utf-8'),
+        f"{name}.json": dumps_rule_set({"version": 1, "rules": rules}).encode('utf-8'),
+        f"{name}.srs": srs.write_rule_set({"version": 1, "rules": rules}),
+        f"{name}-little-snitch.lsrules": json.dumps(
+            {"name": name, "denied-remote-domains": denied}, ensure_ascii=False).encode('utf-8'),
+        f"{name}-adguard.txt": ("\n".join(adguard) + "\n").encode('utf-8'),
+    }
@@ -0,0 +1,19 @@
+# conftest.py
+"""
+测试公共设置：把仓库根目录加入模块搜索路径，并切换到临时目录运行。
+各模块导入时会实例化 Config()，它会清空并写入当前目录下的 log.txt，不能在仓库目录中进行。
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+sys.path.insert(0, ROOT)
+_work_dir = tempfile.mkdtemp(prefix='rule-tests-')
+os.chdir(_work_dir)
+atexit.register(shutil.rmtree, _work_dir, ignore_errors=True)
@@ -0,0 +1,120 @@
+# test_compiler.py
+"""
+CompileScheduler 与 main.py 中 SRS / MRS 回退编译的测试。sing-box 与 mihomo 由临时目录中的 shell 脚本代替：
+非零退出码与缺失的命令记为失败并带回 stderr、超时的命令被终止、并发数不超过 max_workers，
+以及关闭内置编码器时 emit 提交的编译命令能由 PATH 中的 sing-box / mihomo 执行。
+"""
+
+import os
+import time
+
+import pytest
+
+import main
+from compiler import CompileScheduler
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason="假编译器是 POSIX shell 脚本")
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """ 返回 make(name, body)：在临时 bin 目录中写出可执行脚本，该目录加在 PATH 最前面 """
+    directory = tmp_path / 'bin'
+    directory.mkdir()
+    monkeypatch.setenv('PATH', f"{directory}{os.pathsep}{os.environ.get('PATH', '')}")
+
+    def make(name, body):
+        path = directory / name
+        path.write_text(f"#!/bin/sh\n{body}\n")
+        path.chmod(0o755)
+        return str(path)
+
+    return make
+
+
+def test_failure_propagation(fake_bin, tmp_path):
+    ok = fake_bin('ok', 'exit 0')
+    broken = fake_bin('broken', 'echo "compile error: $1" >&2\nexit 3')
+    scheduler = CompileScheduler(max_workers=2)
+    scheduler.submit('a.srs', [ok])
+    scheduler.submit('b.srs', [broken, 'b.json'])
+    scheduler.submit('c.srs', [str(tmp_path / 'missing')])
+    failed = {job['name']: job for job in scheduler.run()}
+    assert set(failed) == {'b.srs', 'c.srs'}
+    assert failed['b.srs']['returncode'] == 3
+    assert failed['b.srs']['stderr'] == 'compile error: b.json'
+    assert failed['c.srs']['returncode'] is None
+    assert len(scheduler.results) == 3
+    # 队列在 run 后清空
+    assert scheduler.run() == []
+
+
+def test_timeout(fake_bin):
+    hang = fake_bin('hang', 'exec sleep 30')
+    ok = fake_bin('ok', 'exit 0')
+    scheduler = CompileScheduler(max_workers=2, timeout=0.3)
+    scheduler.submit('hang.mrs', [hang])
+    scheduler.submit('ok.mrs', [ok])
+    start = time.perf_counter()
+    failed = scheduler.run()
+    assert time.perf_counter() - start < 5
+    assert [job['name'] for job in failed] == ['hang.mrs']
+    assert failed[0]['returncode'] is None
+    assert '0.3s' in failed[0]['stderr']
+
+
+def test_concurrency_limit(fake_bin, tmp_path):
+    """ 每个任务运行时记录同时运行的任务数 """
+    running = tmp_path / 'running'
+    running.mkdir()
+    counts = tmp_path / 'counts'
+    job = fake_bin('job', 'touch "$1/$3"\nls "$1" | wc -l >> "$2"\nsleep 0.3\nrm "$1/$3"')
+    scheduler = CompileScheduler(max_workers=2)
+    for i in range(6):
+        scheduler.submit(f"{i}.srs", [job, str(running), str(counts), str(i)])
+    start = time.perf_counter()
+    assert scheduler.run() == []
+    assert time.perf_counter() - start >= 0.9
+    observed = [int(line) for line in counts.read_text().split()]
+    assert len(observed) == 6
+    assert max(observed) == 2
+
+
+@pytest.fixture
+def external_compilers(tmp_path, monkeypatch):
+    """ 关闭内置 SRS / MRS 编码器，在临时目录中构建 """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.config, 'native_srs', False)
+    monkeypatch.setattr(main.config, 'native_mrs', False)
+
+
+def emit(name, rules):
+    parser = main.RuleParser()
+    scheduler = CompileScheduler(max_workers=2)
+    path = os.path.join(main.config.singbox_output_directory, f"{name}.json")
+    parser.save_rule_set(path, rules)
+    parser.emit_rule_sets([path], scheduler)
+    return scheduler
+
+
+def test_emit_falls_back_to_external_compilers(fake_bin, external_compilers):
+    # sing-box rule-set compile --output <srs> <json>; mihomo convert-ruleset <behavior> yaml <yaml> <mrs>
+    fake_bin('sing-box', 'cp "$5" "$4"')
+    fake_bin('mihomo', 'cp "$4" "$5"')
+    scheduler = emit('geosite-example', [{"domain_suffix": ["example.com"]}])
+    assert sorted(name for name, _ in scheduler.jobs) == ['./rule/clash/geosite-example.mrs',
+                                                         './rule/singbox/geosite-example.srs']
+    assert scheduler.run() == []
+    with open('rule/singbox/geosite-example.srs') as f, open('rule/singbox/geosite-example.json') as g:
+        assert f.read() == g.read()
+    with open('rule/clash/geosite-example.mrs') as f, open('rule/clash/geosite-example.yaml') as g:
+        assert f.read() == g.read()
+
+
+def test_emit_reports_failed_compilers(fake_bin, external_compilers):
+    fake_bin('sing-box', 'echo "FATAL: decode rule-set" >&2\nexit 1')
+    fake_bin('mihomo', 'exit 0')
+    scheduler = emit('geoip-example', [{"ip_cidr": ["192.0.2.0/24"]}])
+    failed = scheduler.run()
+    assert [(job['name'], job['returncode'], job['stderr']) for job in failed] == [
+        ('./rule/singbox/geoip-example.srs', 1, 'FATAL: decode rule-set')]
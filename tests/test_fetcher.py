@@ -0,0 +1,146 @@
+# test_fetcher.py
+"""
+Fetcher 与 HttpCache 对本机 HTTP 服务 (http.server, 127.0.0.1) 的测试：
+5xx 的重试与指数退避、ETag / Last-Modified 条件请求返回 304 时使用缓存、离线模式只读取缓存，
+以及缓存的原子写入、延迟创建目录与写入后的 LRU 淘汰。
+"""
+
+import http.server
+import os
+import threading
+
+import pytest
+import requests
+import urllib3.util.retry
+
+import fetcher as fetcher_module
+from fetcher import Fetcher, HttpCache, create_session
+
+ETAG = '"v1"'
+LAST_MODIFIED = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """ /flaky/<n>: 前 n 次返回 503；/down: 总是 503；/etag、/last-modified: 支持条件请求 """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+        count = server.counts[self.path] = server.counts.get(self.path, 0) + 1
+        if self.path.startswith('/flaky/') and count <= int(self.path.rsplit('/', 1)[1]) or self.path == '/down':
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/etag' and self.headers.get('If-None-Match') == ETAG or \
+                self.path == '/last-modified' and self.headers.get('If-Modified-Since') == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"DOMAIN-SUFFIX,example.com # {self.path}\n".encode('utf-8')
+        self.send_response(200)
+        if self.path == '/etag':
+            self.send_header('ETag', ETAG)
+        if self.path == '/last-modified':
+            self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.requests, httpd.counts = [], {}
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """ 记录 urllib3 的退避等待时间而不真正等待 """
+    recorded = []
+    monkeypatch.setattr(urllib3.util.retry.time, 'sleep', recorded.append)
+    monkeypatch.setattr(fetcher_module.config, 'http_backoff_factor', 0.5)
+    monkeypatch.setattr(fetcher_module.config, 'http_backoff_jitter', 0)
+    return recorded
+
+
+def make_fetcher(tmp_path, **kwargs):
+    return Fetcher(session=create_session(), cache=HttpCache(directory=str(tmp_path / 'cache')), **kwargs)
+
+
+def test_retry_with_backoff_on_5xx(server, sleeps, tmp_path):
+    url = server.url + '/flaky/3'
+    content = make_fetcher(tmp_path).get(url)
+    assert content.startswith(b'DOMAIN-SUFFIX,example.com')
+    assert server.counts['/flaky/3'] == 4
+    # 第一次重试不等待，之后按 factor * 2^(n-1) 递增
+    assert sleeps == [1.0, 2.0]
+
+
+def test_gives_up_after_retries(server, sleeps, tmp_path):
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_fetcher(tmp_path).get(server.url + '/down')
+    assert server.counts['/down'] == fetcher_module.config.http_retries + 1
+
+
+@pytest.mark.parametrize('path, header', [('/etag', 'If-None-Match'), ('/last-modified', 'If-Modified-Since')])
+def test_conditional_request_uses_cache(server, tmp_path, path, header):
+    first = make_fetcher(tmp_path)
+    content = first.get(server.url + path)
+    assert first.stats[server.url + path]["source"] == 'network'
+
+    second = make_fetcher(tmp_path)
+    assert second.get(server.url + path) == content
+    assert second.stats[server.url + path]["source"] == '304'
+    assert header in server.requests[-1][1]
+
+
+def test_offline_serves_from_cache(server, tmp_path):
+    url = server.url + '/etag'
+    content = make_fetcher(tmp_path).get(url)
+    requests_before = len(server.requests)
+
+    offline = make_fetcher(tmp_path, offline=True)
+    assert offline.get(url) == content
+    assert offline.stats[url]["source"] == 'cache'
+    with pytest.raises(requests.exceptions.ConnectionError):
+        offline.get(server.url + '/not-cached')
+    assert len(server.requests) == requests_before
+
+
+def test_cache_directory_created_on_save(tmp_path):
+    cache = HttpCache(directory=str(tmp_path / 'cache'))
+    assert cache.load('http://example.invalid/a') == (None, None)
+    assert not (tmp_path / 'cache').exists()
+    cache.save('http://example.invalid/a', b'content', {'ETag': ETAG})
+    assert cache.load('http://example.invalid/a') == (b'content', {
+        'url': 'http://example.invalid/a', 'etag': ETAG, 'last_modified': None, 'size': 7})
+
+
+def test_save_replaces_entry_atomically(tmp_path):
+    cache = HttpCache(directory=str(tmp_path))
+    cache.save('http://example.invalid/a', b'old', {'ETag': '"old"'})
+    cache.save('http://example.invalid/a', b'new content', {'ETag': '"new"'})
+    content, meta = cache.load('http://example.invalid/a')
+    assert (content, meta['etag']) == (b'new content', '"new"')
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == ['.body', '.meta']
+
+
+def test_save_evicts_least_recently_used(tmp_path):
+    cache = HttpCache(directory=str(tmp_path), max_size=25)
+    for i, url in enumerate(('http://example.invalid/a', 'http://example.invalid/b')):
+        cache.save(url, b'x' * 10, {})
+        os.utime(cache._paths(url)[0], (1000 + i, 1000 + i))
+    cache.save('http://example.invalid/c', b'x' * 10, {})
+    assert cache.load('http://example.invalid/a') == (None, None)
+    assert cache.load('http://example.invalid/b')[0] == b'x' * 10
+    assert cache.load('http://example.invalid/c')[0] == b'x' * 10
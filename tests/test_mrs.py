@@ -0,0 +1,56 @@
+# test_mrs.py
+"""
+MRS 编码器的黄金文件测试：fixtures/mrs 中的 .mrs 由 mihomo convert-ruleset 从同名 .yaml 生成，
+取自仓库早期提交中的 rule/clash。mihomo 使用 Go 的 zstd 实现，压缩结果与 zstandard 不逐字节相同，
+比较的是解压后的数据；没有有效规则时两者都写出空文件，直接比较文件内容。
+"""
+
+import glob
+import os
+
+import pytest
+import yaml
+
+import mrs
+from conftest import FIXTURES
+
+zstandard = pytest.importorskip('zstandard')
+
+MRS_FIXTURES = os.path.join(FIXTURES, 'mrs')
+NAMES = sorted(os.path.basename(path)[:-len('.mrs')] for path in glob.glob(os.path.join(MRS_FIXTURES, '*.mrs')))
+
+
+def load_fixture(name):
+    with open(os.path.join(MRS_FIXTURES, f"{name}.yaml"), 'r', encoding='utf-8') as f:
+        items = (yaml.safe_load(f) or {}).get('payload') or []
+    with open(os.path.join(MRS_FIXTURES, f"{name}.mrs"), 'rb') as f:
+        data = f.read()
+    behavior = 'ipcidr' if '-ipcidr' in name else 'domain'
+    return behavior, items, data
+
+
+def decompress(data):
+    return zstandard.ZstdDecompressor().stream_reader(data).read() if data else b''
+
+
+def test_fixture_coverage():
+    assert {load_fixture(name)[0] for name in NAMES if load_fixture(name)[1]} == {'domain', 'ipcidr'}
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_payload_matches_mihomo(name):
+    behavior, items, data = load_fixture(name)
+    assert (mrs.encode_payload(behavior, items) or b'') == decompress(data)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_compiled_file(name, tmp_path):
+    behavior, items, data = load_fixture(name)
+    output_path = tmp_path / f"{name}.mrs"
+    mrs.compile_rule_set(behavior, items, str(output_path))
+    written = output_path.read_bytes()
+    if not data:
+        assert written == data
+    else:
+        assert written[:4] == data[:4]  # zstd 帧头
+        assert decompress(written) == decompress(data)
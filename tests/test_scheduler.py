@@ -0,0 +1,62 @@
+# test_scheduler.py
+"""
+BuildScheduler 工作进程中的 RegexFilter：工作进程内条目数超过阈值时也直接在本进程匹配，不再嵌套创建进程池；
+主进程中仍按 regex_parallel_threshold 分片交给进程池。
+"""
+
+import concurrent.futures
+
+import pytest
+
+import utils
+from scheduler import BuildScheduler, fork_context, in_worker
+from utils import RegexFilter
+
+PATTERNS = [r'^ad\d+\.', r'tracker']
+VALUES = ['ad1.example.com', 'tracker.example.net', 'example.org', 'ads.example.com']
+KEPT = {'example.org', 'ads.example.com'}
+
+
+class NoPool:
+    def __init__(self, *args, **kwargs):
+        raise AssertionError("不应创建进程池")
+
+
+def filter_in_worker(values):
+    """ 工作进程中的任务: 禁止创建进程池后过滤 """
+    utils.concurrent.futures.ProcessPoolExecutor = NoPool
+    return in_worker(), RegexFilter(PATTERNS).filter(values)
+
+
+@pytest.fixture
+def parallel_regex(monkeypatch):
+    monkeypatch.setattr(utils.config, 'regex_parallel_threshold', 1)
+    monkeypatch.setattr(utils.config, 'regex_workers', 2)
+
+
+@pytest.mark.skipif(fork_context() is None, reason="平台不支持 fork")
+def test_worker_filters_in_process(parallel_regex):
+    results = {}
+    build = BuildScheduler(max_workers=2)
+    build.add('filter', filter_in_worker, (VALUES,), on_done=lambda result: results.update(filter=result))
+    assert build.run() == {}
+    assert results['filter'] == (True, KEPT)
+    assert not in_worker()
+
+
+def test_inline_scheduler_keeps_pool(parallel_regex, monkeypatch):
+    created = []
+
+    class RecordingPool(concurrent.futures.ThreadPoolExecutor):
+        def __init__(self, max_workers=None):
+            created.append(max_workers)
+            super().__init__(max_workers=max_workers)
+
+    monkeypatch.setattr(utils.concurrent.futures, 'ProcessPoolExecutor', RecordingPool)
+    results = {}
+    build = BuildScheduler(max_workers=1)
+    build.add('filter', RegexFilter(PATTERNS).filter, (VALUES,), on_done=lambda result: results.update(filter=result))
+    assert build.run() == {}
+    assert results['filter'] == KEPT
+    assert created == [2]
+    assert not in_worker()
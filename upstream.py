@@ -0,0 +1,99 @@
+# upstream.py
+"""
+单次构建内的上游解析结果共享：同一上游被多个规则集引用时只下载、解析一次。
+结果以 (内容 sha256, 解析方式) 为键，链接不同但内容相同的上游也共享同一份结果。
+AdGuard 过滤列表登记时指定解析方式 adguard，与普通规则列表分开缓存。
+被多个规则集引用的上游在主进程中预先解析，工作进程 fork 后直接继承；共享的结果只读，合并阶段不得修改。
+"""
+
+import logging
+from collections import Counter
+
+from config import Config
+from fetcher import fetcher
+from profiler import profiler
+
+config = Config()
+
+
+def link_kind(link):
+    """ 与 RuleParser.parse_link_file_to_json 的分派顺序一致，内容相同但解析方式不同的链接不共享结果 """
+    if link.endswith('.json'):
+        return 'json'
+    if link.endswith('.srs'):
+        return 'srs'
+    if any(keyword in link for keyword in config.ls_keyword):
+        return 'little-snitch'
+    if link.endswith('.yaml') or link.endswith('.txt'):
+        return 'payload'
+    return 'list'
+
+
+class UpstreamStore:
+    """
+    reference() 登记每个规则集引用的上游，被引用不止一次的链接才会缓存，只被引用一次的链接直接解析，不占用内存。
+    命中与未命中记在性能剖析计数器中，工作进程的计数随任务结果合并回主进程。
+    """
+
+    def __init__(self):
+        self.references = Counter()  # 链接 -> 引用它的规则集数
+        self.kinds = {}  # 链接 -> 登记时指定的解析方式
+        self.entries = {}  # (内容 sha256, 解析方式) -> 解析结果
+
+    def reference(self, links, kind=None):
+        links = set(links)
+        self.references.update(links)
+        if kind:
+            self.kinds.update(dict.fromkeys(links, kind))
+
+    def shared_links(self):
+        return [link for link, count in self.references.items() if count > 1]
+
+    def key(self, link):
+        digest = fetcher.digest(link)
+        return (digest, self.kinds.get(link) or link_kind(link)) if digest is not None else None
+
+    def get(self, link, parse):
+        """ 返回 parse(link) 的结果，共享的上游只解析一次 """
+        if self.references[link] <= 1:
+            profiler.count('upstream_unshared')
+            return parse(link)
+        key = self.key(link)
+        if key is None:  # 下载失败，交给 parse 记录错误
+            return parse(link)
+        if key in self.entries:
+            profiler.count('upstream_hits')
+            return self.entries[key]
+        profiler.count('upstream_misses')
+        result = self.entries[key] = parse(link)
+        return result
+
+    def warm(self, parse, parsers=None):
+        """
+        在主进程中解析全部共享上游，之后 fork 的工作进程直接继承，不再各自解析。
+        parsers 为 {解析方式: 解析函数}，登记了解析方式的链接使用对应的函数，其余使用 parse。
+        """
+        parsers = parsers or {}
+        for link in self.shared_links():
+            with profiler.span('parse', url=link):
+                self.get(link, parsers.get(self.kinds.get(link), parse))
+
+    def report(self):
+        """ 命中率 = 1 - 实际解析次数 / 规则集引用上游的总次数 """
+        references = sum(self.references.values())
+        parsed = profiler.counters.get('upstream_misses', 0) + profiler.counters.get('upstream_unshared', 0)
+        if references:
+            logging.info(
+                f"上游解析共享: 引用 {references} 次, 实际解析 {parsed} 次, "
+                f"共享上游 {len(self.shared_links())} 个 (内容去重后 {len(self.entries)} 份), "
+                f"命中率 {max(references - parsed, 0) / references:.1%}"
+            )
+
+    def clear(self):
+        self.references.clear()
+        self.kinds.clear()
+        self.entries.clear()
+
+
+# 每次构建共享的全局实例
+upstream_store = UpstreamStore()
@@ -1,95 +1,133 @@
 # utils.py
 
-import requests
+import concurrent.futures
+import io
 import json
 import re
-import ipaddress
-import pandas as pd
 import yaml
 import logging
 import os
+import shutil
+import socket
+import time
+from json.encoder import encode_basestring
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 from config import Config
+from fetcher import fetcher
+from profiler import profiled, profiler
+from keywords import KeywordAutomaton
+from ruleset import CATEGORIES, RuleSet, SuffixIndex
+from scheduler import in_worker
 
 config = Config()
 
 
-def merge_rules(existing_data, new_data):
-    """
-    合并两个规则集，不进行去重。
-    如果传入的数据是列表，则直接合并。
-    如果传入的数据是字典，按字段进行合并。
-    """
-    # 如果输入数据是列表，直接合并
-    if isinstance(existing_data, list) and isinstance(new_data, list):
-        return existing_data + new_data
-
-    # 否则，按字段进行合并
-    merged_data = {
-        "process_name": (existing_data.get("process_name", []) if isinstance(existing_data, dict) else [])
-                        + (new_data.get("process_name", []) if isinstance(new_data, dict) else []),
-        "domain": (existing_data.get("domain", []) if isinstance(existing_data, dict) else [])
-                  + (new_data.get("domain", []) if isinstance(new_data, dict) else []),
-        "domain_suffix": (existing_data.get("domain_suffix", []) if isinstance(existing_data, dict) else [])
-                         + (new_data.get("domain_suffix", []) if isinstance(new_data, dict) else []),
-        "ip_cidr": (existing_data.get("ip_cidr", []) if isinstance(existing_data, dict) else [])
-                   + (new_data.get("ip_cidr", []) if isinstance(new_data, dict) else []),
-        "domain_regex": (existing_data.get("domain_regex", []) if isinstance(existing_data, dict) else [])
-                        + (new_data.get("domain_regex", []) if isinstance(new_data, dict) else [])
-    }
-    return merged_data
+# IP 聚合算法
+IP_FAMILIES = {4: (socket.AF_INET, 32), 6: (socket.AF_INET6, 128)}
 
 
-def read_yaml_from_url(url):
-    response = requests.get(url)
-    response.raise_for_status()
-    yaml_data = yaml.safe_load(response.text)
-    # logging.info(f"成功读取 YAML 数据 {url}")
-    return yaml_data
+def parse_cidr(cidr):
+    """
+    将 CIDR (或单个 IP) 解析为 (版本, 起始整数, 结束整数)，主机位自动清零。无法解析时返回 None。
+    """
+    address, _, prefix = cidr.strip().partition('/')
+    version = 6 if ':' in address else 4
+    family, bits = IP_FAMILIES[version]
+    try:
+        value = int.from_bytes(socket.inet_pton(family, address), 'big')
+        prefix_len = int(prefix) if prefix else bits
+    except (OSError, ValueError):
+        return None
+    if not 0 <= prefix_len <= bits:
+        return None
+    host_bits = bits - prefix_len
+    start = (value >> host_bits) << host_bits
+    return version, start, start + (1 << host_bits) - 1
+
+
+def merge_ranges(ranges):
+    """ 排序后一次扫描，合并重叠或相邻的整数区间 """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def ranges_to_cidrs(ranges, version):
+    """ 将有序不相交的区间拆分为最少的 CIDR 前缀 """
+    family, bits = IP_FAMILIES[version]
+    size = bits // 8
+    cidrs = []
+    for start, end in ranges:
+        while start <= end:
+            # 起始地址对齐允许的最大块，且不能超出区间
+            block = (start & -start).bit_length() - 1 if start else bits
+            block = min(block, (end - start + 1).bit_length() - 1)
+            cidrs.append(f"{socket.inet_ntop(family, start.to_bytes(size, 'big'))}/{bits - block}")
+            start += 1 << block
+    return cidrs
+
+
+def cidr_ranges(cidrs):
+    """ 解析 CIDR 列表，返回 ({版本: 合并后的区间列表}, 无法解析的条目列表) """
+    ranges = {4: [], 6: []}
+    invalid = []
+    for cidr in cidrs:
+        parsed = parse_cidr(cidr)
+        if parsed is None:
+            invalid.append(cidr)
+        else:
+            ranges[parsed[0]].append((parsed[1], parsed[2]))
+    return {version: merge_ranges(items) for version, items in ranges.items()}, invalid
 
 
-def read_list_from_url(url):
-    try:
-        df = pd.read_csv(url, header=None, names=['pattern', 'address', 'other', 'other2', 'other3'])
-        # logging.info(f"成功读取列表数据 {url}")
-    except Exception as e:
-        logging.error(f"读取 {url} 时出错：{e}")
-        return pd.DataFrame(), []
-
-    filtered_rows = []
-    rules = []
-
-    if 'AND' in df['pattern'].values:
-        and_rows = df[df['pattern'].str.contains('AND', na=False)]
-        for _, row in and_rows.iterrows():
-            rule = {"type": "logical", "mode": "and", "rules": []}
-            pattern = ",".join(row.values.astype(str))
-            components = re.findall(r'\((.*?)\)', pattern)
-            for component in components:
-                for keyword in config.MAP_DICT.keys():
-                    if keyword in component:
-                        match = re.search(f'{keyword},(.*)', component)
-                        if match:
-                            value = match.group(1)
-                            rule["rules"].append({config.MAP_DICT[keyword]: value})
-            rules.append(rule)
-    for index, row in df.iterrows():
-        if 'AND' not in row['pattern']:
-            filtered_rows.append(row)
-    df_filtered = pd.DataFrame(filtered_rows, columns=['pattern', 'address', 'other', 'other2', 'other3'])
-    return df_filtered, rules
-
-
-def is_ipv4_or_ipv6(address):
-    try:
-        ipaddress.IPv4Network(address)
-        return 'ipv4'
-    except ValueError:
-        try:
-            ipaddress.IPv6Network(address)
-            return 'ipv6'
-        except ValueError:
-            return None
+@profiled('cidr_aggregate')
+def aggregate_cidrs(cidrs):
+    """
+    将 ip_cidr 聚合为最小覆盖集合：剔除被更大网段覆盖的网段，合并相邻网段。
+    无法解析的条目原样保留在末尾。
+    """
+    cidrs = list(cidrs)
+    ranges, invalid = cidr_ranges(cidrs)
+    result = ranges_to_cidrs(ranges[4], 4) + ranges_to_cidrs(ranges[6], 6) + invalid
+    if invalid:
+        logging.warning(f"无法解析的 ip_cidr 条目 {len(invalid)} 个: {invalid[:5]}")
+    logging.info(f"ip_cidr 聚合: {len(cidrs)} 条 -> {len(result)} 条")
+    return result
+
+
+def subtract_cidrs(cidrs, removed_cidrs):
+    """ 按地址区间从 cidrs 中剔除 removed_cidrs 覆盖的部分，返回最少的 CIDR 前缀 """
+    ranges, invalid = cidr_ranges(cidrs)
+    removed_ranges, _ = cidr_ranges(removed_cidrs)
+    removed_set = set(removed_cidrs)
+    result = []
+    for version in (4, 6):
+        remaining = []
+        holes = removed_ranges[version]
+        i = 0
+        for start, end in ranges[version]:
+            while i < len(holes) and holes[i][1] < start:
+                i += 1
+            j = i
+            while start <= end and j < len(holes) and holes[j][0] <= end:
+                if holes[j][0] > start:
+                    remaining.append((start, holes[j][0] - 1))
+                start = max(start, holes[j][1] + 1)
+                j += 1
+            if start <= end:
+                remaining.append((start, end))
+        result.extend(ranges_to_cidrs(remaining, version))
+    return result + [cidr for cidr in invalid if cidr not in removed_set]
 
 
 def clean_json_data(data):
@@ -120,394 +158,494 @@ def clean_denied_domains(domains):
     return cleaned_domains
 
 
-def parse_and_convert_to_dataframe(link):
-    rules = []
-    try:
-        if link.endswith('.yaml') or link.endswith('.txt'):
-            yaml_data = read_yaml_from_url(link)
-            rows = []
-            if not isinstance(yaml_data, str):
-                items = yaml_data.get('payload', [])
-            else:
-                lines = yaml_data.splitlines()
-                line_content = lines[0]
-                items = line_content.split()
-            for item in items:
-                address = item.strip("'")
-                if ',' not in item:
-                    if is_ipv4_or_ipv6(item):
-                        pattern = 'IP-CIDR'
-                    else:
-                        if address.startswith('+') or address.startswith('.'):
-                            pattern = 'DOMAIN-SUFFIX'
-                            address = address[1:]
-                            if address.startswith('.'):
-                                address = address[1:]
-                        else:
-                            pattern = 'DOMAIN'
-                else:
-                    pattern, address = item.split(',', 1)
-                if pattern == "IP-CIDR" and "no-resolve" in address:
-                    address = address.split(',', 1)[0]
-                rows.append({'pattern': pattern.strip(), 'address': address.strip(), 'other': None})
-            df = pd.DataFrame(rows, columns=['pattern', 'address', 'other'])
+# 规则文本流式解析
+# AND 逻辑规则的子规则，例如 AND,((DOMAIN,example.com),(DST-PORT,443)) 中的 DOMAIN,example.com
+LOGICAL_COMPONENT_PATTERN = re.compile(r'\(([^()]+)\)')
+# YAML 普通标量不能以这些字符开头，遇到时回退到完整的 YAML 解析
+YAML_INDICATORS = tuple('&*!|>%@`{[')
+
+
+def parse_rule_line(line):
+    """
+    解析一条经典规则 "类型,值[,参数...]"，返回 (规则类型, 值)，无法识别时返回 None。
+    domain_regex 的值可能包含逗号，取类型之后的全部内容；其他类型只取第二个字段，忽略 no-resolve 等参数。
+    """
+    pattern, separator, rest = line.partition(',')
+    pattern = pattern.strip()
+    # IP-CIDR6 保持原有行为，不写入规则集
+    if not separator or pattern == 'IP-CIDR6':
+        return None
+    category = config.map_dict.get(pattern)
+    if category is None:
+        return None
+    value = (rest if category == 'domain_regex' else rest.split(',', 1)[0]).strip()
+    return (category, value) if value else None
+
+
+def parse_payload_item(item):
+    """
+    解析 Clash payload 中的一个条目。含逗号的条目按经典规则处理，
+    否则按 IP/CIDR、域名后缀 (+. 或 . 开头) 与域名推断类型。
+    """
+    item = item.strip()
+    if ',' in item:
+        return parse_rule_line(item)
+    address = item.strip("'")
+    if not address:
+        return None
+    # 只有数字开头或含冒号的条目可能是 IP，避免对每个域名尝试解析
+    if (address[0].isdigit() or ':' in address) and parse_cidr(address):
+        return 'ip_cidr', address
+    if address.startswith(('+', '.')):
+        address = address[1:]
+        if address.startswith('.'):
+            address = address[1:]
+        return ('domain_suffix', address) if address else None
+    return 'domain', address
+
+
+def parse_logical_rule(line):
+    """
+    将 AND 逻辑规则转换为 sing-box 的 logical 规则，子规则嵌套逻辑规则或无法映射时返回 None。
+    """
+    components = LOGICAL_COMPONENT_PATTERN.findall(line)
+    if not components or line.count('(') != len(components) + 1:
+        return None
+    rule = {"type": "logical", "mode": "and", "rules": []}
+    for component in components:
+        entry = parse_rule_line(component)
+        if entry is None:
+            return None
+        category, value = entry
+        if category in ('port', 'source_port'):
+            if not value.isdigit():
+                return None
+            value = int(value)
+        rule["rules"].append({category: [value]})
+    return rule
+
+
+def unquote_yaml_scalar(value):
+    """
+    去掉单行 YAML 标量的引号与行尾注释，需要完整 YAML 语义的写法 (转义、锚点等) 抛出 ValueError。
+    """
+    quote = value[:1]
+    if quote in ("'", '"'):
+        end = value.find(quote, 1)
+        tail = value[end + 1:].strip() if end > 0 else ''
+        if end < 0 or (tail and not tail.startswith('#')) or (quote == '"' and '\\' in value):
+            raise ValueError(f"无法逐行解析的 YAML 标量: {value}")
+        return value[1:end]
+    if value.startswith(YAML_INDICATORS) or ': ' in value:
+        raise ValueError(f"无法逐行解析的 YAML 标量: {value}")
+    return value.split(' #', 1)[0].rstrip()
+
+
+def iter_payload_items(text):
+    """
+    逐行产出 Clash 规则集 YAML 中 payload 列表的条目，不构建完整的 YAML 文档。
+    只支持 "payload:" 后跟 "- 条目" 的块状列表，遇到其他结构时抛出 ValueError。
+    """
+    in_payload = False
+    for line in io.StringIO(text):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if not in_payload and line == 'payload:':
+            in_payload = True
+        elif in_payload and line.startswith('- '):
+            yield unquote_yaml_scalar(line[2:].strip())
         else:
-            df, rules = read_list_from_url(link)
-    except Exception as e:
-        logging.error(f"解析 {link} 时出错：{e}")
-        return pd.DataFrame(), []
+            raise ValueError(f"无法逐行解析的 YAML 结构: {line}")
 
-    # logging.info(f"成功解析链接 {link}")
-    return df, rules
 
+def read_yaml_payload(text):
+    """ 完整解析 YAML，兼容 payload 以外的写法 (例如空格分隔的纯文本域名列表) """
+    yaml_data = yaml.safe_load(text)
+    if isinstance(yaml_data, str):
+        return yaml_data.splitlines()[0].split()
+    return [str(item) for item in yaml_data.get('payload') or []]
 
-def sort_dict(obj):
-    if isinstance(obj, dict):
-        return {k: sort_dict(obj[k]) for k in sorted(obj)}
-    elif isinstance(obj, list) and all(isinstance(elem, dict) for elem in obj):
-        return sorted([sort_dict(x) for x in obj], key=lambda d: sorted(d.keys())[0])
-    elif isinstance(obj, list):
-        return sorted(sort_dict(x) for x in obj)
-    else:
-        return obj
 
+def iter_list_rules(text):
+    """
+    逐行产出 Surge/Clash 经典规则列表中的规则：普通规则为 (规则类型, 值)，AND 逻辑规则为 ('logical', 规则)。
+    """
+    for line in io.StringIO(text):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('AND,'):
+            rule = parse_logical_rule(line)
+            if rule is None:
+                logging.debug(f"跳过无法转换的逻辑规则: {line}")
+                continue
+            yield 'logical', rule
+        else:
+            yield parse_rule_line(line)
 
-def make_hashable(item):
-    """递归地将可变类型（如列表）转换为元组，以便它们可以添加到集合中"""
-    if isinstance(item, dict):
-        # 如果是字典，将其转换为元组
-        return tuple((key, make_hashable(value)) for key, value in item.items())
-    elif isinstance(item, list):
-        # 如果是列表，将每个元素递归转换为元组
-        return tuple(make_hashable(i) for i in item)
-    else:
-        # 如果是其他不可变类型，直接返回
-        return item
 
+def collect_rules(entries):
+    """
+    将规则逐条归入 config.map_dict 对应的规则类型，各类型内按出现顺序去重。
+    返回 ({规则类型: {值: None}}, [logical 规则])。
+    """
+    buckets = {}
+    logical_rules = []
+    for entry in entries:
+        if entry is None:
+            continue
+        category, value = entry
+        if category == 'logical':
+            logical_rules.append(value)
+            continue
+        bucket = buckets.get(category)
+        if bucket is None:
+            bucket = buckets[category] = {}
+        bucket[value] = None
+    return buckets, logical_rules
+
+
+def parse_rule_text(link):
+    """
+    解析 Clash payload YAML (.yaml/.txt) 或 Surge/Clash 经典规则列表，出错时返回空结果。
+    YAML 优先逐行解析，结构不符合时回退到 yaml.safe_load。
+    """
+    try:
+        text = fetcher.get_text(link)
+        if link.endswith('.yaml') or link.endswith('.txt'):
+            try:
+                return collect_rules(map(parse_payload_item, iter_payload_items(text)))
+            except ValueError as e:
+                logging.debug(f"{link} 回退到完整 YAML 解析: {e}")
+                return collect_rules(map(parse_payload_item, read_yaml_payload(text)))
+        return collect_rules(iter_list_rules(text))
+    except Exception as e:
+        logging.error(f"解析 {link} 时出错：{e}")
+        return {}, []
 
-def subtract_rules(base_data, subtract_data):
-    """从 base_data 中剔除 subtract_data 的规则，并且加入步骤以保存数据"""
 
-    # 1. 保存 subtract_data 中的条目到 saved_data
-    saved_data = {
-        "process_name": [],
-        "domain": [],
-        "domain_suffix": [],
-        "ip_cidr": [],
-        "domain_regex": []
-    }
+def subtract_rule_set(base, removed):
+    """
+    从 base 中剔除 removed 的规则，原地修改并返回 base。
+    两者合并去重后，剔除 removed 中完全相同的条目、被 removed 中 domain_suffix 覆盖的 domain 与更细的 domain_suffix，
+    ip_cidr 按地址区间剔除。包含 removed 中 domain_keyword 的条目保留：Clash 无法表达关键字，剔除后两边都不再匹配该域名。
+    """
+    deduplicate_rule_set(base.update(removed))
 
-    # 收集 subtract_data 中的条目
-    for key in saved_data.keys():
-        # 将 subtract_data 中的对应规则添加到 saved_data
-        for rule in subtract_data:
-            if isinstance(rule, dict) and key in rule:
-                saved_data[key].extend(rule[key])
+    removed_counts = {}
+    if base.ip_cidr and removed.ip_cidr:
+        kept = subtract_cidrs(base.ip_cidr, removed.ip_cidr)
+        removed_counts["ip_cidr"] = len(base.ip_cidr) - len(kept)
+        base.ip_cidr = set(kept)
+    exact = [category for category in CATEGORIES if category != "ip_cidr"]
+    for counts in (base.difference_update(removed, categories=exact),
+                   base.covered_by(SuffixIndex(removed.domain_suffix))):
+        for key, count in counts.items():
+            removed_counts[key] = removed_counts.get(key, 0) + count
 
-    # 2. 合并 base_data 和 subtract_data
-    merged_data = merge_rules(base_data, subtract_data)
-    # 3. 调用 deduplicate_json 去重
-    deduplicated_data = deduplicate_json(merged_data)
+    logging.info(f"规则剔除完成，各类别剔除数量: {removed_counts}")
+    return base
 
-    # 4. 从去重后的数据中剔除 saved_data 中的条目
-    for key in saved_data.keys():
-        if saved_data[key]:
-            for item in deduplicated_data:
-                if isinstance(item, dict) and key in item:
-                    item[key] = [val for val in item[key] if val not in saved_data[key]]
 
-    # 返回最终处理后的数据
-    return deduplicated_data
+def subtract_rules(base_data, subtract_data):
+    """ 规则列表版本的 subtract_rule_set，返回剔除后的规则列表 """
+    return subtract_rule_set(RuleSet(base_data), RuleSet(subtract_data)).to_rules()
+
+
+def json_backend():
+    """ 返回 orjson 模块 (config.json_backend 为 auto 且已安装时)，否则返回 None 表示使用标准库 """
+    return orjson if config.json_backend == 'auto' else None
 
 
 def load_json(filepath):
     """加载 JSON 文件"""
+    backend = json_backend()
+    if backend is not None:
+        with open(filepath, "rb") as f:
+            return backend.loads(f.read())
     with open(filepath, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+def sort_rules(rules):
+    """ 规则中的字符串条目按字典序排列，逻辑规则与非字符串条目保持原样，使相同输入总是生成相同的文件 """
+    sorted_rules = []
+    for rule in rules:
+        if isinstance(rule, dict) and rule.get("type") != "logical":
+            rule = {
+                key: sorted(values) if isinstance(values, list) and all(isinstance(v, str) for v in values) else values
+                for key, values in rule.items()
+            }
+        sorted_rules.append(rule)
+    return sorted_rules
+
+
+def dumps_compact(data):
+    backend = json_backend()
+    if backend is not None:
+        return backend.dumps(data).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def dumps_rule_set(rule_set, profile=None):
+    """
+    按输出格式序列化 {"version": 1, "rules": [...]}：
+    - pretty: json.dump(indent=4) 的旧格式
+    - compact: 不含任何空白
+    - lines: 每个条目独占一行且不缩进，体积接近 compact，同时 git diff 只涉及变化的条目
+    """
+    profile = profile or config.json_profile
+    if profile == 'pretty':
+        return json.dumps(rule_set, ensure_ascii=False, indent=4)
+    if profile == 'compact':
+        return dumps_compact(rule_set)
+
+    def dumps_rule(rule):
+        if not isinstance(rule, dict) or rule.get("type") == "logical":
+            return dumps_compact(rule)
+        return '{' + ','.join(
+            f"{encode_basestring(key)}:[\n" + ',\n'.join(map(encode_basestring, values)) + '\n]'
+            if isinstance(values, list) and values and all(isinstance(v, str) for v in values)
+            else f"{encode_basestring(key)}:{dumps_compact(values)}"
+            for key, values in rule.items()
+        ) + '}'
+
+    head = {key: value for key, value in rule_set.items() if key != "rules"}
+    text = dumps_compact(head)[:-1] + (',' if head else '') + '"rules":['
+    rules = rule_set.get("rules", [])
+    if rules:
+        text += '\n' + ',\n'.join(map(dumps_rule, rules)) + '\n'
+    return text + ']}\n'
+
+
 def save_json(data, filepath):
     """保存 JSON 文件"""
     try:
         # 假设 data 已经是一个包含规则的列表，如：{"domain": [...]}, {"ip_cidr": [...]}, ...
-        result = {
-            "version": 1,
-            "rules": data
-        }
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=4)
+        if config.json_sort_rules:
+            data = sort_rules(data)
+        write_text(filepath, dumps_rule_set({"version": 1, "rules": data}))
     except Exception as e:
         logging.error(f"保存 JSON 文件时出错: {e}")
 
 
-def deduplicate_json(data):
+def deduplicate_rule_set(rule_set):
     """
-    对输入的 JSON 数据进行三轮去重操作：
-    1. 第一轮去重：检查 process_name, domain, domain_suffix, ip_cidr, domain_regex 中是否有完全一致的条目。
-    2. 第二轮去重：使用 domain_regex 清洗 domain 和 domain_suffix。
-    3. 第三轮去重：使用 domain_suffix 去重 domain，基于 Trie 进行去重。
+    对规则集进行去重，原地修改并返回 rule_set (集合本身已去除完全相同的条目)：
+    1. 使用 domain_regex 清洗 domain 和 domain_suffix。
+    2. 将 ip_cidr 聚合为最小覆盖集合。
+    3. 使用 domain_suffix 去重 domain，基于后缀索引进行去重。
+    去重前先把 domain_suffix 精简为最小覆盖集合并剔除已被覆盖的 domain_regex，再剔除包含其他关键字的 domain_keyword。
     """
+    log_collapsed(rule_set.collapse_suffixes())
+    log_keyword_pruning(*rule_set.prune_keywords())
 
-    # 第一轮去重：初始化合并规则
-    merged_rules = {
-        "process_name": set(),
-        "domain": set(),
-        "domain_suffix": set(),
-        "ip_cidr": set(),
-        "domain_regex": set()
-    }
+    # 用 domain_regex 去重 domain 和 domain_suffix：所有正则只编译一次，每个条目只遍历一次
+    if rule_set.domain_regex:
+        regex_filter = RegexFilter(rule_set.domain_regex)
+        rule_set.domain = regex_filter.filter(rule_set.domain, mode='search')
+        rule_set.domain_suffix = regex_filter.filter(rule_set.domain_suffix, mode='match')
+        regex_filter.report()
 
-    # 遍历输入列表，逐一合并规则
-    for rule in data:
-        if isinstance(rule, dict):  # 确保条目是字典
-            for category, values in rule.items():
-                if category in merged_rules:
-                    if isinstance(values, list):
-                        merged_rules[category].update(values)
-                    elif isinstance(values, str):
-                        merged_rules[category].add(values)
-
-    # 第二轮去重：使用 domain_regex 清洗 domain 和 domain_suffix
-    final_domains = merged_rules["domain"].copy()
-    domain_suffix = merged_rules["domain_suffix"]
-    domain_regex = merged_rules["domain_regex"]
-
-    # 用 domain_regex 去重 domain 和 domain_suffix
-    if domain_regex:
-        # 清洗 domain
-        for regex in domain_regex:
-            final_domains = {domain for domain in final_domains if not match_domain_regex(domain, regex)}
-
-        # 清洗 domain_suffix
-        for regex in domain_regex:
-            domain_suffix = {suffix for suffix in domain_suffix if not match_domain_suffix_regex(suffix, regex)}
-
-    merged_rules["domain"] = final_domains
-    merged_rules["domain_suffix"] = domain_suffix
-
-    # 第三轮去重：使用 Trie 对 domain_suffix 去重，并清洗 domain
-    final_domains, _ = filter_domains_with_trie(merged_rules["domain"], merged_rules["domain_suffix"])
-    merged_rules["domain"] = final_domains
-
-    # 构造最终的输出列表
-    final_rules = []
-    for category, values in merged_rules.items():
-        if values:
-            final_rules.append({category: list(values)})
-
-    return final_rules
-
-
-def convert_sets_to_lists(data):
-    """递归地将字典中的所有 set 转换为 list"""
-    if isinstance(data, dict):
-        return {key: convert_sets_to_lists(value) for key, value in data.items()}
-    elif isinstance(data, list):
-        return [convert_sets_to_lists(item) for item in data]
-    elif isinstance(data, set):
-        return list(data)
-    else:
-        return data
-
-
-def match_domain_regex(domain, regex):
-    """
-    根据 domain 和 domain_regex 判断是否匹配
-    假设这里是简单的正则匹配，你可以根据实际情况调整
-    """
-    return bool(re.search(regex, domain))
-
-
-def match_domain_suffix_regex(suffix, regex):
-    """
-    用于匹配 domain_suffix 的正则表达式，确保是匹配后缀
-    """
-    return bool(re.match(f"^{regex}$", suffix))
-
-
-# json去重算法
-class TrieNode:
-    def __init__(self):
-        self.children = {}
-        self.is_end = False
-
-
-class Trie:
-    def __init__(self):
-        self.root = TrieNode()
-
-    def insert(self, suffix):
-        """ 插入 domain_suffix，确保不包含前导 . """
-        suffix = suffix.lstrip('.')
-        node = self.root
-        for char in reversed(suffix):  # 倒序插入，方便匹配后缀
-            if char not in node.children:
-                node.children[char] = TrieNode()
-            node = node.children[char]
-        node.is_end = True
-
-    def has_suffix(self, domain):
-        """ 检查 domain 是否匹配某个完整的 domain_suffix """
-        node = self.root
-        domain = '.' + domain  # 加入前导点进行后缀匹配
-
-        # 从尾部倒序遍历 domain
-        for i in range(len(domain)):
-            char = domain[-(i + 1)]
-            if node.is_end and i != 0:  # 如果已经匹配到后缀，且 i != 0，代表匹配到完整后缀
-                # 确保匹配的后缀是完整的二级域名
-                if i == len(domain) - 1:  # 完全匹配
-                    return True
-                elif domain[-(i + 1)] == '.':  # 确保后缀结束在域名边界
-                    return True
-                else:
-                    return False  # 如果有更多字符，且未结束，说明匹配是部分的
-            if char not in node.children:
-                return False
-            node = node.children[char]
+    # 聚合 ip_cidr：剔除被覆盖的网段并合并相邻网段
+    if rule_set.ip_cidr:
+        rule_set.ip_cidr = set(aggregate_cidrs(rule_set.ip_cidr))
 
-        # 完全匹配一个后缀时，结束条件
-        return node.is_end
+    # 使用后缀索引对 domain_suffix 去重，并清洗 domain
+    rule_set.domain, _ = filter_domains_with_trie(rule_set.domain, rule_set.domain_suffix)
+    return rule_set
 
 
-def filter_domains_with_trie(domains, domain_suffixes):
-    trie = Trie()
-    for suffix in domain_suffixes:
-        trie.insert(suffix)
+def log_collapsed(removed, label="后缀覆盖精简"):
+    """ 记录 collapse_suffixes 剔除的各类别条目数 """
+    profiler.count('suffix_collapsed', removed.get("domain_suffix", 0))
+    profiler.count('regex_implied', removed.get("domain_regex", 0))
+    if any(removed.values()):
+        logging.info(f"{label}: 各类别剔除数量 {removed}")
 
-    filtered_domains = set()
-    filtered_count = 0
 
-    # 预处理：把所有后缀规范化为不含前导点的形式，放在集合里（便于快速比对）
-    clean_suffixes = {s.lstrip('.') for s in domain_suffixes}
+def log_keyword_pruning(removed, automaton, label="domain_keyword 覆盖"):
+    """ 记录 prune_keywords 剔除的各类别条目数与各关键字的覆盖数 """
+    profiler.count('keyword_pruned', sum(removed.values()))
+    if any(removed.values()):
+        logging.info(f"{label}: 各类别剔除数量 {removed}")
+        automaton.report(label)
 
-    for domain in domains:
-        if trie.has_suffix(domain):
-            # 如果 domain 恰好等于某个后缀（根域名），则保留
-            if domain in clean_suffixes:
-                filtered_domains.add(domain)
-            else:
-                filtered_count += 1
-        else:
-            filtered_domains.add(domain)
 
-    return filtered_domains, filtered_count
+def deduplicate_json(data):
+    """ 规则列表版本的 deduplicate_rule_set，返回去重后的规则列表 """
+    return deduplicate_rule_set(RuleSet(data)).to_rules()
+
 
-def convert_json_to_surge(input_dir):
+class RegexFilter:
     """
-    读取指定目录下的所有 JSON 文件，将其转换为 Surge 和 Shadowrocket 规则，并存储在 config 指定的目录下。
+    domain_regex 过滤引擎：所有正则只编译一次，并按 group_size 个一组合并成交替分支，
+    每个条目只需匹配少数几个组合正则。命中后再在组内定位具体正则，用于统计各正则剔除的条目数。
+    - search 模式与 re.search(regex, domain) 等价，用于清洗 domain
+    - match 模式与 re.match(f"^{regex}$", suffix) 等价，用于清洗 domain_suffix
     """
-    surge_output_dir = config.surge_output_directory
-    shadowrocket_output_dir = config.shadowrocket_output_directory
-
-    os.makedirs(surge_output_dir, exist_ok=True)
-    os.makedirs(shadowrocket_output_dir, exist_ok=True)
-
-    for filename in os.listdir(input_dir):
-        if filename.endswith(".json"):
-            input_path = os.path.join(input_dir, filename)
-            surge_output_path = os.path.join(surge_output_dir, filename.replace(".json", ".list"))
-            shadowrocket_output_path = os.path.join(shadowrocket_output_dir, filename.replace(".json", ".list"))
 
+    def __init__(self, patterns, group_size=None):
+        self.group_size = group_size or config.regex_group_size
+        self.patterns = []
+        for pattern in sorted(set(patterns)):
+            try:
+                re.compile(pattern)
+                self.patterns.append(pattern)
+            except re.error as e:
+                logging.warning(f"跳过无效的 domain_regex {pattern}: {e}")
+        self.groups = {
+            'search': self._build_groups(lambda p: p, lambda compiled: compiled.search),
+            'match': self._build_groups(lambda p: f"^{p}$", lambda compiled: compiled.match)
+        }
+        self.removed = {'search': {}, 'match': {}}
+
+    def _build_groups(self, wrap, method):
+        """
+        返回 [(组合正则的匹配函数, [(正则, 单个正则的匹配函数)])]。
+        含反向引用的正则合并后编号会错位，组合编译失败的组也拆开单独匹配。
+        """
+        groups = []
+        shared = []
+        for pattern in self.patterns:
             try:
-                with open(input_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                # 计算一次 `surge_rules`
-                surge_rules = []
-                for rule in data.get("rules", []):
-                    for rule_type, values in rule.items():
-                        if rule_type in config.SINGBOX_TO_SURGE_MAP:
-                            surge_type = config.SINGBOX_TO_SURGE_MAP[rule_type]
-                            for value in values:
-                                surge_rules.append(f"{surge_type},{value}")
-
-                # 将规则写入 Surge 和 Shadowrocket 文件
-                with open(surge_output_path, "w", encoding="utf-8") as f1, \
-                        open(shadowrocket_output_path, "w", encoding="utf-8") as f2:
-                    # 直接写入每个规则
-                    for rule in surge_rules:
-                        f1.write(f"{rule}\n")
-                        f2.write(f"{rule}\n")
-
-                logging.info(f"转换完成: {input_path} → {surge_output_path}, {shadowrocket_output_path}")
-
-            except Exception as e:
-                logging.error(f"转换 {input_path} 时出错: {e}")
-
-
-def convert_adguard_to_surge(input_path, rule_set_name):
-    """
-    读取 AdGuard 规则文件，并转换为 Surge/Shadowrocket 规则。
-    结果分别存储在 `config.surge_output_dir` 和 `config.shadowrocket_output_dir` 目录下。
-    """
-    if not os.path.exists(input_path):
-        logging.error(f"文件不存在: {input_path}")
-        return
-
-    # 固定输出目录
-    surge_output_dir = config.surge_output_directory
-    shadowrocket_output_dir = config.shadowrocket_output_directory
-
-    os.makedirs(surge_output_dir, exist_ok=True)
-    os.makedirs(shadowrocket_output_dir, exist_ok=True)
-
-    # 生成输出文件名
-    output_filename = f"{rule_set_name}.list"
-    surge_output_path = os.path.join(surge_output_dir, output_filename)
-    shadowrocket_output_path = os.path.join(shadowrocket_output_dir, output_filename)
-
-    surge_rules = []
-    with open(input_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("!") or line.startswith("["):  # 忽略注释和无效行
+                matcher = method(re.compile(wrap(pattern)))
+            except re.error as e:
+                logging.warning(f"跳过无法用于该模式的 domain_regex {wrap(pattern)}: {e}")
                 continue
+            if re.search(r'\\[1-9]|\(\?P=', pattern):
+                groups.append((matcher, [(pattern, matcher)]))
+            else:
+                shared.append((pattern, matcher))
 
-            # 处理 DOMAIN-SUFFIX 规则 (||example.com^)
-            if line.startswith("||"):
-                domain = line[2:].split("^")[0]
-                surge_rules.append(f"DOMAIN-SUFFIX,{domain}")
-            # 处理 DOMAIN 规则 (example.com^)
-            elif line.endswith("^") and not line.startswith("|") and not line.startswith("@@"):
-                domain = line[:-1]
-                surge_rules.append(f"DOMAIN,{domain}")
-            # 处理 DOMAIN 规则 (|example.com)
-            elif line.startswith("|") and "/" not in line:
-                domain = line[1:]
-                surge_rules.append(f"DOMAIN,{domain}")
-
-            # 处理 URL 规则 (|http://example.com/ads.js)
-            elif line.startswith("|http"):
-                url = line[1:].replace(".", r"\.")  # 转义 .
-                surge_rules.append(f"URL-REGEX,^{url}$")
-
-            # 处理 URL 正则匹配规则 (/ads\.(js|php)/)
-            elif line.startswith("/") and line.endswith("/"):
-                regex = line[1:-1]  # 去掉前后的 /
-                surge_rules.append(f"URL-REGEX,{regex}")
-
-            # 处理 IP-CIDR 规则 (127.0.0.1)
-            elif re.match(r"^\d+\.\d+\.\d+\.\d+$", line):
-                surge_rules.append(f"IP-CIDR,{line}/32")
-
-            # 处理允许（白名单）规则 (@@||example.com^)
-            elif line.startswith("@@||"):
-                domain = line[4:].split("^")[0]
-                surge_rules.append(f"DOMAIN-SUFFIX,{domain},DIRECT")
-
-            # 其他规则忽略
+        for i in range(0, len(shared), self.group_size):
+            members = shared[i:i + self.group_size]
+            try:
+                combined = re.compile('|'.join(f"(?:{wrap(p)})" for p, _ in members))
+                groups.append((method(combined), members))
+            except re.error:
+                groups.extend((matcher, [(p, matcher)]) for p, matcher in members)
+        return groups
+
+    def first_match(self, value, mode):
+        """ 返回第一个命中 value 的正则，未命中时返回 None """
+        for combined, members in self.groups[mode]:
+            if combined(value):
+                for pattern, matcher in members:
+                    if matcher(value):
+                        return pattern
+        return None
+
+    @profiled('regex_filter')
+    def filter(self, values, mode='search'):
+        """
+        返回未被任何正则命中的条目集合。条目较多时分片交给进程池并行处理；
+        已在 BuildScheduler 的工作进程中时直接在本进程匹配，避免每个工作进程再各自创建进程池造成 CPU 超额订阅。
+        """
+        values = list(values)
+        workers = config.regex_workers or os.cpu_count() or 1
+        if workers > 1 and len(values) >= config.regex_parallel_threshold and not in_worker():
+            chunk_size = -(-len(values) // workers)
+            chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_regex_filter_chunk, [self.patterns] * len(chunks),
+                                            [mode] * len(chunks), chunks))
+        else:
+            results = [self._filter_chunk(values, mode)]
+
+        kept = set()
+        removed = self.removed[mode]
+        for chunk_kept, chunk_removed in results:
+            kept.update(chunk_kept)
+            for pattern, count in chunk_removed.items():
+                removed[pattern] = removed.get(pattern, 0) + count
+        profiler.count('regex_filtered', len(values) - len(kept))
+        return kept
+
+    def _filter_chunk(self, values, mode):
+        kept = []
+        removed = {}
+        for value in values:
+            pattern = self.first_match(value, mode)
+            if pattern is None:
+                kept.append(value)
             else:
-                logging.warning(f"未识别的 AdGuard 规则: {line}")
+                removed[pattern] = removed.get(pattern, 0) + 1
+        return kept, removed
+
+    def report(self, top=10):
+        """ 记录每个正则剔除的条目数，便于发现过宽或耗时的上游正则 """
+        domain_removed = sum(self.removed['search'].values())
+        suffix_removed = sum(self.removed['match'].values())
+        totals = {}
+        for removed in self.removed.values():
+            for pattern, count in removed.items():
+                totals[pattern] = totals.get(pattern, 0) + count
+        ranking = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+        logging.info(
+            f"domain_regex 清洗: {len(self.patterns)} 个正则, 剔除 domain {domain_removed} 条, "
+            f"domain_suffix {suffix_removed} 条; 剔除最多的正则: "
+            + ", ".join(f"{pattern} ({count})" for pattern, count in ranking)
+        )
+
+
+def _regex_filter_chunk(patterns, mode, values):
+    """ 进程池工作函数：在子进程中重建 RegexFilter 并过滤一个分片 """
+    return RegexFilter(patterns)._filter_chunk(values, mode)
+
+
+@profiled('trie_filter')
+def filter_domains_with_trie(domains, domain_suffixes):
+    """
+    剔除被 domain_suffix 覆盖的 domain。与某个后缀完全相同的 domain (根域名) 保留。
+    返回 (保留的 domain 集合, 剔除数量)。
+    """
+    index = SuffixIndex(domain_suffixes)
 
-    # **写入 Surge & Shadowrocket 规则文件**
-    rule_text = "\n".join(surge_rules)
-    with open(surge_output_path, "w", encoding="utf-8") as f1, \
-            open(shadowrocket_output_path, "w", encoding="utf-8") as f2:
-        f1.write(rule_text)
-        f2.write(rule_text)
+    start = time.perf_counter()
+    filtered_domains = set()
+    filtered_count = 0
+    for domain in domains:
+        if domain in index or not index.has_parent(domain):
+            filtered_domains.add(domain)
+        else:
+            filtered_count += 1
+    index.query_time = time.perf_counter() - start
+    index.query_count = len(domains)
 
-    logging.info(f"AdGuard 规则转换完成: {input_path} → {surge_output_path}, {shadowrocket_output_path}")
+    index.report("domain 去重")
+    profiler.count('trie_filtered', filtered_count)
+    return filtered_domains, filtered_count
+
+
+def render_surge_rules(rules):
+    """ 将 sing-box 规则列表渲染为 Surge/Shadowrocket 规则文本 """
+    lines = []
+    for rule in rules:
+        for rule_type, values in rule.items():
+            surge_type = config.SINGBOX_TO_SURGE_MAP.get(rule_type)
+            if surge_type:
+                lines.extend(f"{surge_type},{value}" for value in values)
+    return ''.join(f"{line}\n" for line in lines)
+
+
+def write_text(path, text):
+    """ 一次性写入整个文件。先删除旧文件，避免截断与其他硬链接共享的 inode """
+    if os.path.lexists(path):
+        os.remove(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def link_or_copy(source, target):
+    """ 内容相同的产物只写一次：优先创建硬链接，文件系统不支持时退回复制 """
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
 
 
 def clean_comment(value):
@@ -520,131 +658,104 @@ def fix_domain_prefix(value):
     return value.lstrip(".") if value.startswith(".") else value
 
 
-def convert_json_to_clash(input_dir):
+def clash_payload(rules):
     """
-    读取指定目录下的所有 JSON 规则文件，并将其转换为 Clash 规则格式。
+    将 sing-box 规则列表转换为 Clash payload 条目，返回 [(值, 是否加引号)]。
+    YAML 与 MRS 共用同一份条目，保证两者内容一致。
     """
-    output_dir = config.clash_output_directory
-    os.makedirs(output_dir, exist_ok=True)
-
-    for filename in os.listdir(input_dir):
-        if filename.endswith(".json"):
-            input_path = os.path.join(input_dir, filename)
-            output_path = os.path.join(output_dir, filename.replace(".json", ".yaml"))
-
-            try:
-                with open(input_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                clash_rules = []
-                for rule in data.get("rules", []):
-                    for rule_type, values in rule.items():
-                        if rule_type in config.SINGBOX_TO_CLASH_MAP:
-                            clash_type = config.SINGBOX_TO_CLASH_MAP[rule_type]
-                            for value in (values if isinstance(values, list) else [values]):
-                                cleaned_value = clean_comment(value)
+    clash_rules = []
+    for rule in rules:
+        for rule_type, values in rule.items():
+            clash_type = config.SINGBOX_TO_CLASH_MAP.get(rule_type)
+            if not clash_type:
+                continue
+            for value in (values if isinstance(values, list) else [values]):
+                cleaned_value = clean_comment(value)
 
-                                if clash_type == "IP-CIDR":
-                                    clash_rules.append(f"'{cleaned_value}'")
+                if clash_type == "IP-CIDR":
+                    clash_rules.append((cleaned_value, True))
 
-                                elif clash_type == "DOMAIN-SUFFIX":
-                                    # 添加 +. 前缀，确保同时匹配根域和子域
-                                    if cleaned_value.startswith('+'):
-                                        clash_rules.append(f"'{cleaned_value}'")
-                                    else:
-                                        domain_part = cleaned_value.lstrip('.')  # 去掉原有点
-                                        clash_rules.append(f"'+.{domain_part}'")
+                elif clash_type == "DOMAIN-SUFFIX":
+                    # 添加 +. 前缀，确保同时匹配根域和子域
+                    if cleaned_value.startswith('+'):
+                        clash_rules.append((cleaned_value, True))
+                    else:
+                        domain_part = cleaned_value.lstrip('.')  # 去掉原有点
+                        clash_rules.append((f"+.{domain_part}", True))
 
-                                elif clash_type in {"DOMAIN", "DOMAIN-KEYWORD", "DOMAIN-REGEX"}:
-                                    clash_rules.append(f"'{cleaned_value}'")
+                elif clash_type == "DOMAIN-KEYWORD":
+                    # domain behavior 的条目只能是域名或 +. 后缀，关键字无法表达，写成域名会变成精确匹配
+                    continue
 
-                                else:
-                                    clash_rules.append(f"{clash_type},{cleaned_value}")
+                elif clash_type in {"DOMAIN", "DOMAIN-REGEX"}:
+                    clash_rules.append((cleaned_value, True))
 
-                # 手动写入 YAML，避免 yaml.dump 额外加引号
-                with open(output_path, "w", encoding="utf-8") as f:
-                    f.write("payload:\n")
-                    for rule in clash_rules:
-                        f.write(f"  - {rule}\n")
+                else:
+                    clash_rules.append((f"{clash_type},{cleaned_value}", False))
 
-            except Exception as e:
-                logging.error(f"转换 {input_path} 到 Clash 规则时出错：{e}")
+    return clash_rules
 
 
-def clean_comment(value):
-    """ 去除规则中的注释内容（如果有）"""
-    return value.split("#")[0].strip()
+def render_clash_rules(rules, payload=None):
+    """ 将 sing-box 规则列表渲染为 Clash payload YAML，手动拼接以避免 yaml.dump 额外加引号 """
+    payload = clash_payload(rules) if payload is None else payload
+    return "payload:\n" + ''.join(
+        f"  - '{value}'\n" if quoted else f"  - {value}\n" for value, quoted in payload
+    )
 
 
-def convert_yaml_to_mrs(output_directory):
+def drop_keyword_covered(rules, label="domain_keyword 覆盖"):
     """
-    遍历指定目录下的 YAML 文件：
-    - geosite 开头的文件使用 `mihomo convert-ruleset domain yaml`
-    - geoip 开头的文件使用 `mihomo convert-ruleset ipcidr yaml`
-    生成对应的 .mrs 规则文件
+    返回剔除了包含任意 domain_keyword 的 domain 与 domain_suffix 之后的规则列表，不修改 rules。
+    只用于可以表达 DOMAIN-KEYWORD 的目标 (sing-box、Surge)，Clash payload 使用未剔除的规则。
     """
-    yaml_files = [f for f in os.listdir(output_directory) if f.endswith('.yaml')]
-
-    for yaml_file in yaml_files:
-        yaml_file_path = os.path.join(output_directory, yaml_file)
-        mrs_path = yaml_file_path.replace(".yaml", ".mrs")
-
-        try:
-            if yaml_file.startswith("geosite"):
-                command = f"mihomo convert-ruleset domain yaml {yaml_file_path} {mrs_path}"
-            elif yaml_file.startswith("geoip"):
-                command = f"mihomo convert-ruleset ipcidr yaml {yaml_file_path} {mrs_path}"
-            else:
-                continue  # 跳过不符合规则的文件
-
-            os.system(command)
-            logging.info(f"成功生成 MRS 文件: {mrs_path}")
-
-        except Exception as e:
-            logging.error(f"转换 {yaml_file_path} 到 MRS 文件时出错：{e}")
-
-
-def convert_adguard_to_clash(input_path, rule_set_name):
+    automaton = KeywordAutomaton(value for rule in rules for value in rule.get("domain_keyword", ()))
+    if not len(automaton):
+        return rules
+    removed = {"domain": 0, "domain_suffix": 0}
+    pruned = []
+    for rule in rules:
+        rule = dict(rule)
+        for category in removed:
+            if isinstance(rule.get(category), list):
+                covered = set(automaton.covered(rule[category]))
+                if covered:
+                    rule[category] = [value for value in rule[category] if value not in covered]
+                    removed[category] += len(covered)
+        pruned.append(rule)
+    log_keyword_pruning(removed, automaton, label)
+    return pruned
+
+
+def emit_rule_set(json_path, rules, payload=None):
     """
-    读取 AdGuard 规则文件，并转换为 Clash 规则格式。
+    由内存中的规则集一次性生成全部目标格式：sing-box JSON、Surge、Shadowrocket (硬链接 Surge 产物) 与 Clash YAML。
+    payload 为 Clash payload 条目，默认由 rules 生成。返回 payload，供生成 MRS 时复用。
     """
-
-    # 固定输出目录
-    clash_output_dir = config.clash_output_directory
-
-    os.makedirs(clash_output_dir, exist_ok=True)
-    # 生成输出文件名
-    output_filename = f"{rule_set_name}.yaml"
-    output_path = os.path.join(clash_output_dir, output_filename)
-
+    name = os.path.basename(json_path)[:-len('.json')]
+    surge_path = os.path.join(config.surge_output_directory, f"{name}.list")
+    shadowrocket_path = os.path.join(config.shadowrocket_output_directory, f"{name}.list")
+    clash_path = os.path.join(config.clash_output_directory, f"{name}.yaml")
+    for directory in (os.path.dirname(json_path), config.surge_output_directory,
+                      config.shadowrocket_output_directory, config.clash_output_directory):
+        os.makedirs(directory, exist_ok=True)
+
+    payload = clash_payload(rules) if payload is None else payload
     try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            adguard_rules = f.readlines()
-
-        clash_rules = []
-        for rule in adguard_rules:
-            rule = rule.strip()
-            if rule.startswith("||"):  # 处理 AdGuard DOMAIN-SUFFIX 规则
-                domain = rule[2:].split("^")[0]
-                clash_rules.append(f"- DOMAIN-SUFFIX, {domain}")
-            elif rule.startswith("|"):  # 处理 AdGuard DOMAIN 规则
-                domain = rule[1:].split("^")[0]
-                clash_rules.append(f"- DOMAIN, {domain}")
-            elif rule.startswith("@@||"):  # 处理 AdGuard 允许规则
-                domain = rule[4:].split("^")[0]
-                clash_rules.append(f"- DOMAIN, {domain}, REJECT")
-            elif rule.startswith("/") and rule.endswith("/"):  # 处理 AdGuard 正则规则
-                regex = rule[1:-1]
-                clash_rules.append(f"- DOMAIN-REGEX, {regex}")
-            elif re.match(r"^\d+\.\d+\.\d+\.\d+", rule):  # 处理 IP 规则
-                clash_rules.append(f"- IP-CIDR, {rule}")
-
-        clash_config = {
-            "payload": clash_rules
-        }
+        write_text(json_path, dumps_rule_set({"version": 1, "rules": rules}))
+        write_text(surge_path, render_surge_rules(rules))
+        link_or_copy(surge_path, shadowrocket_path)
+        write_text(clash_path, render_clash_rules(rules, payload))
+        logging.info(f"生成完成: {json_path} → {surge_path}, {shadowrocket_path}, {clash_path}")
+    except Exception as e:
+        logging.error(f"生成 {name} 的规则文件时出错: {e}")
+    return payload
 
-        with open(output_path, "w", encoding="utf-8") as f:
-            yaml.dump(clash_config, f, allow_unicode=True, default_flow_style=False)
 
-    except Exception as e:
-        logging.error(f"转换 {input_path} 到 Clash 规则时出错：{e}")
+def mrs_behavior(filename):
+    """ geosite 规则集按 domain、geoip 规则集按 ipcidr 转换为 MRS，其他规则集不转换 """
+    if filename.startswith("geosite"):
+        return "domain"
+    if filename.startswith("geoip"):
+        return "ipcidr"
+    return None